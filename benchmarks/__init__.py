@@ -0,0 +1,11 @@
+"""Benchmarks for the decode, state update and callback hot paths.
+
+Run from the repository root, in an environment with Home Assistant and the
+integration requirements installed:
+
+    python -m benchmarks --devices 1000 --messages 5
+
+Sustained load at fixed rates, for sizing (see benchmarks/load.py):
+
+    python -m benchmarks.load --devices 2000 --rate 1000,5000 --duration 10
+"""
@@ -0,0 +1,805 @@
+"""Run the benchmark suite.
+
+Stages:
+  decode   decode_mqqt_message.decode on the reference corpus and on
+           synthetic traffic, with the full decode and the old if/elif
+           parser for comparison
+  update   Qingping.update_from_mqtt for already decoded messages
+  fan-out  Qingping.async_publish with the sensor entities registered,
+           all of them and only the ones update_from_mqtt reported changed
+  hub      Hub.parse_message end to end (decode, update, fan-out), and
+           the same messages pushed through the shared connection and the
+           receive queue
+  metrics  the hub stages again with the metrics option on
+  dedup    the same messages twice through parse_message, the second
+           time every frame is a duplicate and dropped
+  capture  the queue path while every frame is captured, read back after
+  shared   two entries on one broker splitting the devices by filter
+  restart  entry reloaded with the device cache: devices, entities and
+           states available before any message
+  onboarding  500 to 5000 new devices through the queue, cost of the
+           first and the last 100
+  storm    every device reporting twice right after a reconnect, state
+           writes per 50 ms with and without a fleet-wide write budget
+  deadband realtime reports jittering around a steady value, state writes
+           with and without deadbands
+  availability  frames of 1000 to 100000 devices through the staleness
+           tracker and through one rescheduled loop timer per device,
+           and the sweep that marks all of them unavailable
+  history  history uploads into HistoryImporter, overlapping by one hour,
+           and the long-term statistics rows they turn into
+  history log  weeks of hourly history uploads appended to the on-disk
+           logs, and one day queries by binary search over the mapped file
+           and by reading the whole file
+  offload  (--offload) replay through Hub.parse_message with decoding
+           inline, in a thread pool and in a process pool, reporting how
+           long the event loop was blocked
+
+For each stage: messages/sec, p50/p99 latency per message, and bytes
+allocated (peak) and kept per message measured in a separate tracemalloc pass.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from . import corpus, synthetic
+from .fakes import FakeHass, FakeMessage, flush_writes, patched_ha, platform_of, setup_hub
+from .legacy import parse_data_legacy
+
+from custom_components.qingping_mqtt_parser import (
+    availability,
+    capture,
+    const,
+    decode_mqqt_message,
+    dedup,
+    history_import,
+    history_log,
+)
+
+
+class Result:
+    "Latencies and allocations for one stage."
+
+    def __init__(self, name: str, latencies_ns, alloc_peak: float, alloc_kept: float, wall_ns=None) -> None:
+        self.name = name
+        self.wall_ns = wall_ns
+        self.latencies_ns = sorted(latencies_ns)
+        self.alloc_peak = alloc_peak
+        self.alloc_kept = alloc_kept
+
+    def percentile(self, p: float) -> float:
+        lat = self.latencies_ns
+        return lat[min(len(lat) - 1, int(len(lat) * p / 100))] / 1000
+
+    def row(self) -> str:
+        total = (self.wall_ns if self.wall_ns is not None else sum(self.latencies_ns)) / 1e9
+        rate = len(self.latencies_ns) / total if total else 0
+        return (
+            f"{self.name:<38} {len(self.latencies_ns):>8} {rate:>12,.0f} "
+            f"{self.percentile(50):>9.1f} {self.percentile(99):>9.1f} "
+            f"{self.alloc_peak:>10,.0f} {self.alloc_kept:>9,.0f}"
+        )
+
+
+HEADER = (
+    f"{'stage':<38} {'msgs':>8} {'msgs/sec':>12} {'p50 us':>9} {'p99 us':>9} "
+    f"{'alloc B':>10} {'kept B':>9}"
+)
+
+
+def measure_allocations(func, items, limit: int = 2000):
+    "Mean peak and kept bytes per call of func(item)."
+    items = items[:limit]
+    if not items:
+        return 0.0, 0.0
+    keep = []
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        start = tracemalloc.get_traced_memory()[0]
+        for item in items:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            keep.append(func(item))
+            peak_total += tracemalloc.get_traced_memory()[1] - before
+        kept = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return peak_total / len(items), kept / len(items)
+
+
+async def measure_allocations_async(func, items, limit: int = 2000):
+    "measure_allocations for coroutine functions."
+    items = items[:limit]
+    if not items:
+        return 0.0, 0.0
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        start = tracemalloc.get_traced_memory()[0]
+        for item in items:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await func(item)
+            peak_total += tracemalloc.get_traced_memory()[1] - before
+        kept = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return peak_total / len(items), kept / len(items)
+
+
+def timed(func, items):
+    lat = []
+    clock = time.perf_counter_ns
+    for item in items:
+        t = clock()
+        func(item)
+        lat.append(clock() - t)
+    return lat
+
+
+async def timed_async(func, items):
+    lat = []
+    clock = time.perf_counter_ns
+    for item in items:
+        t = clock()
+        await func(item)
+        lat.append(clock() - t)
+    return lat
+
+
+def bench_decode(messages, repeat: int):
+    "decode() per corpus frame type and on the synthetic stream."
+    results = []
+    for name, payload in corpus.CORPUS.items():
+        items = [FakeMessage("qingping/582D34000000/up", payload)] * repeat
+        dec = lambda m: decode_mqqt_message.decode(m.topic, m.payload)
+        full = lambda m: decode_mqqt_message.decode(m.topic, m.payload)["data"].as_dict()
+        results.append(Result(f"decode {name}", timed(dec, items), *measure_allocations(dec, items)))
+        results.append(Result("  + full decode", timed(full, items), *measure_allocations(full, items)))
+        legacy = lambda m: parse_data_legacy(m.payload)
+        results.append(Result("  parse_data_legacy", timed(legacy, items), *measure_allocations(legacy, items)))
+
+    dec = lambda m: decode_mqqt_message.decode(m.topic, m.payload)
+    results.append(Result("decode synthetic mix", timed(dec, messages), *measure_allocations(dec, messages)))
+    return results
+
+
+async def bench_restart(devices: int, messages) -> None:
+    hass, hub = await setup_hub(devices)
+    for m in messages:
+        await hub.parse_message(m)
+    await hub.task_stop()
+    size = len(json.dumps(hass.storage))
+
+    platform = platform_of(hass)
+    platform.entities.clear()
+    start = time.perf_counter()
+    _, hub = await setup_hub(0, hass=hass)
+    elapsed = time.perf_counter() - start
+
+    with_state = sum(1 for e in platform.entities if e.state is not None)
+    print(
+        f"\nrestart from cache ({size / 1024:,.0f} KiB): {len(hub.devices)} devices, {len(platform.entities)} entities, "
+        f"{with_state} with a state, before any message, in {elapsed * 1000:.0f} ms"
+    )
+    await hub.task_stop()
+    await hass.async_stop()
+
+
+async def bench_onboarding(sizes=(500, 1000, 2000, 5000), chunk: int = 100) -> None:
+    """Cost per new device while N devices show up for the first time.
+
+    Messages go through the connection and the receive queue, so new devices
+    spread over many loop iterations like on a real broker. Adding the
+    entities of a device must not depend on how many devices are already
+    known: the first and the last chunk of devices cost the same.
+    """
+    print(f"\nonboarding   devices  us/device  first {chunk}  last {chunk}  add_entities calls  entities")
+    for devices in sizes:
+        hass, hub = await setup_hub(0)
+        onboarding = [FakeMessage(t, p) for t, p in synthetic.onboarding(devices)]
+        per_chunk = []
+        for n in range(0, devices, chunk):
+            start = time.perf_counter()
+            for m in onboarding[n:n + chunk]:
+                await hub.connection.dispatch(m)
+            await hub.queue.join()
+            await hass.async_block_till_done()
+            per_chunk.append((time.perf_counter() - start) / len(onboarding[n:n + chunk]))
+
+        platform = platform_of(hass)
+        print(
+            f"           {devices:>8} {sum(per_chunk) / len(per_chunk) * 1e6:>10.1f} "
+            f"{per_chunk[0] * 1e6:>10.1f} {per_chunk[-1] * 1e6:>9.1f} "
+            f"{platform.add_calls:>19} {len(platform.entities):>9}"
+        )
+        await hub.task_stop()
+        await hass.async_stop()
+
+
+async def bench_shared(devices: int, messages) -> Result:
+    """Entry a lists the first half of the devices, entry b takes the rest.
+
+    Every message has to be decoded exactly once, by the Hub owning it.
+    """
+    hass = FakeHass()
+    first = ", ".join(synthetic.device_addr(n) for n in range(devices // 2))
+    _, hub_a = await setup_hub(0, {const.CONF_DEVICE_FILTER: first}, hass, "a")
+    _, hub_b = await setup_hub(0, None, hass, "b")
+
+    onboarding = [FakeMessage(t, p) for t, p in synthetic.onboarding(devices)]
+    for m in onboarding:
+        await hub_a.connection.dispatch(m)
+    await hub_a.queue.join()
+    await hub_b.queue.join()
+
+    start = time.perf_counter_ns()
+    lat = await timed_async(hub_a.connection.dispatch, messages)
+    await hub_a.queue.join()
+    await hub_b.queue.join()
+    wall = time.perf_counter_ns() - start
+
+    decodes = sum(h.decoder.inline + h.decoder.offloaded for h in (hub_a, hub_b))
+    print(
+        f"\nshared connection: {len(hass.data[const.DOMAIN]['connections'])} connection(s) for 2 entries, "
+        f"devices a {len(hub_a.devices)} / b {len(hub_b.devices)}, "
+        f"{decodes / (len(messages) + len(onboarding)):.2f} decodes per message"
+    )
+    for hub in (hub_a, hub_b):
+        flush_writes(hub)
+        await hub.task_stop()
+    await hass.async_stop()
+    return Result("shared connection dispatch", lat, 0, 0, wall)
+
+
+def forget_samples(hub) -> None:
+    "Replays of the same messages are duplicates, start over so they are handled again."
+    if hub.dedup is not None:
+        hub.dedup = dedup.DedupIndex()
+
+
+async def bench_hub(devices: int, messages):
+    results = []
+    hass, hub = await setup_hub(devices)
+    platform = platform_of(hass)
+    print(f"onboarded {len(hub.devices)} devices, {len(platform.entities)} entities")
+
+    decoded = [(hub.devices.get(r["addr"]), r) for r in (decode_mqqt_message.decode(m.topic, m.payload) for m in messages)]
+
+    def update(item):
+        qp, r = item
+        qp.update_from_mqtt(r["data"])
+        return qp
+
+    results.append(Result("update update_from_mqtt", timed(update, decoded), *measure_allocations(update, decoded)))
+
+    def fanout(item):
+        qp, _ = item
+        qp.async_publish()
+
+    writes = platform.writes
+    lat = timed(fanout, decoded)
+    per_msg = (platform.writes - writes) / max(len(decoded), 1)
+    results.append(Result(f"fan-out async_publish ({per_msg:.1f} writes)", lat, *measure_allocations(fanout, decoded)))
+
+    # the decoded messages again, changed sensors only
+    changes = [(qp, qp.update_from_mqtt(r["data"])) for qp, r in decoded]
+
+    def fanout_changed(item):
+        qp, changed = item
+        qp.async_publish(changed)
+
+    writes = platform.writes
+    lat = timed(fanout_changed, changes)
+    per_msg = (platform.writes - writes) / max(len(changes), 1)
+    results.append(Result(f"fan-out changed only ({per_msg:.1f} writes)", lat, *measure_allocations(fanout_changed, changes)))
+
+    writes = platform.writes
+    forget_samples(hub)
+    lat = await timed_async(hub.parse_message, messages)
+    flush_writes(hub)
+    per_msg = (platform.writes - writes) / max(len(messages), 1)
+    forget_samples(hub)
+    allocations = await measure_allocations_async(hub.parse_message, messages)
+    flush_writes(hub)
+    results.append(Result(f"hub parse_message ({per_msg:.1f} writes)", lat, *allocations))
+
+    # receive -> queue -> workers, latency is time in queue plus processing
+    queued = {}
+    done = {}
+    handler = hub.queue._handler
+
+    async def track(message):
+        await handler(message)
+        done[id(message)] = time.perf_counter_ns()
+
+    hub.queue._handler = track
+    forget_samples(hub)
+    start = time.perf_counter_ns()
+    for m in messages:
+        queued[id(m)] = time.perf_counter_ns()
+        await hub.connection.dispatch(m)
+    await hub.queue.join()
+    wall = time.perf_counter_ns() - start
+    hub.queue._handler = handler
+
+    stats = hub.queue_stats
+    dropped = stats["dropped_oldest"] + stats["dropped_newest"]
+    lat = [done[k] - queued[k] for k in done]
+    results.append(Result(f"hub via connection+queue (dropped {dropped})", lat, 0, 0, wall))
+
+    flush_writes(hub)
+    status_size(hub, platform)
+    await hub.queue.stop()
+    await hass.async_stop()
+    return results
+
+
+async def bench_metrics(devices: int, messages):
+    """parse_message and the queue path with the metrics option on.
+
+    Compare with the "hub parse_message" and "hub via connection+queue"
+    rows, the difference is the cost of measuring.
+    """
+    results = []
+    hass, hub = await setup_hub(devices, {const.CONF_METRICS: True})
+    platform = platform_of(hass)
+
+    forget_samples(hub)
+    lat = await timed_async(hub.parse_message, messages)
+    flush_writes(hub)
+    forget_samples(hub)
+    results.append(Result("hub parse_message, metrics on", lat, *await measure_allocations_async(hub.parse_message, messages)))
+    flush_writes(hub)
+
+    forget_samples(hub)
+    start = time.perf_counter_ns()
+    lat = await timed_async(hub.connection.dispatch, messages)
+    await hub.queue.join()
+    wall = time.perf_counter_ns() - start
+    flush_writes(hub)
+    results.append(Result("hub via connection+queue, metrics on", lat, 0, 0, wall))
+
+    hub.metrics.sample()
+    stats = hub.metrics_stats
+    sensors = [e for e in platform.entities if not hasattr(e, "sensor_name")]
+    print(f"\nmetrics: {len(sensors)} hub sensors, {stats['messages']} frames, errors {stats['errors']}, "
+          f"unknown keys {stats['unknown_keys']}")
+    for stage, h in stats["stages"].items():
+        print(f"  {stage:<15} count {h['count']:>6}  p50 {h['p50_ms']} ms  p99 {h['p99_ms']} ms  max {h['max_ms']} ms")
+
+    await hub.task_stop()
+    await hass.async_stop()
+    return results
+
+
+async def bench_dedup(devices: int, messages):
+    """parse_message with every frame new, then the same frames again.
+
+    The second pass is what QoS redeliveries and retained messages cost:
+    the frame header is read and the frame dropped.
+    """
+    results = []
+    hass, hub = await setup_hub(devices)
+    platform = platform_of(hass)
+
+    forget_samples(hub)
+    lat = await timed_async(hub.parse_message, messages)
+    flush_writes(hub)
+    results.append(Result("hub parse_message, new samples", lat, 0, 0))
+
+    writes = platform.writes
+    lat = await timed_async(hub.parse_message, messages)
+    flush_writes(hub)
+    results.append(Result(f"hub parse_message, dups ({platform.writes - writes} writes)", lat,
+                          *await measure_allocations_async(hub.parse_message, messages)))
+
+    stats = hub.dedup_stats
+    print(f"\ndedup: {stats['checked']} frames checked, {stats['dropped']} dropped (hit rate {stats['hit_rate']:.1%}), "
+          f"{stats['records_seen']} of {stats['records']} history records seen before, "
+          f"{stats['records_realtime']} also sent as realtime")
+
+    await hub.task_stop()
+    await hass.async_stop()
+    return results
+
+
+async def bench_capture(devices: int, messages) -> Result:
+    "The queue path while every frame is captured, then read back."
+    hass, hub = await setup_hub(devices)
+    for name in capture.capture_files(hub.capture_path):
+        os.remove(name)
+    await hub.async_start_capture()
+
+    start = time.perf_counter_ns()
+    lat = await timed_async(hub.connection.dispatch, messages)
+    await hub.queue.join()
+    wall = time.perf_counter_ns() - start
+
+    await hub.async_stop_capture()
+    read = [r for name in capture.capture_files(hub.capture_path) for r in capture.read_capture(name)]
+    same = sum(1 for (_, topic, payload), m in zip(read, messages) if topic == str(m.topic) and payload == m.payload)
+    size = sum(os.path.getsize(name) for name in capture.capture_files(hub.capture_path))
+    print(f"\ncapture: {len(read)} of {len(messages)} frames read back ({same} identical), {size / 1024:,.0f} KiB")
+
+    flush_writes(hub)
+    await hub.task_stop()
+    await hass.async_stop()
+    return Result("hub via connection+queue, capturing", lat, 0, 0, wall)
+
+
+def status_size(hub, platform) -> None:
+    "Mean JSON size of the status entity attributes, the part the recorder stores per state."
+    status = [e for e in platform.entities if getattr(e, "sensor_name", None) == "status"]
+    if not status:
+        return
+    mode = hub.status_attributes
+    for hub.status_attributes in const.STATUS_ATTRIBUTES_MODES:
+        for qp in hub.devices.values():
+            qp._status_attributes = None
+        size = sum(len(json.dumps(e.extra_state_attributes, default=str)) for e in status) / len(status)
+        print(f"status attributes {hub.status_attributes}: {size:,.0f} bytes of JSON per write")
+    hub.status_attributes = mode
+
+
+async def storm(devices: int, messages, budget: int, sample: float = 0.05):
+    """messages through parse_message at once, then sample the write count
+    until nothing is pending.
+
+    Returns the Hub write stats, writes per sample and seconds to drain.
+    """
+    hass, hub = await setup_hub(devices, {const.CONF_WRITE_BUDGET: budget})
+    platform = platform_of(hass)
+
+    start = time.perf_counter()
+    for m in messages:
+        await hub.parse_message(m)
+
+    samples = []
+    writes = platform.writes
+    while hub.writer.pending:
+        await asyncio.sleep(sample)
+        samples.append(platform.writes - writes)
+        writes = platform.writes
+    drained = time.perf_counter() - start
+
+    stats = hub.write_stats
+    await hub.queue.stop()
+    await hass.async_stop()
+    return stats, samples, drained
+
+
+async def bench_storm(devices: int, seed: int, budgets=(0, 2000, 500)) -> None:
+    # two realtime reports per device back to back
+    burst = [
+        FakeMessage(t, p)
+        for t, p in synthetic.messages(devices, 2, seed, mix=(("realtime", 1.0),))
+    ]
+    print(f"\nreconnect storm, {len(burst)} realtime messages from {devices} devices")
+    print(f"{'budget/s':>9} {'written':>8} {'coalesced':>10} {'deferred':>9} {'flushes':>8} {'max per 50ms':>13} {'writes/s':>9} {'drain ms':>9}")
+    with patched_ha():
+        for budget in budgets:
+            stats, samples, drained = await storm(devices, burst, budget)
+            print(
+                f"{budget or 'off':>9} {stats['written']:>8} {stats['coalesced']:>10} {stats['deferred']:>9} "
+                f"{stats['flushes']:>8} {max(samples, default=0):>13} {stats['written'] / drained:>9,.0f} {drained * 1000:>9.0f}"
+            )
+
+
+def jitter(devices: int, rounds: int, seed: int):
+    "Realtime reports of steady rooms: 0.1 °C, 0.3 %RH and 5 ppm of jitter around each device's value."
+    rnd = random.Random(seed)
+    base = [(20 + rnd.random() * 5, 35 + rnd.random() * 20, rnd.randrange(400, 1500)) for _ in range(devices)]
+    for r in range(rounds):
+        ts = corpus.TIMESTAMP + r * 60
+        for n, (t, h, c) in enumerate(base):
+            payload = corpus.realtime(0x34, ts, round(t + rnd.choice((-0.1, 0, 0.1)), 1),
+                                      round(h + rnd.choice((-0.3, 0, 0.3)), 1), c + rnd.randrange(-5, 6), 80)
+            yield FakeMessage(synthetic.topic(synthetic.device_addr(n)), payload)
+
+
+async def bench_deadband(devices: int, seed: int, rounds: int = 10) -> None:
+    reports = list(jitter(devices, rounds, seed))
+    print(f"\ndeadband, {len(reports)} realtime reports from {devices} devices jittering around steady values")
+    print(f"{'deadbands':>36} {'writes':>8} {'per report':>11} {'filtered':>9} {'heartbeat':>10}")
+    settings = (
+        {},
+        {const.CONF_DEADBAND_TEMPERATURE: "0.2", const.CONF_DEADBAND_HUMIDITY: "1", const.CONF_DEADBAND_CO2: "10"},
+        {const.CONF_DEADBAND_TEMPERATURE: "1%", const.CONF_DEADBAND_HUMIDITY: "2%", const.CONF_DEADBAND_CO2: "2%"},
+    )
+    with patched_ha():
+        for options in settings:
+            hass, hub = await setup_hub(devices, {const.CONF_WRITE_WINDOW: 0, **options})
+            platform = platform_of(hass)
+            writes = platform.writes
+            for n, m in enumerate(reports):
+                await hub.parse_message(m)
+                if n % devices == devices - 1:
+                    # a round is a minute apart, its writes are out before the next
+                    flush_writes(hub)
+            counters = (hub.deadband_stats or {}).get("sensors", {}).values()
+            name = ", ".join(f"{k.removeprefix('deadband_')} {v}" for k, v in options.items()) or "off"
+            print(
+                f"{name:>36} {platform.writes - writes:>8} {(platform.writes - writes) / len(reports):>11.2f} "
+                f"{sum(c['filtered'] for c in counters):>9} {sum(c['heartbeat'] for c in counters):>10}"
+            )
+            await hub.task_stop()
+            await hass.async_stop()
+
+
+async def bench_availability(sizes=(1000, 10000, 100000), rounds: int = 5) -> None:
+    """Cost per frame of keeping devices' staleness deadlines: the tracker
+    only moves a deadline, per-device timers cancel and reschedule a loop
+    timer (and leave the cancelled one in the loop's heap)."""
+    loop = asyncio.get_running_loop()
+    print("\navailability, cost per frame of rounds of frames from every device, sweep of all devices going stale")
+    print(f"{'devices':>8} {'tracker ns':>11} {'timers ns':>10} {'sweep ms':>9} {'unavailable':>12} {'heap':>8}")
+    for size in sizes:
+        devices = [SimpleNamespace(addr=synthetic.device_addr(n), available=True, upload_interval=None) for n in range(size)]
+        changed = []
+        tracker = availability.AvailabilityTracker(loop, changed.append)
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            for d in devices:
+                tracker.seen(d)
+        per_tracker = (time.perf_counter_ns() - start) / (size * rounds)
+
+        timers = {}
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            for d in devices:
+                handle = timers.get(d.addr)
+                if handle is not None:
+                    handle.cancel()
+                timers[d.addr] = loop.call_at(loop.time() + 10800, changed.append, d)
+        per_timer = (time.perf_counter_ns() - start) / (size * rounds)
+        for handle in timers.values():
+            handle.cancel()
+
+        # every deadline passed: one sweep marks the whole fleet unavailable
+        tracker.cancel()
+        stale = availability.AvailabilityTracker(loop, changed.append)
+        for d in devices:
+            stale.restore(d, 10**6)
+        stale.cancel()
+        start = time.perf_counter_ns()
+        stale._sweep()
+        sweep = (time.perf_counter_ns() - start) / 1e6
+        stale.cancel()
+        print(
+            f"{size:>8} {per_tracker:>11.0f} {per_timer:>10.0f} {sweep:>9.1f} "
+            f"{stale.unavailable:>12} {tracker.stats()['heap']:>8}"
+        )
+
+
+async def loop_lag(interval: float, lags: list) -> None:
+    "Append how late each wake-up of a periodic timer is, in seconds."
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - t - interval))
+
+
+async def replay_offload(mode: str, threshold: int, devices: int, messages, rate: int):
+    """Messages arriving at rate/sec through the connection and receive queue
+    of a Hub with the devices onboarded, so Hub.parse_message handles them.
+
+    Returns wall seconds, CPU seconds spent on the event loop thread, timer
+    lags and the offloader counters.
+    """
+    hass, hub = await setup_hub(devices, {
+        const.CONF_DECODE_OFFLOAD: mode,
+        const.CONF_DECODE_OFFLOAD_THRESHOLD: threshold,
+    })
+    decoder = hub.decoder
+
+    # start the pool workers (process workers import the integration) outside
+    # the measurement, more than one batch so every worker gets started
+    large = [m for m in messages if len(m.payload) >= threshold][:decode_mqqt_message.MAX_BATCH * 4]
+    await asyncio.gather(*(decoder.decode(m.topic, m.payload) for m in large))
+    decoder.offloaded = decoder.batches = decoder.inline = 0
+
+    lags = []
+    monitor = asyncio.create_task(loop_lag(0.001, lags))
+    await asyncio.sleep(0.01)
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    cpu = time.thread_time()
+    t0 = loop.time()
+    for n, m in enumerate(messages):
+        delay = t0 + n / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await hub.connection.dispatch(m)
+    await hub.queue.join()
+    flush_writes(hub)
+    cpu = time.thread_time() - cpu
+    wall = time.perf_counter() - start
+
+    monitor.cancel()
+    stats = decoder.stats()
+    await hub.task_stop()
+    await hass.async_stop()
+    return wall, cpu, lags, stats
+
+
+async def bench_offload(devices: int, messages, threshold: int, rate: int, runs: int = 3) -> None:
+    "Median of runs replays per mode."
+    print(f"offload replay at {rate} msgs/sec, threshold {threshold} bytes, loop lag from a 1 ms timer, median of {runs}")
+    print(
+        f"{'mode':<10} {'wall ms':>8} {'loop cpu ms':>12} {'lag total ms':>13} {'lag p99 ms':>11} "
+        f"{'lag max ms':>11} {'offloaded':>10} {'batches':>8}"
+    )
+    for mode in const.OFFLOAD_MODES:
+        rows = []
+        for _ in range(runs):
+            wall, cpu, lags, stats = await replay_offload(mode, threshold, devices, messages, rate)
+            lags.sort()
+            p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+            rows.append((wall, cpu, sum(lags), p99, max(lags, default=0.0)))
+        wall, cpu, total, p99, worst = (sorted(col)[len(col) // 2] for col in zip(*rows))
+        print(
+            f"{mode:<10} {wall * 1000:>8.0f} {cpu * 1000:>12.1f} {total * 1000:>13.1f} {p99 * 1000:>11.2f} "
+            f"{worst * 1000:>11.2f} {stats['offloaded']:>10} {stats['batches']:>8}"
+        )
+
+
+async def bench_history(devices: int, hours: int = 6) -> Result:
+    """Each device uploads every hour the records of the last two hours
+    (8 records, 15 min apart), like a device that missed an upload."""
+    hass = FakeHass()
+    importer = history_import.HistoryImporter(hass)
+    rows = []
+
+    def add_statistics(hass, metadata, statistics):
+        rows.extend(statistics)
+
+    uploads = []
+    for h in range(hours):
+        ts = corpus.TIMESTAMP + (h - 1) * 3600
+        for n in range(devices):
+            payload = corpus.history(0x31, ts, 8, 900)
+            uploads.append((synthetic.device_addr(n), decode_mqqt_message.decode(synthetic.topic("x"), payload)["data"]))
+
+    def add(item):
+        addr, frame = item
+        importer.add(addr, frame.history_columns())
+
+    with patch.object(history_import, "async_add_external_statistics", add_statistics):
+        lat = timed(add, uploads)
+        start = time.perf_counter_ns()
+        importer.flush()
+        flush_ns = time.perf_counter_ns() - start
+
+    stats = importer.stats()
+    print(
+        f"\nhistory import, {len(uploads)} uploads from {devices} devices: {stats['records']} records kept, "
+        f"{stats['duplicates']} duplicates, {stats['calls']} import calls, {len(rows)} statistics rows, "
+        f"flush {flush_ns / 1e6:.1f} ms"
+    )
+    return Result("history HistoryImporter.add", lat, 0, 0)
+
+
+def scan_log(path: str, start: int, end: int) -> list[dict]:
+    "A query without the index: read the whole log, keep the records in range."
+    with open(path, "rb") as f:
+        data = f.read()[len(history_log.MAGIC):]
+    return [
+        history_log.decode_record(*record)
+        for record in history_log.RECORD.iter_unpack(data[:len(data) - len(data) % history_log.RECORD.size])
+        if start <= record[0] <= end
+    ]
+
+
+async def bench_history_log(devices: int = 100, weeks=(1, 4, 26), queries: int = 200) -> None:
+    """Hourly uploads of 4 records, 15 min apart, appended to the logs of
+    devices, then one day range queries at random positions."""
+    loop = asyncio.get_running_loop()
+    rng = random.Random(1)
+    print("\nhistory log, hourly uploads appended, one day queries at random positions")
+    print(
+        f"{'weeks':>6} {'records':>9} {'file KB':>8} {'append us/upload':>17} "
+        f"{'query us':>9} {'scan us':>9} {'samples':>8}"
+    )
+    for w in weeks:
+        hours = w * 7 * 24
+        with tempfile.TemporaryDirectory() as directory:
+            log = history_log.HistoryLog(loop, directory, retention=10 * 365 * 86400, max_bytes=1 << 30)
+            addrs = [synthetic.device_addr(n) for n in range(devices)]
+            first = int(time.time()) - hours * 3600
+            block = struct.Struct("<IH")
+            start = time.perf_counter_ns()
+            for h in range(hours):
+                ts = first + h * 3600
+                # what Hub.parse_message buffers between two flushes
+                batch = [(addr, block.pack(ts, 900) + bytes(range(24))) for addr in addrs]
+                log._write(batch)
+            append = (time.perf_counter_ns() - start) / (hours * devices) / 1000
+
+            query_ns, scan_ns, found = [], [], 0
+            for _ in range(queries):
+                addr = rng.choice(addrs)
+                lo = first + rng.randrange(max(1, hours - 24)) * 3600
+                t = time.perf_counter_ns()
+                samples, _ = log._query(addr, lo, lo + 86400)
+                query_ns.append(time.perf_counter_ns() - t)
+                t = time.perf_counter_ns()
+                scanned = scan_log(log.path(addr), lo, lo + 86400)
+                scan_ns.append(time.perf_counter_ns() - t)
+                assert samples == scanned
+                found += len(samples)
+            size = os.path.getsize(log.path(addrs[0]))
+            await log.async_stop()
+        print(
+            f"{w:>6} {size // history_log.RECORD.size:>9} {size / 1024:>8.0f} {append:>17.1f} "
+            f"{sorted(query_ns)[queries // 2] / 1000:>9.0f} {sorted(scan_ns)[queries // 2] / 1000:>9.0f} "
+            f"{found // queries:>8}"
+        )
+
+
+async def main(args) -> None:
+    messages = [
+        FakeMessage(t, p)
+        for t, p in synthetic.messages(args.devices, args.messages, args.seed, history_records=args.history_records)
+    ]
+    print(f"{len(messages)} synthetic messages from {args.devices} devices\n")
+
+    if args.offload:
+        with patched_ha():
+            await bench_offload(args.devices, messages, args.threshold, args.rate)
+        return
+
+    results = bench_decode(messages, args.repeat)
+    if not args.decode_only:
+        with patched_ha():
+            results += await bench_hub(args.devices, messages)
+            results += await bench_metrics(args.devices, messages)
+            results += await bench_dedup(args.devices, messages)
+            results.append(await bench_capture(args.devices, messages))
+            results.append(await bench_shared(args.devices, messages))
+            await bench_restart(args.devices, messages)
+            await bench_onboarding()
+        results.append(await bench_history(args.devices))
+
+    print()
+    print(HEADER)
+    for r in results:
+        print(r.row())
+
+    if not args.decode_only:
+        await bench_storm(args.devices, args.seed)
+        await bench_deadband(args.devices, args.seed)
+        await bench_availability()
+        await bench_history_log()
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000, help="synthetic devices")
+    parser.add_argument("--messages", type=int, default=5, help="messages per device")
+    parser.add_argument("--repeat", type=int, default=5000, help="decodes per corpus frame")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--history-records", type=int, default=12, help="upper bound of records per history upload")
+    parser.add_argument("--decode-only", action="store_true", help="skip the Hub stages")
+    parser.add_argument("--offload", action="store_true", help="only run the decode offload replay")
+    parser.add_argument("--threshold", type=int, default=const.DEFAULT_DECODE_OFFLOAD_THRESHOLD,
+                        help="offload threshold in bytes for --offload")
+    parser.add_argument("--rate", type=int, default=5000, help="arrival rate in msgs/sec for --offload")
+    asyncio.run(main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    cli()
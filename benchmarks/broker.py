@@ -0,0 +1,92 @@
+"""In-process MQTT broker stand-in.
+
+Enough of a broker to put the transport layer into a load test: publishers
+hand frames to the broker, every matching subscription has an unbounded
+inbox (the socket buffer of a real client) and BrokerTransport reads it in
+its own task, like AiomqttTransport reads the aiomqtt client.
+"""
+from __future__ import annotations
+
+import asyncio
+
+from custom_components.qingping_mqtt_parser.transport import TOPIC, Transport
+
+from .fakes import FakeMessage
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    "MQTT wildcard match, + is one level, # the rest."
+    p = pattern.split("/")
+    t = topic.split("/")
+    for i, level in enumerate(p):
+        if level == "#":
+            return True
+        if i >= len(t) or (level != "+" and level != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+class FakeBroker:
+    "Topic routing without a network."
+
+    def __init__(self) -> None:
+        self._subscriptions: list[tuple[str, asyncio.Queue]] = []
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, pattern: str) -> asyncio.Queue:
+        "Inbox that receives every message matching pattern."
+        inbox = asyncio.Queue()
+        self._subscriptions.append((pattern, inbox))
+        return inbox
+
+    def unsubscribe(self, inbox: asyncio.Queue) -> None:
+        self._subscriptions = [(p, q) for p, q in self._subscriptions if q is not inbox]
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        "Deliver to every matching subscription, payload copied like off the wire."
+        self.published += 1
+        for pattern, inbox in self._subscriptions:
+            if topic_matches(pattern, topic):
+                inbox.put_nowait(FakeMessage(topic, bytes(payload)))
+                self.delivered += 1
+
+    @property
+    def backlog(self) -> int:
+        "Messages delivered to inboxes and not read yet."
+        return sum(inbox.qsize() for _, inbox in self._subscriptions)
+
+
+class BrokerTransport(Transport):
+    "Transport reading qingping/+/up from a FakeBroker."
+
+    name = "fake broker"
+
+    def __init__(self, broker: FakeBroker) -> None:
+        self._broker = broker
+        self._inbox = None
+        self._task = None
+
+    async def async_start(self, on_message, on_message_nowait) -> None:
+        self._inbox = self._broker.subscribe(TOPIC)
+        self._task = asyncio.get_running_loop().create_task(self._receive(on_message))
+
+    async def _receive(self, on_message) -> None:
+        inbox = self._inbox
+        while True:
+            await on_message(await inbox.get())
+
+    async def async_publish(self, topic: str, payload: bytes) -> None:
+        self._broker.publish(topic, payload)
+
+    async def async_stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inbox is not None:
+            self._broker.unsubscribe(self._inbox)
+            self._inbox = None
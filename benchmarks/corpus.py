@@ -0,0 +1,102 @@
+"""Reference frames, one per frame type the integration handles.
+
+Frames are built from field values with the same TLV layout devices use:
+'CG' + cmd byte + u16 payload length + TLV fields + u16 checksum.
+"""
+import struct
+
+TIMESTAMP = 1735689600
+
+
+def tlv(key: int, value: bytes) -> bytes:
+    "One key/length/value field."
+    return bytes([key]) + struct.pack("<H", len(value)) + value
+
+
+def frame(cmd: int, fields) -> bytes:
+    "Full frame from [(key, value), ...]."
+    body = b"".join(tlv(k, v) for k, v in fields)
+    head = b"CG" + bytes([cmd]) + struct.pack("<H", len(body))
+    data = head + body
+    return data + struct.pack("<H", sum(data) & 0xffff)
+
+
+def sensor_record(temperature: float, humidity: float, co2_ppm: int, battery: int) -> bytes:
+    "6 byte record as parse_real_sensor_data reads it."
+    combined = (round(temperature * 10) + 500) << 12 | round(humidity * 10)
+    return struct.pack("<I", combined)[:3] + struct.pack("<HB", co2_ppm, battery)
+
+
+def realtime(cmd=0x34, ts=TIMESTAMP, temperature=21.3, humidity=45.2, co2_ppm=612, battery=87, plugged=True,
+             firmware=None) -> bytes:
+    "CG4 / CGA event report, optionally with the firmware version a device sends after boot."
+    fields = [
+        (0x14, struct.pack("<I", ts) + sensor_record(temperature, humidity, co2_ppm, battery)),
+        (0x2c, bytes([plugged])),
+        (0x4a, b"\x00"),
+        (0x64, bytes([battery])),
+        (0x65, b"\x00\x3c"),
+    ]
+    if firmware is not None:
+        fields[1:1] = [(0x11, firmware), (0x22, b"1.0.0")]
+    return frame(cmd, fields)
+
+
+def history(cmd=0x31, ts=TIMESTAMP, records=4, interval=900, temperature=20.0, humidity=40.0, co2_ppm=500, battery=80) -> bytes:
+    "CG1 / CGB data upload with a 0x03 history block."
+    block = struct.pack("<IH", ts, interval) + b"".join(
+        sensor_record(temperature + x / 10, humidity + x / 5, co2_ppm + x, battery)
+        for x in range(records)
+    )
+    return frame(cmd, [(0x03, block), (0x64, bytes([battery])), (0x65, b"\x00\x3c")])
+
+
+def config_report(firmware=b"1.1.5_0256", hardware=b"1.0.0", fahrenheit=False) -> bytes:
+    "CG9 configuration report."
+    return frame(0x39, [
+        (0x04, b"\x3c"),
+        (0x05, b"\x84\x03"),
+        (0x19, b"\x01" if fahrenheit else b"\x00"),
+        (0x11, firmware),
+        (0x22, hardware),
+        (0x34, b"1.0.9"),
+        (0x35, b"0.9.3"),
+        (0x38, b"\x5d\x00"),
+        (0x3b, b"\x05"),
+        (0x3d, b"\x00"),
+        (0x3e, b"\x00"),
+        (0x40, b"\x01"),
+        (0x3f, b"\x00\x00"),
+        (0x45, b"\x0a\x00"),
+        (0x46, b"\x05\x00"),
+        (0x47, b"\x00\x00"),
+        (0x48, b"\x03\x00"),
+        (0x49, b"\x00\x00"),
+        (0x44, b"\x01"),
+        (0x1d, b"\x00"),
+        (0x15, struct.pack("<I", TIMESTAMP)),
+        (0x64, b"\x50"),
+        (0x65, b"\x00\x3c"),
+    ])
+
+
+def heartbeat(ts=TIMESTAMP) -> bytes:
+    "CG5 with product id and timestamp."
+    return frame(0x35, [(0x38, b"\x5d\x00"), (0x15, struct.pack("<I", ts)), (0x65, b"\x00\x3c")])
+
+
+def v2_realtime(ts=TIMESTAMP, temperature=21.5, humidity=45.2, co2_ppm=640, battery=80) -> bytes:
+    "CGA carrying 0x85 v2 data, format 0x04 (temperature, humidity, co2)."
+    value = struct.pack("<IB", ts, 0x04) + struct.pack("<hHH", round(temperature * 10), round(humidity * 10), co2_ppm)
+    return frame(0x41, [(0x85, value), (0x64, bytes([battery])), (0x65, b"\x00\x3c")])
+
+
+CORPUS = {
+    "CG1 history (12 records)": history(0x31, records=12),
+    "CGB history (4 records)":  history(0x42, records=4),
+    "CG4 realtime":             realtime(0x34),
+    "CGA realtime":             realtime(0x41),
+    "CG9 config report":        config_report(),
+    "CG5":                      heartbeat(),
+    "CGA 0x85 v2":              v2_realtime(),
+}
@@ -0,0 +1,270 @@
+"""Just enough of Home Assistant to drive Hub outside a running instance.
+
+The real homeassistant package still has to be importable, only the runtime
+pieces the Hub talks to (hass, config entries, device registry, entity
+platform) are replaced.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_PORT, CONF_USERNAME
+from homeassistant.helpers import device_registry as dr
+from homeassistant.util.unit_system import METRIC_SYSTEM
+
+from . import synthetic
+
+PACKAGE = "custom_components.qingping_mqtt_parser"
+
+
+class FakeMessage:
+    "aiomqtt.Message stand-in."
+
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes) -> None:
+        self.topic = FakeTopic(topic)
+        self.payload = payload
+
+
+class FakeTopic:
+    "aiomqtt.Topic stand-in."
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class FakeDeviceRegistry:
+    "Records devices instead of persisting them."
+
+    def __init__(self) -> None:
+        self.devices = {}
+        self.calls = 0
+
+    def async_get_or_create(self, **kwargs):
+        self.calls += 1
+        key = frozenset(kwargs["identifiers"])
+        device = self.devices.get(key)
+        if device is None:
+            device = SimpleNamespace(id=f"device_{len(self.devices)}", **kwargs)
+            self.devices[key] = device
+        return device
+
+
+class FakeEntityPlatform:
+    """async_add_entities that registers entities without a state machine.
+
+    async_write_ha_state is replaced by a write that reads state, availability
+    and attributes, the part of a real write that runs integration code.
+    """
+
+    def __init__(self, hass: FakeHass) -> None:
+        self.hass = hass
+        self.entities = []
+        self.writes = 0
+        self.add_calls = 0
+        self.added = []   # entities of each async_add_entities call
+
+    def _write(self, entity) -> None:
+        self.writes += 1
+        entity.state
+        entity.available
+        entity.extra_state_attributes
+
+    def async_add_entities(self, entities, update_before_add: bool = False) -> None:
+        entities = list(entities)
+        self.add_calls += 1
+        self.added.append(len(entities))
+        for entity in entities:
+            entity.hass = self.hass
+            entity.async_write_ha_state = lambda e=entity: self._write(e)
+            self.entities.append(entity)
+            self.hass.async_create_task(entity.async_added_to_hass())
+
+
+class FakeConfigEntries:
+    "Forwards platform setup straight to the integration modules."
+
+    def __init__(self, hass: FakeHass) -> None:
+        self.hass = hass
+        self.platforms = {}
+
+    async def async_forward_entry_setups(self, entry, platforms) -> None:
+        for platform in platforms:
+            fake = self.platforms.setdefault(platform, FakeEntityPlatform(self.hass))
+            module = importlib.import_module(f"{PACKAGE}.{platform}")
+            await module.async_setup_entry(self.hass, entry, fake.async_add_entities)
+
+    async def async_unload_platforms(self, entry, platforms) -> bool:
+        return True
+
+
+class FakeHass:
+    """HomeAssistant stand-in.
+
+    Background tasks named in skip_tasks (by coroutine name) are closed
+    instead of scheduled, so the Hub does not try to reach a broker.
+    """
+
+    def __init__(self, skip_tasks=("task_on_mqtt_message",)) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.data = {}
+        # files the Hub writes (captures) go to a temp directory
+        config_dir = os.path.join(tempfile.gettempdir(), "qingping_bench")
+        self.config = SimpleNamespace(
+            components = set(),
+            path       = lambda *parts: os.path.join(config_dir, *parts),
+            units      = METRIC_SYSTEM,   # sensor entities convert temperatures to it
+        )
+        self.storage = {}
+        self.config_entries = FakeConfigEntries(self)
+        self.device_registry = FakeDeviceRegistry()
+        self.skip_tasks = set(skip_tasks)
+        self.tasks = set()
+        self.background_tasks = set()
+
+    def _skipped(self, target):
+        if target.__name__ not in self.skip_tasks:
+            return None
+        target.close()
+        fut = self.loop.create_future()
+        fut.set_result(None)
+        return fut
+
+    def async_create_task(self, target, name=None, eager_start=True):
+        skipped = self._skipped(target)
+        if skipped is not None:
+            return skipped
+        task = self.loop.create_task(target)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def async_create_background_task(self, target, name=None, eager_start=True):
+        "Not waited for by async_block_till_done, cancelled by async_stop."
+        skipped = self._skipped(target)
+        if skipped is not None:
+            return skipped
+        task = self.loop.create_task(target)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    async def async_add_executor_job(self, target, *args):
+        return await self.loop.run_in_executor(None, target, *args)
+
+    async def async_block_till_done(self) -> None:
+        # Yield every round: callbacks scheduled with call_soon can create
+        # tasks, and gather over finished tasks returns without yielding,
+        # before their done callbacks took them out of self.tasks.
+        await asyncio.sleep(0)
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+            await asyncio.sleep(0)
+
+    async def async_stop(self) -> None:
+        for task in list(self.background_tasks):
+            task.cancel()
+        await asyncio.gather(*list(self.background_tasks), return_exceptions=True)
+
+
+class FakeConfigEntry:
+    "ConfigEntry stand-in."
+
+    def __init__(self, data=None, options=None, entry_id="bench") -> None:
+        self.entry_id = entry_id
+        self.data = data or {
+            CONF_HOST: "localhost",
+            CONF_PORT: "1883",
+            CONF_USERNAME: "",
+            CONF_PASSWORD: "",
+        }
+        self.options = options or {}
+        self.runtime_data = None
+        self.title = "bench"
+
+    def async_on_unload(self, func) -> None:
+        pass
+
+    def async_create_background_task(self, hass, target, name, eager_start=True):
+        return hass.async_create_background_task(target, name)
+
+
+class FakeStore:
+    """helpers.storage.Store kept in FakeHass.storage.
+
+    Delayed saves only remember the data function, like a Store whose
+    delay has not passed yet.
+    """
+
+    def __init__(self, hass: FakeHass, version: int, key: str) -> None:
+        self.hass = hass
+        self.key = key
+        self.pending = None
+        self.saves = 0
+
+    async def async_load(self):
+        return self.hass.storage.get(self.key)
+
+    def async_delay_save(self, data_func, delay: float = 0) -> None:
+        self.pending = data_func
+
+    async def async_save(self, data) -> None:
+        self.pending = None
+        self.saves += 1
+        self.hass.storage[self.key] = json.loads(json.dumps(data, default=str))
+
+    async def async_remove(self) -> None:
+        self.pending = None
+        self.hass.storage.pop(self.key, None)
+
+
+@contextmanager
+def patched_ha():
+    """Route device_registry.async_get to FakeHass.device_registry and
+    storage to FakeHass.storage."""
+    with patch.object(dr, "async_get", lambda hass: hass.device_registry), \
+            patch.object(importlib.import_module(f"{PACKAGE}.hub"), "Store", FakeStore):
+        yield
+
+
+def platform_of(hass: FakeHass, platform: str = "sensor") -> FakeEntityPlatform:
+    return hass.config_entries.platforms.setdefault(platform, FakeEntityPlatform(hass))
+
+
+def flush_writes(hub) -> None:
+    "Write everything the WriteScheduler of hub holds now, ignoring the write budget."
+    writer = hub.writer
+    if writer._timer is not None:
+        writer._timer.cancel()
+    budget, writer.budget = writer.budget, 0
+    try:
+        writer._flush()
+    finally:
+        writer.budget = budget
+
+
+async def setup_hub(devices: int, options=None, hass=None, entry_id="bench"):
+    "Hub with devices onboarded and their entities registered. Call inside patched_ha()."
+    hass  = hass or FakeHass()
+    entry = FakeConfigEntry(options=options, entry_id=entry_id)
+    hub = importlib.import_module(f"{PACKAGE}.hub").Hub(hass, entry.data, entry)
+    entry.runtime_data = hub
+    await hub.async_setup()
+
+    for topic, payload in synthetic.onboarding(devices):
+        await hub.parse_message(FakeMessage(topic, payload))
+    await hass.async_block_till_done()
+    return hass, hub
@@ -0,0 +1,225 @@
+"""Load test the Hub at fixed message rates, to size a deployment.
+
+    python -m benchmarks.load --devices 2000 --rate 1000,2000,5000 --duration 10
+    python -m benchmarks.load --capture <config>/qingping_mqtt_parser/capture_<entry_id>.bin --rate 0
+
+Frames come from a synthetic generator (CG1/CGB history, CG4/CGA realtime,
+CG9 config, v2 realtime, see --mix) for N devices, or from capture files
+recorded with the start_capture service. --rate 0 replays a capture with its
+recorded timing. Every device is onboarded first.
+
+--via picks the entry point:
+  parse   Hub.parse_message, awaited by the sender
+  queue   the shared connection and the receive queue, like a transport
+  broker  published to an in-process broker stand-in, read by a transport
+          task, then the connection and the queue
+
+For each rate: offered and sustained messages/sec (sustained includes
+draining the queue), dropped messages, the deepest the queue got, the
+share of frames dropped as duplicates (frames are sent in a cycle, a
+second round repeats the samples of the first), state writes/sec, event loop lag from a 1 ms timer, and the resident memory of
+the process with the part each device adds.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import time
+
+from . import synthetic
+from .__main__ import loop_lag
+from .broker import BrokerTransport, FakeBroker
+from .fakes import FakeConfigEntry, FakeHass, FakeMessage, flush_writes, patched_ha, platform_of, setup_hub
+
+from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_PORT, CONF_USERNAME
+
+from custom_components.qingping_mqtt_parser import capture, connection, const, decode_mqqt_message
+
+
+def rss() -> int:
+    "Resident memory of the process in bytes."
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak, not current, where /proc is missing (ru_maxrss is KiB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def parse_mix(text: str):
+    "'realtime=0.7,history=0.2' -> synthetic.MIX style tuple."
+    mix = []
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix.append((kind.strip(), float(weight or 1)))
+    return tuple(mix)
+
+
+def parse_options(pairs):
+    "['write_window=0.5', 'metrics=true'] -> entry options."
+    options = {}
+    for pair in pairs or ():
+        key, _, value = pair.partition("=")
+        try:
+            options[key] = json.loads(value)
+        except ValueError:
+            options[key] = value
+    return options
+
+
+def load_capture(paths):
+    "(receive time, message) of every record, rotated files included."
+    frames = []
+    for path in paths:
+        for name in capture.capture_files(path) or [path]:
+            frames += [(t, FakeMessage(topic, payload)) for t, topic, payload in capture.read_capture(name)]
+    frames.sort(key=lambda f: f[0])
+    return frames
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(frames, rate: float, duration: float, via: str, options) -> dict:
+    """One load run at rate msgs/sec (recorded timing when 0), frames are reused in a cycle."""
+    hass = FakeHass()
+    broker = None
+    if via == "broker":
+        # take the place of the aiomqtt connection the Hub asks for
+        broker = FakeBroker()
+        data = FakeConfigEntry().data
+        key = (const.TRANSPORT_AIOMQTT, data[CONF_HOST].lower(), int(data[CONF_PORT]), data[CONF_USERNAME], data[CONF_PASSWORD])
+        connections = hass.data.setdefault(const.DOMAIN, {}).setdefault("connections", {})
+        connections[key] = connection.SharedConnection(hass, key, BrokerTransport(broker))
+
+    memory_start = rss()
+    _, hub = await setup_hub(0, options, hass)
+    addrs = sorted({decode_mqqt_message.device_addr(m.topic) for _, m in frames})
+    for addr in addrs:
+        await hub.parse_message(FakeMessage(synthetic.topic(addr), synthetic.corpus.realtime(firmware=b"1.1.5_0256")))
+    await hass.async_block_till_done()
+    flush_writes(hub)
+    memory_devices = rss()
+    platform = platform_of(hass)
+
+    if via == "parse":
+        async def send(m):
+            await hub.parse_message(m)
+    elif via == "queue":
+        send = hub.connection.dispatch
+    else:
+        async def send(m):
+            broker.publish(str(m.topic), m.payload)
+
+    lags = []
+    monitor = asyncio.create_task(loop_lag(0.001, lags))
+    loop = asyncio.get_running_loop()
+    writes = platform.writes
+    stats0 = dict(hub.queue_stats)
+    t0 = loop.time()
+    sent = 0
+    first_ts = frames[0][0]
+    span = max(frames[-1][0] - first_ts, 1e-3)
+    while True:
+        if rate:
+            due = t0 + sent / rate
+        else:
+            cycle, i = divmod(sent, len(frames))
+            due = t0 + cycle * span + frames[i][0] - first_ts
+        if due - t0 >= duration:
+            break
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await send(frames[sent % len(frames)][1])
+        sent += 1
+    offered = loop.time() - t0
+
+    # everything sent has to be handled
+    while broker is not None and broker.backlog:
+        await asyncio.sleep(0.001)
+    await hub.queue.join()
+    flush_writes(hub)
+    elapsed = loop.time() - t0
+    monitor.cancel()
+
+    stats = hub.queue_stats
+    processed = sent if via == "parse" else stats["processed"] - stats0["processed"]
+    result = {
+        "rate":      sent / offered if offered else 0.0,
+        "sustained": processed / elapsed,
+        "dropped":   stats["dropped_oldest"] + stats["dropped_newest"] - stats0["dropped_oldest"] - stats0["dropped_newest"],
+        "max_depth": stats["max_depth"],
+        "duplicates": (hub.dedup_stats or {}).get("hit_rate", 0.0),
+        "writes":    (platform.writes - writes) / elapsed,
+        "lag_p50":   percentile(lags, 50),
+        "lag_p99":   percentile(lags, 99),
+        "lag_max":   max(lags, default=0.0),
+        "rss":       rss(),
+        "per_device": (memory_devices - memory_start) / max(len(addrs), 1),
+        "devices":   len(hub.devices),
+        "entities":  len(platform.entities),
+    }
+    await hub.task_stop()
+    await hass.async_stop()
+    return result
+
+
+async def main(args) -> None:
+    if args.capture:
+        frames = load_capture(args.capture)
+        source = f"{len(frames)} captured frames"
+    else:
+        mix = parse_mix(args.mix) if args.mix else synthetic.MIX
+        per_device = max(1, args.frames // args.devices)
+        frames = [
+            (n, FakeMessage(t, p))
+            for n, (t, p) in enumerate(synthetic.messages(args.devices, per_device, args.seed, mix, args.history_records))
+        ]
+        source = f"{len(frames)} synthetic frames ({', '.join(f'{k} {w:g}' for k, w in mix)})"
+    if not frames:
+        raise SystemExit("no frames to send")
+    options = parse_options(args.option)
+
+    print(f"{source}, via {args.via}, {args.duration:g} s per rate, options {options or 'default'}")
+    print(
+        f"{'offered/s':>10} {'sustained/s':>12} {'dropped':>8} {'max queue':>10} {'dup %':>6} {'writes/s':>9} "
+        f"{'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11} {'RSS MiB':>8} {'KiB/device':>11}"
+    )
+    with patched_ha():
+        for rate in args.rate:
+            r = await run(frames, rate, args.duration, args.via, options)
+            print(
+                f"{r['rate']:>10,.0f} {r['sustained']:>12,.0f} {r['dropped']:>8} {r['max_depth']:>10} {r['duplicates'] * 100:>6.1f} {r['writes']:>9,.0f} "
+                f"{r['lag_p50'] * 1000:>11.2f} {r['lag_p99'] * 1000:>11.2f} {r['lag_max'] * 1000:>11.2f} "
+                f"{r['rss'] / 2**20:>8.0f} {r['per_device'] / 1024:>11.1f}"
+            )
+    print(f"{r['devices']} devices, {r['entities']} entities")
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000, help="synthetic devices")
+    parser.add_argument("--rate", type=lambda s: [float(r) for r in s.split(",")], default=[1000.0],
+                        help="comma separated msgs/sec, one run each, 0 replays a capture with its timing")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of sending per rate")
+    parser.add_argument("--via", choices=("parse", "queue", "broker"), default="queue")
+    parser.add_argument("--capture", nargs="+", help="capture files instead of synthetic frames")
+    parser.add_argument("--mix", help="synthetic frame mix, like realtime=0.7,history=0.2,config=0.1")
+    parser.add_argument("--frames", type=int, default=20000, help="synthetic frames generated, sent in a cycle")
+    parser.add_argument("--history-records", type=int, default=12, help="upper bound of records per history upload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--option", action="append", help="entry option as key=value, repeatable")
+    asyncio.run(main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    cli()
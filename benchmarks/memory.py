@@ -0,0 +1,136 @@
+"""Memory kept per device, after steady traffic.
+
+    python -m benchmarks.memory --devices 10000 --rounds 40
+
+Every device is onboarded, then sends rounds of synthetic frames (history
+heavy by default, so the recent history of each device is full) through
+Hub.parse_message. State writes are flushed after each round.
+
+Prints the bytes reachable from the devices and nothing else: the hub,
+product profiles, decoder tables and the entities behind the write
+callbacks are not counted, other objects referenced by several devices
+(like interned strings) once. Per attribute of the device, then the mean
+per device.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import deque
+import gc
+import sys
+import time
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+from . import synthetic
+from .fakes import FakeMessage, flush_writes, patched_ha, setup_hub
+from .load import parse_mix, parse_options
+
+from custom_components.qingping_mqtt_parser.utils import parser
+
+MIX = "realtime=0.5,history=0.4,v2=0.05,config=0.05"
+
+_OPAQUE = (type, ModuleType, FunctionType, MethodType, BuiltinFunctionType)
+
+
+def _slots(obj):
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name not in ("__dict__", "__weakref__") and hasattr(obj, name):
+                yield name, getattr(obj, name)
+
+
+def deep_size(obj, seen: set) -> int:
+    "sys.getsizeof of obj and everything it references, objects in seen excluded."
+    if id(obj) in seen or isinstance(obj, _OPAQUE):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif isinstance(obj, memoryview):
+        size += deep_size(obj.obj, seen)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += deep_size(vars(obj), seen)
+    size += sum(deep_size(value, seen) for _, value in _slots(obj))
+    return size
+
+
+def attributes(obj):
+    "(name, value) of the instance attributes of obj."
+    if hasattr(obj, "__dict__"):
+        yield from vars(obj).items()
+    yield from _slots(obj)
+
+
+def shared(hub) -> set:
+    "ids of objects devices share, not counted for any of them."
+    ids = {id(hub), id(parser.KEY_DECODERS)}
+    for qp in hub.devices.values():
+        profile = qp.profile
+        ids.update((id(profile), id(profile.sensors), id(profile.decoders)))
+        ids.update(id(write) for writes in qp._callbacks.values() for write in writes)
+    return ids
+
+
+async def main(args) -> None:
+    mix = parse_mix(args.mix)
+    options = {"write_window": 0, **parse_options(args.option)}
+    with patched_ha():
+        start = time.perf_counter()
+        hass, hub = await setup_hub(args.devices, options)
+        frames = 0
+        for n, (topic, payload) in enumerate(
+            synthetic.messages(args.devices, args.rounds, args.seed, mix, args.history_records)
+        ):
+            await hub.parse_message(FakeMessage(topic, payload))
+            frames += 1
+            if n % args.devices == args.devices - 1:
+                flush_writes(hub)
+        flush_writes(hub)
+        elapsed = time.perf_counter() - start
+
+        gc.collect()
+        skip = shared(hub)
+        per_attribute: dict[str, int] = {}
+        total = 0
+        # an object several devices or attributes reference counts once, for the first
+        seen = set(skip)
+        for qp in hub.devices.values():
+            seen.add(id(qp))
+            own = sys.getsizeof(qp) + (sys.getsizeof(vars(qp)) if hasattr(qp, "__dict__") else 0)
+            total += own
+            for name, value in attributes(qp):
+                size = deep_size(value, seen)
+                per_attribute[name] = per_attribute.get(name, 0) + size
+                total += size
+
+        devices = len(hub.devices)
+        print(f"{devices} devices, {frames} frames in {elapsed:.0f} s, options {options}")
+        print(f"{'attribute':<24} {'bytes/device':>13}")
+        for name, size in sorted(per_attribute.items(), key=lambda item: -item[1]):
+            if size / devices >= 1:
+                print(f"{name:<24} {size / devices:>13,.0f}")
+        print(f"{'total':<24} {total / devices:>13,.0f}")
+
+        await hub.task_stop()
+        await hass.async_stop()
+
+
+def cli() -> None:
+    parser_ = argparse.ArgumentParser(prog="python -m benchmarks.memory", description=__doc__,
+                                      formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser_.add_argument("--devices", type=int, default=10000, help="synthetic devices")
+    parser_.add_argument("--rounds", type=int, default=40, help="frames per device after onboarding")
+    parser_.add_argument("--mix", default=MIX, help="synthetic frame mix")
+    parser_.add_argument("--history-records", type=int, default=12, help="upper bound of records per history upload")
+    parser_.add_argument("--seed", type=int, default=1)
+    parser_.add_argument("--option", action="append", help="entry option as key=value, repeatable")
+    asyncio.run(main(parser_.parse_args()))
+
+
+if __name__ == "__main__":
+    cli()
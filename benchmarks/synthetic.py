@@ -0,0 +1,60 @@
+"Synthetic MQTT traffic for N devices."
+import random
+
+from . import corpus
+
+# share of each frame type in steady traffic, realtime events dominate
+MIX = (
+    ("realtime", 0.70),
+    ("history",  0.20),
+    ("v2",       0.05),
+    ("config",   0.05),
+)
+
+
+def device_addr(n: int) -> str:
+    "Qingping style MAC address."
+    return f"582D34{n:06X}"
+
+
+def topic(addr: str) -> str:
+    return f"qingping/{addr}/up"
+
+
+def onboarding(devices: int):
+    """First message per device.
+
+    A realtime frame with firmware version: the Hub creates the device and
+    probes its sensors from it.
+    """
+    for n in range(devices):
+        yield topic(device_addr(n)), corpus.realtime(firmware=b"1.1.5_0256")
+
+
+def messages(devices: int, per_device: int, seed: int = 1, mix=MIX, history_records: int = 12):
+    """Steady traffic: per_device rounds of one message from each device.
+
+    Values drift a little per message, timestamps advance by 60 s per round.
+    History uploads carry 1 to history_records - 1 records.
+    """
+    rnd = random.Random(seed)
+    kinds = [k for k, _ in mix]
+    weights = [w for _, w in mix]
+
+    for r in range(per_device):
+        ts = corpus.TIMESTAMP + r * 60
+        for n in range(devices):
+            kind = rnd.choices(kinds, weights)[0]
+            t = round(20 + rnd.random() * 5, 1)
+            h = round(35 + rnd.random() * 20, 1)
+            c = rnd.randrange(400, 1500)
+            b = rnd.randrange(20, 101)
+            if kind == "realtime":
+                payload = corpus.realtime(rnd.choice((0x34, 0x41)), ts, t, h, c, b)
+            elif kind == "history":
+                payload = corpus.history(rnd.choice((0x31, 0x42)), ts, rnd.randrange(1, history_records), 900, t, h, c, b)
+            elif kind == "v2":
+                payload = corpus.v2_realtime(ts, t, h, c, b)
+            else:
+                payload = corpus.config_report()
+            yield topic(device_addr(n)), payload
@@ -1,16 +1,34 @@
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.typing import ConfigType
 
 from . import hub
-from .const import PLATFORMS
+from .const import DOMAIN, PLATFORMS
+from .services import async_setup_services
+
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Register services."""
+    async_setup_services(hass)
+    return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Create Hub for entry."""
     entry.runtime_data = hub.Hub(hass, entry.data, entry)
+    await entry.runtime_data.async_setup()
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
     return True
 
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Options changed, start over."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
 
@@ -21,4 +39,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         #entry.runtime_data.listener()
         pass
 
-    return unload_ok
\ No newline at end of file
+    return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Entry deleted, remove its device cache."""
+    await hub.device_store(hass, entry.entry_id).async_remove()
\ No newline at end of file
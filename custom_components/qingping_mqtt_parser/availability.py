@@ -0,0 +1,122 @@
+"Device availability: unavailable after missing a number of uploads, one timer for all devices."
+from __future__ import annotations
+
+import asyncio
+import heapq
+from typing import Callable
+
+from .const import DEFAULT_UNAVAILABLE_AFTER, DEFAULT_UPLOAD_INTERVAL
+
+
+class AvailabilityTracker:
+    """Marks devices unavailable when no frame came for missed upload intervals.
+
+    Every tracked device has a (deadline, addr, device) entry in a heap,
+    and one timer fires at the earliest deadline. A frame that moves the
+    deadline later only writes it in a dict. When an entry comes up and the
+    deadline of its device has moved meanwhile, it is pushed again with the
+    new one, otherwise the device goes unavailable. A deadline moved earlier
+    (a config report with a shorter upload interval) pushes a new entry,
+    the later one is skipped when it comes up. So a frame mostly costs a
+    dict write, and the timer fires about once per timeout.
+
+    on_change(device) is called when device.available changed.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, on_change: Callable, missed: int = DEFAULT_UNAVAILABLE_AFTER,
+                 default_interval: float = DEFAULT_UPLOAD_INTERVAL) -> None:
+        "Init."
+        self._loop     = loop
+        self.on_change = on_change
+        self.missed    = missed
+        self.default_interval = default_interval
+        self._deadlines: dict[str, float] = {}   # addr -> loop time the device is due
+        self._queued: dict[str, float] = {}      # addr -> deadline of its current heap entry
+        self._heap: list[tuple] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_at = None
+
+        self.unavailable = 0
+        self.back        = 0
+        self.sweeps      = 0
+        self.requeued    = 0
+
+    def timeout(self, device) -> float:
+        "Seconds without a frame before device is unavailable."
+        return self.missed * (device.upload_interval or self.default_interval)
+
+    def seen(self, device) -> None:
+        "A frame of device arrived."
+        self._track(device, self._loop.time() + self.timeout(device))
+        if not device.available:
+            device.available = True
+            self.back += 1
+            self.on_change(device)
+
+    def restore(self, device, age: float) -> None:
+        "Track a device restored from the cache, its last frame came age seconds ago."
+        self._track(device, self._loop.time() + max(0.0, self.timeout(device) - age))
+
+    def _track(self, device, deadline: float) -> None:
+        addr = device.addr
+        self._deadlines[addr] = deadline
+        queued = self._queued.get(addr)
+        if queued is None or deadline < queued:
+            self._queued[addr] = deadline
+            heapq.heappush(self._heap, (deadline, addr, device))
+            self._schedule()
+
+    def _schedule(self) -> None:
+        if not self._heap:
+            return
+        due = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_at <= due:
+                return
+            self._timer.cancel()
+        self._timer_at = due
+        self._timer = self._loop.call_at(due, self._sweep)
+
+    def _sweep(self) -> None:
+        self._timer = None
+        self.sweeps += 1
+        now = self._loop.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            queued, addr, device = heapq.heappop(heap)
+            if self._queued.get(addr) != queued:
+                # replaced by an earlier entry
+                continue
+            deadline = self._deadlines[addr]
+            if deadline > now:
+                # seen since the entry was pushed
+                self.requeued += 1
+                self._queued[addr] = deadline
+                heapq.heappush(heap, (deadline, addr, device))
+                continue
+            del self._deadlines[addr]
+            del self._queued[addr]
+            if device.available:
+                device.available = False
+                self.unavailable += 1
+                self.on_change(device)
+        self._schedule()
+
+    def cancel(self) -> None:
+        "Stop the timer."
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "missed":      self.missed,
+            "tracked":     len(self._deadlines),
+            "heap":        len(self._heap),
+            "next_in":     None if not self._heap else round(max(0.0, self._heap[0][0] - self._loop.time()), 1),
+            "unavailable": self.unavailable,
+            "back":        self.back,
+            "sweeps":      self.sweeps,
+            "requeued":    self.requeued,
+        }
@@ -0,0 +1,175 @@
+"Raw payload capture: received frames written to rotating binary files for replay."
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import struct
+from typing import Iterator
+
+from homeassistant.core import callback
+
+from .const import CAPTURE_FILES, CAPTURE_FLUSH_INTERVAL, CAPTURE_MAX_PENDING
+
+_LOGGER = logging.getLogger(__name__)
+
+# file header, then records: receive time (unix, float64), topic length,
+# payload length, topic (utf-8), payload
+MAGIC  = b"QPCAP\x01"
+RECORD = struct.Struct("<dHI")
+
+
+def encode_record(received: float, topic: str, payload: bytes) -> bytes:
+    "One capture record."
+    t = topic.encode()
+    return RECORD.pack(received, len(t), len(payload)) + t + bytes(payload)
+
+
+def read_capture(path: str) -> Iterator[tuple[float, str, bytes]]:
+    "(receive time, topic, payload) of every record in a capture file. A truncated last record is skipped."
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            received, topic_len, payload_len = RECORD.unpack(header)
+            topic = f.read(topic_len)
+            payload = f.read(payload_len)
+            if len(topic) < topic_len or len(payload) < payload_len:
+                return
+            yield received, topic.decode(), payload
+
+
+def capture_files(path: str) -> list[str]:
+    "Existing files of a capture, oldest first."
+    names = [f"{path}.{n}" for n in range(CAPTURE_FILES - 1, 0, -1)] + [path]
+    return [name for name in names if os.path.exists(name)]
+
+
+class CaptureRecorder:
+    """Appends received frames to path, rotated at max_bytes.
+
+    record() only encodes and buffers on the event loop. Every
+    CAPTURE_FLUSH_INTERVAL the buffer goes to a single writer thread as
+    one batch, so records stay in order and file I/O never runs on the
+    loop. When a file would grow past max_bytes it is rotated like
+    logging's RotatingFileHandler, keeping CAPTURE_FILES files. If the
+    writer falls behind by more than CAPTURE_MAX_PENDING bytes, new
+    records are dropped and counted.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, path: str, max_bytes: int, devices=frozenset()) -> None:
+        "Init. devices are upper-case addresses, empty records every device."
+        self._loop     = loop
+        self.path      = path
+        self.max_bytes = max_bytes
+        self.devices   = frozenset(devices)
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._writing  = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="qingping_capture")
+        self._file     = None
+
+        self.records  = 0
+        self.bytes    = 0
+        self.dropped  = 0
+        self.batches  = 0
+        self.rotations = 0
+
+    def wants(self, addr: str) -> bool:
+        "Record frames of addr."
+        return not self.devices or addr.upper() in self.devices
+
+    @callback
+    def record(self, received: float, topic, payload: bytes) -> None:
+        "Buffer one frame."
+        if self._buffered + self._writing > CAPTURE_MAX_PENDING:
+            self.dropped += 1
+            return
+        data = encode_record(received, str(topic), payload)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.records += 1
+        if self._timer is None:
+            self._timer = self._loop.call_later(CAPTURE_FLUSH_INTERVAL, self._flush)
+
+    @callback
+    def _flush(self) -> None:
+        self._timer = None
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        size, self._buffered = self._buffered, 0
+        self._writing += size
+        self.batches += 1
+        fut = self._loop.run_in_executor(self._executor, self._write, batch)
+        fut.add_done_callback(lambda f, size=size: self._written(f, size))
+
+    def _written(self, fut: asyncio.Future, size: int) -> None:
+        self._writing -= size
+        if not fut.cancelled() and fut.exception() is not None:
+            _LOGGER.error(f"Capture write to {self.path} failed: {fut.exception()!r}")
+        else:
+            self.bytes += size
+
+    def _open(self):
+        "Writer thread."
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "ab")
+        if f.tell() == 0:
+            f.write(MAGIC)
+        return f
+
+    def _rotate(self) -> None:
+        "Writer thread."
+        self._file.close()
+        self._file = None
+        for n in range(CAPTURE_FILES - 1, 0, -1):
+            src = self.path if n == 1 else f"{self.path}.{n - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{n}")
+        self.rotations += 1
+
+    def _write(self, batch: list[bytes]) -> None:
+        "Writer thread."
+        for data in batch:
+            if self._file is None:
+                self._file = self._open()
+            if self._file.tell() + len(data) > self.max_bytes and self._file.tell() > len(MAGIC):
+                self._rotate()
+                self._file = self._open()
+            self._file.write(data)
+        self._file.flush()
+
+    def _close(self) -> None:
+        "Writer thread."
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def async_stop(self) -> None:
+        "Write what is buffered and close the file."
+        if self._timer is not None:
+            self._timer.cancel()
+        self._flush()
+        # the writer thread runs jobs in order, the flush above is done first
+        await self._loop.run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "path":      self.path,
+            "devices":   sorted(self.devices),
+            "max_bytes": self.max_bytes,
+            "records":   self.records,
+            "bytes":     self.bytes,
+            "pending":   self._buffered + self._writing,
+            "dropped":   self.dropped,
+            "batches":   self.batches,
+            "rotations": self.rotations,
+        }
@@ -1,15 +1,63 @@
 import logging
-from .const import DOMAIN  # pylint:disable=unused-import
+from .const import (  # pylint:disable=unused-import
+    CONF_DEADBAND_CO2,
+    CONF_DEADBAND_HEARTBEAT,
+    CONF_DEADBAND_HUMIDITY,
+    CONF_DEADBAND_TEMPERATURE,
+    CONF_DECODE_OFFLOAD,
+    CONF_DECODE_OFFLOAD_THRESHOLD,
+    CONF_DEDUP,
+    CONF_DEVICE_FILTER,
+    CONF_HISTORY_LOG,
+    CONF_HISTORY_LOG_MAX_SIZE,
+    CONF_HISTORY_LOG_RETENTION,
+    CONF_HISTORY_STATISTICS,
+    CONF_METRICS,
+    CONF_QUEUE_OVERFLOW,
+    CONF_QUEUE_SIZE,
+    CONF_QUEUE_WORKERS,
+    CONF_STATUS_ATTRIBUTES,
+    CONF_TRANSPORT,
+    CONF_UNAVAILABLE_AFTER,
+    CONF_WRITE_BUDGET,
+    CONF_WRITE_WINDOW,
+    DEFAULT_DEADBAND,
+    DEFAULT_DEADBAND_HEARTBEAT,
+    DEFAULT_DECODE_OFFLOAD,
+    DEFAULT_DECODE_OFFLOAD_THRESHOLD,
+    DEFAULT_DEDUP,
+    DEFAULT_HISTORY_LOG,
+    DEFAULT_HISTORY_LOG_MAX_SIZE,
+    DEFAULT_HISTORY_LOG_RETENTION,
+    DEFAULT_HISTORY_STATISTICS,
+    DEFAULT_METRICS,
+    DEFAULT_QUEUE_OVERFLOW,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_QUEUE_WORKERS,
+    DEFAULT_STATUS_ATTRIBUTES,
+    DEFAULT_TRANSPORT,
+    DEFAULT_UNAVAILABLE_AFTER,
+    DEFAULT_WRITE_BUDGET,
+    DEFAULT_WRITE_WINDOW,
+    DOMAIN,
+    OFFLOAD_MODES,
+    OVERFLOW_POLICIES,
+    STATUS_ATTRIBUTES_MODES,
+    TRANSPORT_HOMEASSISTANT,
+    TRANSPORTS,
+)
 import voluptuous as vol
 from typing import Any
-from . import hub
+from . import deadband, hub
 from homeassistant.const import CONF_HOST, CONF_PORT, CONF_PASSWORD, CONF_USERNAME
 
 from homeassistant import config_entries, exceptions
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 
+# host, port and credentials are only used by the aiomqtt transport
 DATA_SCHEMA = vol.Schema({
-    vol.Required(CONF_HOST): str,
+    vol.Required(CONF_TRANSPORT, default=DEFAULT_TRANSPORT): vol.In(TRANSPORTS),
+    vol.Optional(CONF_HOST, default=""): str,
     vol.Required(CONF_PORT, default="1883"): str,
     vol.Optional(CONF_USERNAME, default=""): str,
     vol.Optional(CONF_PASSWORD, default=""): str
@@ -17,8 +65,67 @@ DATA_SCHEMA = vol.Schema({
 
 _LOGGER = logging.getLogger(__name__)
 
+def _deadband(value) -> str:
+    "'0.2' or '5%'."
+    try:
+        deadband.parse_band(value)
+    except ValueError as e:
+        raise vol.Invalid(f"Invalid deadband {value!r}: {e}") from e
+    return str(value).strip()
+
+def options_schema(options) -> vol.Schema:
+    "Options form, defaults are the current values."
+    return vol.Schema({
+        vol.Required(CONF_QUEUE_SIZE, default=options.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE)):
+            vol.All(vol.Coerce(int), vol.Range(min=10)),
+        vol.Required(CONF_QUEUE_OVERFLOW, default=options.get(CONF_QUEUE_OVERFLOW, DEFAULT_QUEUE_OVERFLOW)):
+            vol.In(OVERFLOW_POLICIES),
+        vol.Required(CONF_QUEUE_WORKERS, default=options.get(CONF_QUEUE_WORKERS, DEFAULT_QUEUE_WORKERS)):
+            vol.All(vol.Coerce(int), vol.Range(min=1, max=64)),
+        vol.Required(CONF_DECODE_OFFLOAD, default=options.get(CONF_DECODE_OFFLOAD, DEFAULT_DECODE_OFFLOAD)):
+            vol.In(OFFLOAD_MODES),
+        vol.Required(CONF_DECODE_OFFLOAD_THRESHOLD, default=options.get(CONF_DECODE_OFFLOAD_THRESHOLD, DEFAULT_DECODE_OFFLOAD_THRESHOLD)):
+            vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Required(CONF_DEDUP, default=options.get(CONF_DEDUP, DEFAULT_DEDUP)):
+            bool,
+        vol.Required(CONF_WRITE_WINDOW, default=options.get(CONF_WRITE_WINDOW, DEFAULT_WRITE_WINDOW)):
+            vol.All(vol.Coerce(float), vol.Range(min=0, max=60)),
+        vol.Required(CONF_WRITE_BUDGET, default=options.get(CONF_WRITE_BUDGET, DEFAULT_WRITE_BUDGET)):
+            vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Required(CONF_STATUS_ATTRIBUTES, default=options.get(CONF_STATUS_ATTRIBUTES, DEFAULT_STATUS_ATTRIBUTES)):
+            vol.In(STATUS_ATTRIBUTES_MODES),
+        vol.Required(CONF_HISTORY_STATISTICS, default=options.get(CONF_HISTORY_STATISTICS, DEFAULT_HISTORY_STATISTICS)):
+            bool,
+        vol.Required(CONF_HISTORY_LOG, default=options.get(CONF_HISTORY_LOG, DEFAULT_HISTORY_LOG)):
+            bool,
+        vol.Required(CONF_HISTORY_LOG_RETENTION, default=options.get(CONF_HISTORY_LOG_RETENTION, DEFAULT_HISTORY_LOG_RETENTION)):
+            vol.All(vol.Coerce(int), vol.Range(min=1, max=3650)),
+        vol.Required(CONF_HISTORY_LOG_MAX_SIZE, default=options.get(CONF_HISTORY_LOG_MAX_SIZE, DEFAULT_HISTORY_LOG_MAX_SIZE)):
+            vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+        vol.Optional(CONF_DEVICE_FILTER, default=options.get(CONF_DEVICE_FILTER, "")):
+            str,
+        vol.Required(CONF_METRICS, default=options.get(CONF_METRICS, DEFAULT_METRICS)):
+            bool,
+        vol.Required(CONF_DEADBAND_TEMPERATURE, default=options.get(CONF_DEADBAND_TEMPERATURE, DEFAULT_DEADBAND)):
+            _deadband,
+        vol.Required(CONF_DEADBAND_HUMIDITY, default=options.get(CONF_DEADBAND_HUMIDITY, DEFAULT_DEADBAND)):
+            _deadband,
+        vol.Required(CONF_DEADBAND_CO2, default=options.get(CONF_DEADBAND_CO2, DEFAULT_DEADBAND)):
+            _deadband,
+        vol.Required(CONF_DEADBAND_HEARTBEAT, default=options.get(CONF_DEADBAND_HEARTBEAT, DEFAULT_DEADBAND_HEARTBEAT)):
+            vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Required(CONF_UNAVAILABLE_AFTER, default=options.get(CONF_UNAVAILABLE_AFTER, DEFAULT_UNAVAILABLE_AFTER)):
+            vol.All(vol.Coerce(int), vol.Range(min=0)),
+        })
+
 class ExampleConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Options are applied by reloading the entry."""
+        return OptionsFlowHandler()
+
     async def async_step_user(self, user_input=None):
         """Handle the initial step."""
         # This goes through the steps to take the user through the setup process.
@@ -35,6 +142,8 @@ class ExampleConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 return self.async_create_entry(title=info["title"], data=user_input)
             except CannotConnect:
                 errors["base"] = "cannot_connect"
+            except MqttNotSetUp:
+                errors["base"] = "mqtt_not_set_up"
             except InvalidHost:
                 # The error string is set here, and should be translated.
                 # This example does not currently cover translations, see the
@@ -52,6 +161,19 @@ class ExampleConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
 
 
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Tuning options."""
+
+    async def async_step_init(self, user_input=None):
+        """Single options form."""
+        if user_input is not None:
+            return self.async_create_entry(data=user_input)
+
+        return self.async_show_form(
+            step_id="init", data_schema=options_schema(self.config_entry.options)
+        )
+
+
 async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
     """Validate the user input allows us to connect.
 
@@ -59,6 +181,14 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
     """
     # Validate the data can be used to set up a connection.
 
+    if data.get(CONF_TRANSPORT) == TRANSPORT_HOMEASSISTANT:
+        # imported here, the mqtt integration is only needed by this transport
+        from homeassistant.components import mqtt
+
+        if not await mqtt.async_wait_for_mqtt_client(hass):
+            raise MqttNotSetUp
+        return {"title": "Home Assistant MQTT"}
+
     # This is a simple example to show an error in the UI for a short hostname
     # The exceptions are defined at the end of this file, and are used in the
     # `async_step_user` method below.
@@ -94,4 +224,8 @@ class CannotConnect(exceptions.HomeAssistantError):
 
 
 class InvalidHost(exceptions.HomeAssistantError):
-    """Error to indicate there is an invalid hostname."""
\ No newline at end of file
+    """Error to indicate there is an invalid hostname."""
+
+
+class MqttNotSetUp(exceptions.HomeAssistantError):
+    """Error to indicate the MQTT integration is not set up."""
\ No newline at end of file
@@ -0,0 +1,97 @@
+"Configuration frames to devices, published at a limited rate."
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from homeassistant.core import callback
+
+from .const import CONFIGURE_RATE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def down_topic(addr: str) -> str:
+    "Topic a device reads commands from."
+    return f"qingping/{addr}/down"
+
+
+class ConfigPublisher:
+    """Publishes one frame per device, at most rate frames/sec.
+
+    Devices are sent in the order they were queued. A device queued again
+    before its frame went out only gets the newest frame. The sender runs
+    as a task while something is pending.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, bytes], Awaitable],
+        create_task: Callable[[Awaitable, str], asyncio.Task],
+        rate: float = CONFIGURE_RATE,
+    ) -> None:
+        "Init."
+        self._publish     = publish
+        self._create_task = create_task
+        self.rate         = rate
+        self._pending: dict[str, bytes] = {}
+        self._task: asyncio.Task | None = None
+
+        self.queued   = 0
+        self.replaced = 0
+        self.sent     = 0
+        self.failed   = 0
+
+    @callback
+    def configure(self, addr: str, payload: bytes) -> None:
+        "Queue payload for addr."
+        self.queued += 1
+        if addr in self._pending:
+            # keep the place in line, send the newest
+            self.replaced += 1
+        self._pending[addr] = payload
+        if self._task is None:
+            self._task = self._create_task(self._run(), "qingping configure")
+
+    async def _run(self) -> None:
+        try:
+            while self._pending:
+                addr = next(iter(self._pending))
+                payload = self._pending.pop(addr)
+                try:
+                    await self._publish(down_topic(addr), payload)
+                    self.sent += 1
+                    _LOGGER.debug(f"Configuration sent to {addr}: {payload.hex(' ')}")
+                except Exception as e:  # noqa: BLE001
+                    self.failed += 1
+                    _LOGGER.error(f"Configuration of {addr} failed: {e!r}")
+                await asyncio.sleep(1 / self.rate)
+        finally:
+            self._task = None
+
+    async def async_stop(self) -> None:
+        "Drop what is pending."
+        self._pending.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def pending(self) -> int:
+        "Devices waiting for their frame."
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "rate":     self.rate,
+            "pending":  self.pending,
+            "queued":   self.queued,
+            "replaced": self.replaced,
+            "sent":     self.sent,
+            "failed":   self.failed,
+        }
@@ -0,0 +1,163 @@
+"One MQTT connection per broker, shared by every Hub (config entry) using it."
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from homeassistant.core import HomeAssistant, callback
+
+from . import decode_mqqt_message
+from .const import DOMAIN, TRANSPORT_AIOMQTT, TRANSPORT_HOMEASSISTANT
+from .transport import AiomqttTransport, HomeAssistantMqttTransport, Transport
+
+if TYPE_CHECKING:
+    from .hub import Hub
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SharedConnection:
+    """One transport with one subscription to qingping/+/up.
+
+    Each message goes to the queue of exactly one Hub, so it is decoded
+    once: the Hub whose device filter lists the address, otherwise the
+    first attached Hub without a filter. Messages no Hub takes are counted
+    and dropped. A Hub that captures gets the raw frame recorded before
+    it is queued, so frames the queue drops are captured too.
+    """
+
+    def __init__(self, hass: HomeAssistant, key: tuple, transport: Transport) -> None:
+        "Init."
+        self._hass     = hass
+        self.key       = key
+        self.transport = transport
+        self.hubs: list[Hub] = []
+        self._owner: dict[str, Hub | None] = {}   # addr -> Hub, routing cache
+        self._start_task = None
+
+        self.received  = 0
+        self.unrouted  = 0
+        self.published = 0
+
+    def attach(self, hub: Hub) -> None:
+        "Route messages to hub, starts the client with the first Hub."
+        self.hubs.append(hub)
+        self._owner.clear()
+        if self._start_task is None:
+            self._start_task = self._hass.async_create_background_task(
+                self.transport.async_start(self.dispatch, self.dispatch_nowait),
+                f"{DOMAIN} {self.transport.name} start",
+            )
+
+    def detach(self, hub: Hub) -> bool:
+        "Stop routing to hub. True when no Hub is left."
+        if hub in self.hubs:
+            self.hubs.remove(hub)
+        self._owner.clear()
+        return not self.hubs
+
+    def route(self, addr: str) -> Hub | None:
+        "Hub that handles messages of addr."
+        try:
+            return self._owner[addr]
+        except KeyError:
+            pass
+
+        hub = None
+        key = addr.upper()
+        for candidate in self.hubs:
+            if key in candidate.device_filter:
+                hub = candidate
+                break
+        if hub is None:
+            for candidate in self.hubs:
+                if not candidate.device_filter:
+                    hub = candidate
+                    break
+
+        self._owner[addr] = hub
+        return hub
+
+    async def dispatch(self, message) -> None:
+        "Queue message on the Hub that owns its device."
+        self.received += 1
+        addr = decode_mqqt_message.device_addr(message.topic)
+        hub = self.route(addr)
+        if hub is None:
+            self.unrouted += 1
+            return
+        if hub.capture is not None and hub.capture.wants(addr):
+            hub.capture.record(time.time(), message.topic, message.payload)
+        await hub.queue.put(addr, message)
+
+    @callback
+    def dispatch_nowait(self, message) -> None:
+        "dispatch() for transports that deliver from a callback."
+        self.received += 1
+        addr = decode_mqqt_message.device_addr(message.topic)
+        hub = self.route(addr)
+        if hub is None:
+            self.unrouted += 1
+            return
+        if hub.capture is not None and hub.capture.wants(addr):
+            hub.capture.record(time.time(), message.topic, message.payload)
+        hub.queue.put_nowait(addr, message)
+
+    async def async_publish(self, topic: str, payload: bytes) -> None:
+        "Publish to the broker."
+        await self.transport.async_publish(topic, payload)
+        self.published += 1
+
+    async def stop(self) -> None:
+        "Stop the transport."
+        if self._start_task is not None and not self._start_task.done():
+            # still waiting for the broker or the MQTT integration
+            self._start_task.cancel()
+            try:
+                await self._start_task
+            except asyncio.CancelledError:
+                pass
+        await self.transport.async_stop()
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "transport": self.transport.name,
+            "hubs":      len(self.hubs),
+            "received":  self.received,
+            "unrouted":  self.unrouted,
+            "published": self.published,
+        }
+
+
+def _connections(hass: HomeAssistant) -> dict:
+    return hass.data.setdefault(DOMAIN, {}).setdefault("connections", {})
+
+
+def acquire(hass: HomeAssistant, hub: Hub, transport: str, host: str, port: int, user, pwd) -> SharedConnection:
+    "Connection for the broker, created on first use, with hub attached."
+    if transport == TRANSPORT_HOMEASSISTANT:
+        # a single broker, the one the MQTT integration is connected to
+        key = (TRANSPORT_HOMEASSISTANT,)
+    else:
+        key = (TRANSPORT_AIOMQTT, host.lower(), port, user, pwd)
+
+    connections = _connections(hass)
+    connection = connections.get(key)
+    if connection is None:
+        if transport == TRANSPORT_HOMEASSISTANT:
+            t = HomeAssistantMqttTransport(hass)
+        else:
+            t = AiomqttTransport(hass, host, port, user, pwd)
+        connection = connections[key] = SharedConnection(hass, key, t)
+    connection.attach(hub)
+    return connection
+
+
+async def release(hass: HomeAssistant, hub: Hub, connection: SharedConnection) -> None:
+    "Detach hub, the last Hub to leave closes the connection."
+    if connection.detach(hub):
+        _connections(hass).pop(connection.key, None)
+        await connection.stop()
@@ -4,3 +4,139 @@
 # name for the integration.
 DOMAIN = "qingping_mqtt_parser"
 PLATFORMS: list[str] = ["sensor"]
+
+# Receive -> process queue
+CONF_QUEUE_SIZE     = "queue_size"
+CONF_QUEUE_OVERFLOW = "queue_overflow"
+CONF_QUEUE_WORKERS  = "queue_workers"
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_BLOCK       = "block"
+OVERFLOW_POLICIES    = [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK]
+
+DEFAULT_QUEUE_SIZE     = 2000
+DEFAULT_QUEUE_OVERFLOW = OVERFLOW_DROP_OLDEST
+DEFAULT_QUEUE_WORKERS  = 4
+
+# Decoding large frames off the event loop
+CONF_DECODE_OFFLOAD           = "decode_offload"
+CONF_DECODE_OFFLOAD_THRESHOLD = "decode_offload_threshold"
+
+OFFLOAD_OFF     = "off"
+OFFLOAD_THREAD  = "thread"
+OFFLOAD_PROCESS = "process"
+OFFLOAD_MODES   = [OFFLOAD_OFF, OFFLOAD_THREAD, OFFLOAD_PROCESS]
+
+DEFAULT_DECODE_OFFLOAD           = OFFLOAD_OFF
+DEFAULT_DECODE_OFFLOAD_THRESHOLD = 256  # bytes, a history upload of about 40 records
+
+# Coalescing entity state writes
+CONF_WRITE_WINDOW = "write_window"
+CONF_WRITE_BUDGET = "write_budget"
+
+DEFAULT_WRITE_WINDOW = 0.5  # seconds, per device at most one write per sensor in this time
+DEFAULT_WRITE_BUDGET = 0    # writes/sec for all devices together, 0 is unlimited
+
+# Status entity attributes
+CONF_STATUS_ATTRIBUTES = "status_attributes"
+
+STATUS_ATTRIBUTES_COMPACT = "compact"  # summaries, the rest is in diagnostics
+STATUS_ATTRIBUTES_FULL    = "full"     # config report, latest values and recent samples
+STATUS_ATTRIBUTES_MODES   = [STATUS_ATTRIBUTES_COMPACT, STATUS_ATTRIBUTES_FULL]
+
+DEFAULT_STATUS_ATTRIBUTES = STATUS_ATTRIBUTES_COMPACT
+
+STATUS_HISTORY_UPLOADS    = 5     # last history uploads listed in compact attributes
+RECENT_SAMPLES            = 32    # samples of data frames and history records kept per device
+STATUS_ATTRIBUTES_MAX_SIZE = 1024  # bytes of JSON, compact attributes are trimmed to fit
+
+# History uploads imported as long-term statistics
+CONF_HISTORY_STATISTICS = "history_statistics"
+
+DEFAULT_HISTORY_STATISTICS = False  # writes external statistics, opt in
+
+HISTORY_IMPORT_INTERVAL   = 10  # seconds between imports, uploads in between are merged
+HISTORY_IMPORT_KEEP_HOURS = 3   # hours of records kept per device to merge uploads into
+
+# Several entries on one broker share its connection, each handles its own devices
+CONF_DEVICE_FILTER = "device_filter"
+
+# Where MQTT messages come from
+CONF_TRANSPORT = "transport"
+
+TRANSPORT_AIOMQTT       = "aiomqtt"        # own connection to the broker
+TRANSPORT_HOMEASSISTANT = "homeassistant"  # subscription through the MQTT integration
+TRANSPORTS              = [TRANSPORT_AIOMQTT, TRANSPORT_HOMEASSISTANT]
+
+DEFAULT_TRANSPORT = TRANSPORT_AIOMQTT
+
+# Devices are cached on disk so entities come back before the devices report again
+STORAGE_VERSION    = 1
+STORAGE_SAVE_DELAY = 60  # seconds, changes within this time are saved together
+
+# Hub performance metrics, diagnostic sensors on a hub device
+CONF_METRICS = "metrics"
+
+DEFAULT_METRICS = False
+
+METRICS_BUCKETS_MS      = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)  # upper bounds
+METRICS_UPDATE_INTERVAL = 30  # seconds between hub sensor updates, also the messages/sec window
+
+# Raw payload capture, started and stopped with services
+SERVICE_START_CAPTURE = "start_capture"
+SERVICE_STOP_CAPTURE  = "stop_capture"
+
+CAPTURE_MAX_SIZE       = 10    # MB per file, default of the start_capture service
+CAPTURE_FILES          = 3     # capture.bin, capture.bin.1, capture.bin.2
+CAPTURE_FLUSH_INTERVAL = 1     # seconds, records in between are written in one batch
+CAPTURE_MAX_PENDING    = 4 * 1024 * 1024  # bytes waiting for the writer, more are dropped
+
+# Configuration frames sent to devices by the configure service
+SERVICE_CONFIGURE = "configure"
+
+CONFIGURE_RATE = 5  # frames/sec per entry, a fleet is configured gradually
+
+# Duplicate frames (QoS redeliveries, retained messages, overlapping history uploads)
+CONF_DEDUP = "dedup"
+
+DEFAULT_DEDUP = True
+
+DEDUP_INDEX_SIZE = 64  # newest sample timestamps remembered per device
+
+# Deadband: smaller changes than this are not written, "0.2" absolute or "5%" of the last written value
+CONF_DEADBAND_TEMPERATURE = "deadband_temperature"
+CONF_DEADBAND_HUMIDITY    = "deadband_humidity"
+CONF_DEADBAND_CO2         = "deadband_co2"
+CONF_DEADBAND_HEARTBEAT   = "deadband_heartbeat"
+
+DEADBAND_SENSORS = {  # option -> sensor
+    CONF_DEADBAND_TEMPERATURE: "temperature",
+    CONF_DEADBAND_HUMIDITY:    "humidity",
+    CONF_DEADBAND_CO2:         "co2_ppm",
+}
+
+DEFAULT_DEADBAND           = "0"  # off
+DEFAULT_DEADBAND_HEARTBEAT = 900  # seconds, a changed value is written after this time whatever the band
+
+# Availability: a device is unavailable after missing this many uploads
+CONF_UNAVAILABLE_AFTER = "unavailable_after"
+
+DEFAULT_UNAVAILABLE_AFTER = 3     # uploads, 0 keeps devices available forever
+DEFAULT_UPLOAD_INTERVAL   = 3600  # seconds, until the device reported its uploadDataInterval
+
+# History log: history upload records on disk, per device, queried by the get_history service
+CONF_HISTORY_LOG           = "history_log"
+CONF_HISTORY_LOG_RETENTION = "history_log_retention"
+CONF_HISTORY_LOG_MAX_SIZE  = "history_log_max_size"
+
+DEFAULT_HISTORY_LOG           = False
+DEFAULT_HISTORY_LOG_RETENTION = 90    # days
+DEFAULT_HISTORY_LOG_MAX_SIZE  = 1     # MB per device, compacted to half when exceeded
+
+SERVICE_GET_HISTORY = "get_history"
+
+HISTORY_LOG_FLUSH_INTERVAL = 5      # seconds, uploads in between are written in one batch
+HISTORY_LOG_MAX_PENDING    = 4 * 1024 * 1024  # bytes waiting for the writer, more are dropped
+HISTORY_LOG_SWEEP_INTERVAL = 86400  # seconds between retention sweeps
+HISTORY_LOG_MAX_QUERY      = 50000  # samples returned by one get_history call
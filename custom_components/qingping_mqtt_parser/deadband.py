@@ -0,0 +1,82 @@
+"Deadband filter: sensor changes too small to matter are not written."
+from __future__ import annotations
+
+import time
+from typing import Callable, NamedTuple
+
+from .const import CONF_DEADBAND_HEARTBEAT, DEADBAND_SENSORS, DEFAULT_DEADBAND, DEFAULT_DEADBAND_HEARTBEAT
+
+
+class Band(NamedTuple):
+    "Smallest change written, absolute or percent of the last written value."
+
+    value: float
+    percent: bool
+
+
+def parse_band(text) -> Band | None:
+    "'0.2' -> Band(0.2, False), '5%' -> Band(5, True), '' and '0' -> None. Raises ValueError."
+    text = str(text).strip()
+    percent = text.endswith('%')
+    value = float(text.rstrip('%').strip() or 0)
+    if value < 0:
+        raise ValueError(f"Deadband can't be negative: {text}")
+    return Band(value, percent) if value else None
+
+
+class DeadbandFilter:
+    """Decides which sensor changes are written.
+
+    A change smaller than the band of its sensor, measured from the last
+    written value, is filtered, unless the sensor has not been written for
+    heartbeat seconds: then the current value goes out anyway. Sensors
+    without a band always pass.
+    """
+
+    def __init__(self, bands: dict[str, Band], heartbeat: float = DEFAULT_DEADBAND_HEARTBEAT,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        "Init."
+        self.bands     = bands
+        self.heartbeat = heartbeat
+        self.clock     = clock
+        self.counters: dict[str, dict[str, int]] = {
+            s: {'passed': 0, 'filtered': 0, 'heartbeat': 0} for s in bands
+        }
+
+    @classmethod
+    def from_options(cls, options) -> DeadbandFilter | None:
+        "Filter for the entry options, None when no sensor has a band."
+        bands = {}
+        for option, sensor in DEADBAND_SENSORS.items():
+            band = parse_band(options.get(option, DEFAULT_DEADBAND))
+            if band is not None:
+                bands[sensor] = band
+        if not bands:
+            return None
+        return cls(bands, float(options.get(CONF_DEADBAND_HEARTBEAT, DEFAULT_DEADBAND_HEARTBEAT)))
+
+    def significant(self, sensor: str, old, new, written: float | None, now: float) -> bool:
+        "Write new? old was written at written (clock time, None if never)."
+        band = self.bands.get(sensor)
+        if band is None or old is None or new is None:
+            return True
+
+        counters = self.counters[sensor]
+        limit = band.value * abs(old) / 100 if band.percent else band.value
+        # decoded values are tenths, 21.5 - 21.3 is a little under 0.2
+        if abs(new - old) + 1e-9 >= limit:
+            counters['passed'] += 1
+            return True
+        if written is None or now - written >= self.heartbeat:
+            counters['heartbeat'] += 1
+            return True
+        counters['filtered'] += 1
+        return False
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            'heartbeat': self.heartbeat,
+            'bands':     {s: f"{b.value:g}{'%' if b.percent else ''}" for s, b in self.bands.items()},
+            'sensors':   {s: dict(c) for s, c in self.counters.items()},
+        }
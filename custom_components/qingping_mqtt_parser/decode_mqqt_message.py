@@ -1,12 +1,23 @@
-from .utils import parser
+from .utils.frame import HISTORY_FIELDS, QingpingFrame
+from .const import DEFAULT_DECODE_OFFLOAD_THRESHOLD, OFFLOAD_OFF, OFFLOAD_PROCESS, OFFLOAD_THREAD
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 _LOGGER = logging.getLogger(__name__)
 
+# frames sent to the executor in one job
+MAX_BATCH = 64
+
+def device_addr(topic) -> str:
+    "qingping/<addr>/up -> addr. Works for aiomqtt.Topic and plain str."
+    return str(topic).split('/')[1]
+
 def decode(topic, payload):
 
     try:
-        addr = topic.value.split('/')[1]
-        data = parser.parse_data(payload)
+        addr = device_addr(topic)
+        data = QingpingFrame(payload)
 
         r = {
             "addr": addr,
@@ -16,4 +27,131 @@ def decode(topic, payload):
         #_LOGGER.info(r)
         return r
     except:
-        return False
\ No newline at end of file
+        return False
+
+def decode_for_hub(topic, payload):
+    "decode() with the fields and history columns the hub reads decoded up front."
+    r = decode(topic, payload)
+    if r:
+        try:
+            r['data'].decode_for_hub()
+        except:
+            return False
+    return r
+
+def decode_batch(items):
+    "Thread pool job: [(topic, payload), ...] -> [decode_for_hub result, ...]."
+    return [decode_for_hub(topic, payload) for topic, payload in items]
+
+def decode_batch_compact(items):
+    """Process pool job, like decode_batch but pickle friendly.
+
+    Results are (addr, fields, omitted, columns) or False. fields leaves out
+    the HISTORY_FIELDS named in omitted, columns is the history.HistoryColumns
+    (numpy arrays) or None. The payload is not sent back, the caller still
+    has it.
+    """
+    out = []
+    for topic, payload in items:
+        r = decode_for_hub(topic, payload)
+        if not r:
+            out.append(False)
+            continue
+        frame   = r['data']
+        fields  = frame.decode_for_hub()
+        omitted = HISTORY_FIELDS if frame.history_block() is not None else ()
+        out.append((r['addr'], fields, omitted, frame.history_columns()))
+    return out
+
+
+class DecodeOffloader:
+    """Decode frames of threshold bytes or more in a thread or process pool.
+
+    Frames submitted in the same event loop iteration go to the executor as
+    one batch. Smaller frames, or everything when mode is off, are decoded
+    inline as before.
+    """
+
+    def __init__(self, mode: str = OFFLOAD_OFF, threshold: int = DEFAULT_DECODE_OFFLOAD_THRESHOLD, workers: int = 2) -> None:
+        "Init."
+        self.mode      = mode
+        self.threshold = threshold
+        self._pending  = []
+
+        self.inline     = 0
+        self.offloaded  = 0
+        self.batches    = 0
+
+        if mode == OFFLOAD_THREAD:
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="qingping_decode")
+        elif mode == OFFLOAD_PROCESS:
+            # no fork, Home Assistant runs many threads
+            self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("forkserver"))
+        else:
+            self._executor = None
+
+    async def decode(self, topic, payload):
+        "Same result as decode()."
+        if self._executor is None or len(payload) < self.threshold:
+            self.inline += 1
+            return decode(topic, payload)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush, loop)
+        self._pending.append((str(topic), payload, fut))
+        return await fut
+
+    def _flush(self, loop) -> None:
+        pending, self._pending = self._pending, []
+        job = decode_batch_compact if self.mode == OFFLOAD_PROCESS else decode_batch
+
+        for i in range(0, len(pending), MAX_BATCH):
+            batch = pending[i:i + MAX_BATCH]
+            self.batches   += 1
+            self.offloaded += len(batch)
+            try:
+                efut = loop.run_in_executor(self._executor, job, [(t, p) for t, p, _ in batch])
+            except RuntimeError as e:
+                # executor already shut down
+                self._resolve(batch, None, e)
+                continue
+            efut.add_done_callback(lambda f, batch=batch: self._resolve(batch, f))
+
+    def _resolve(self, batch, efut, error=None) -> None:
+        if error is None and efut.cancelled():
+            error = asyncio.CancelledError()
+        if error is None:
+            error = efut.exception()
+
+        if error is not None:
+            _LOGGER.error(f"Offloaded decode failed: {error!r}")
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_result(False)
+            return
+
+        for (_, payload, fut), r in zip(batch, efut.result()):
+            if fut.done():
+                continue
+            if r and self.mode == OFFLOAD_PROCESS:
+                addr, fields, omitted, columns = r
+                r = {"addr": addr, "data": QingpingFrame.from_decoded(payload, fields, omitted, columns)}
+            fut.set_result(r)
+
+    def shutdown(self) -> None:
+        "Stop the pool, pending frames resolve to False."
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "mode":      self.mode,
+            "threshold": self.threshold,
+            "inline":    self.inline,
+            "offloaded": self.offloaded,
+            "batches":   self.batches,
+        }
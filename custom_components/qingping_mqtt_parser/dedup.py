@@ -0,0 +1,142 @@
+"Duplicate and overlapping frame suppression, per device."
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from zlib import crc32
+
+from .const import DEDUP_INDEX_SIZE
+
+# key: u32 timestamp << 32 | frame type << 24 | 24 bit payload digest.
+# History records are keyed without frame type and digest, CG1 and CGB
+# uploads of the same record are the same sample.
+_HISTORY = 0
+_DIGEST  = 0xffffff
+
+
+class DedupIndex:
+    """Recently seen samples of each device, by timestamp.
+
+    A realtime frame (CG4/CGA) is keyed by (timestamp, frame type, payload
+    digest), so a device whose clock is not set, and sends different
+    values with the same timestamp, is not dropped. Every record of a
+    history upload (CG1/CGB) is keyed by its own timestamp. Keys are
+    packed into one int and kept sorted in an array per device, the newest
+    size of them. A realtime frame whose key is known, or a history upload
+    without an unknown record, is a duplicate. For a partly new upload
+    check() flags the new records. History records that were already sent
+    as realtime frames are counted as overlap, not dropped: statistics
+    still need them.
+
+    Samples older than everything remembered by a full index can't be
+    told apart and are let through, counted as beyond_window.
+    """
+
+    def __init__(self, size: int = DEDUP_INDEX_SIZE) -> None:
+        "Init."
+        self.size = max(1, size)
+        self._keys: dict[str, array] = {}
+        self.duplicates: dict[str, int] = {}   # addr -> frames dropped
+
+        self.checked           = 0
+        self.realtime          = 0
+        self.realtime_dropped  = 0
+        self.history           = 0
+        self.history_dropped   = 0
+        self.records           = 0
+        self.records_seen      = 0
+        self.records_realtime  = 0
+        self.beyond_window     = 0
+
+    def check(self, addr: str, frame) -> tuple[bool, list[bool] | None]:
+        """(duplicate, new records). New samples are remembered.
+
+        duplicate is True if every sample of frame was seen before. For a
+        history upload with records seen before, new has one flag per
+        record, True for the new ones. None when everything is new.
+        """
+        span = frame.sample_span()
+        if span is None:
+            return False, None
+        self.checked += 1
+
+        keys = self._keys.get(addr)
+        if keys is None:
+            keys = self._keys[addr] = array("Q")
+
+        timestamp, interval, count = span
+        new = None
+        if count == 1 and not interval:
+            payload = frame.payload
+            duplicate = self._realtime(keys, (timestamp << 32) | (payload[2] << 24) | (crc32(payload) & _DIGEST))
+        else:
+            new = self._history(keys, timestamp, interval, count)
+            duplicate = count > 0 and not any(new)
+            if duplicate:
+                self.history_dropped += 1
+            if all(new):
+                new = None
+
+        if duplicate:
+            self.duplicates[addr] = self.duplicates.get(addr, 0) + 1
+        elif len(keys) > self.size:
+            del keys[:len(keys) - self.size]
+        return duplicate, new
+
+    def _realtime(self, keys: array, key: int) -> bool:
+        self.realtime += 1
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            self.realtime_dropped += 1
+            return True
+        if i == 0 and len(keys) >= self.size:
+            self.beyond_window += 1
+            return False
+        keys.insert(i, key)
+        return False
+
+    def _history(self, keys: array, timestamp: int, interval: int, count: int) -> list[bool]:
+        "Flag per record, True if it was not seen before."
+        self.history += 1
+        self.records += count
+        full = len(keys) >= self.size
+        new = [True] * count
+        for n in range(count):
+            second = timestamp + n * interval
+            key = (second << 32) | _HISTORY
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                self.records_seen += 1
+                new[n] = False
+                continue
+            if i == 0 and full:
+                self.beyond_window += 1
+                continue
+            # realtime keys of this second sort right after it
+            if i < len(keys) and keys[i] >> 32 == second:
+                self.records_realtime += 1
+            keys.insert(i, key)
+        return new
+
+    @property
+    def dropped(self) -> int:
+        "Frames dropped as duplicates."
+        return self.realtime_dropped + self.history_dropped
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "size":             self.size,
+            "devices":          len(self._keys),
+            "checked":          self.checked,
+            "dropped":          self.dropped,
+            "hit_rate":         round(self.dropped / self.checked, 4) if self.checked else 0.0,
+            "realtime":         self.realtime,
+            "realtime_dropped": self.realtime_dropped,
+            "history":          self.history,
+            "history_dropped":  self.history_dropped,
+            "records":          self.records,
+            "records_seen":     self.records_seen,
+            "records_realtime": self.records_realtime,
+            "beyond_window":    self.beyond_window,
+        }
@@ -0,0 +1,67 @@
+"Diagnostics download: config reports, values and recent samples, kept out of the status attributes."
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+
+from .const import DOMAIN
+from .hub import Qingping
+
+TO_REDACT = {CONF_PASSWORD, CONF_USERNAME}
+
+
+def device_diagnostics(qp: Qingping) -> dict[str, Any]:
+    "Summary, last config report, latest values and recent samples of one device."
+    return {
+        "status":  qp.status_summary(),
+        "duplicates": None if qp.hub.dedup is None else qp.hub.dedup.duplicates.get(qp.addr, 0),
+        "available": qp.available,
+        "sensors": {s: qp.getValue(s) for s, cfg in qp.sensors.items() if cfg.get('supported') and s != 'status'},
+        "info":    qp.info,
+        "data":    qp.state.as_dict(),
+        "history": qp.recent_samples(),
+    }
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    "Hub counters and every device."
+    hub = entry.runtime_data
+    return {
+        "entry": {
+            "data":    async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "hub": {
+            "connection": hub.connection_stats,
+            "queue":  hub.queue_stats,
+            "decode": hub.decode_stats,
+            "dedup":  hub.dedup_stats,
+            "profiles": hub.profile_stats,
+            "deadband": hub.deadband_stats,
+            "availability": hub.availability_stats,
+            "writes": hub.write_stats,
+            "history_import": hub.history_import_stats,
+            "history_log": hub.history_log_stats,
+            "metrics": hub.metrics_stats,
+            "capture": hub.capture_stats,
+            "configure": hub.configure_stats,
+        },
+        "devices": {addr: device_diagnostics(qp) for addr, qp in hub.devices.items()},
+    }
+
+
+async def async_get_device_diagnostics(hass: HomeAssistant, entry: ConfigEntry, device: dr.DeviceEntry) -> dict[str, Any]:
+    "One device."
+    hub = entry.runtime_data
+    # identifiers are (addr, DOMAIN), (entry_id, DOMAIN) for the hub device
+    for addr, domain in device.identifiers:
+        if domain == DOMAIN and addr in hub.devices:
+            return device_diagnostics(hub.devices[addr])
+        if domain == DOMAIN and addr == entry.entry_id:
+            return {"metrics": hub.metrics_stats}
+    return {}
@@ -0,0 +1,155 @@
+"History uploads (CG1/CGB) imported as hourly long-term statistics."
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.const import CONCENTRATION_PARTS_PER_MILLION, PERCENTAGE, UnitOfTemperature
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, HISTORY_IMPORT_INTERVAL, HISTORY_IMPORT_KEEP_HOURS
+from .utils import history
+
+try:
+    from homeassistant.components.recorder.models import StatisticMeanType
+except ImportError:  # before 2025.4 only has_mean exists
+    StatisticMeanType = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# record field -> unit, in the order of history.iter_records
+METRICS = (
+    ("temperature", UnitOfTemperature.CELSIUS),
+    ("humidity",    PERCENTAGE),
+    ("co2_ppm",     CONCENTRATION_PARTS_PER_MILLION),
+    ("battery",     PERCENTAGE),
+)
+
+
+def statistic_id(addr: str, metric: str) -> str:
+    "qingping_mqtt_parser:582d34000000_temperature"
+    return f"{DOMAIN}:{addr.lower()}_{metric}"
+
+
+def _metadata(addr: str, metric: str, unit) -> dict:
+    metadata = {
+        "has_mean":            True,
+        "has_sum":             False,
+        "name":                f"{addr} {metric}",
+        "source":              DOMAIN,
+        "statistic_id":        statistic_id(addr, metric),
+        "unit_of_measurement": unit,
+    }
+    if StatisticMeanType is not None:
+        metadata["mean_type"] = StatisticMeanType.ARITHMETIC
+    return metadata
+
+
+class HistoryImporter:
+    """Collects history records per device and imports them as statistics.
+
+    Records are deduplicated by timestamp, devices upload overlapping
+    ranges. Every interval the hours that got new records are recomputed
+    (mean/min/max over all records of the hour) and sent with one
+    async_add_external_statistics call per device and value. An hour is
+    only kept HISTORY_IMPORT_KEEP_HOURS behind the newest record of the
+    device, records older than that are dropped: their hour was already
+    imported and a partial re-import would overwrite it.
+    """
+
+    def __init__(self, hass: HomeAssistant, interval: float = HISTORY_IMPORT_INTERVAL) -> None:
+        "Init."
+        self._hass     = hass
+        self.interval  = interval
+        self._hours: dict[str, dict[int, dict]] = {}   # addr -> hour start -> {timestamp: record}
+        self._horizon: dict[str, int] = {}             # addr -> oldest hour still accepted
+        self._dirty: dict[str, set] = {}               # addr -> hours to import
+        self._timer: asyncio.TimerHandle | None = None
+
+        self.records    = 0
+        self.duplicates = 0
+        self.too_old    = 0
+        self.hours      = 0
+        self.calls      = 0
+
+    @callback
+    def add(self, addr: str, columns: history.HistoryColumns | None) -> int:
+        "Queue the records of one upload. Returns how many were new."
+        if columns is None:
+            return 0
+
+        hours   = self._hours.setdefault(addr, {})
+        horizon = self._horizon.get(addr, 0)
+        dirty   = None
+        new     = 0
+        for record in history.iter_records(columns):
+            ts = record[0]
+            hour = ts - ts % 3600
+            if hour < horizon:
+                self.too_old += 1
+                continue
+            bucket = hours.get(hour)
+            if bucket is None:
+                bucket = hours[hour] = {}
+            elif ts in bucket:
+                self.duplicates += 1
+                continue
+            bucket[ts] = record[1:]
+            if dirty is None:
+                dirty = self._dirty.setdefault(addr, set())
+            dirty.add(hour)
+            new += 1
+
+        self.records += new
+        if new and self._timer is None:
+            self._timer = self._hass.loop.call_later(self.interval, self.flush)
+        return new
+
+    @callback
+    def flush(self) -> None:
+        "Import every hour with new records now."
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        dirty, self._dirty = self._dirty, {}
+        for addr, hours in dirty.items():
+            buckets = self._hours[addr]
+            ordered = sorted(hours)
+            for n, (metric, unit) in enumerate(METRICS):
+                rows = []
+                for hour in ordered:
+                    values = [record[n] for record in buckets[hour].values()]
+                    rows.append({
+                        "start": dt_util.utc_from_timestamp(hour),
+                        "mean":  sum(values) / len(values),
+                        "min":   min(values),
+                        "max":   max(values),
+                    })
+                try:
+                    async_add_external_statistics(self._hass, _metadata(addr, metric, unit), rows)
+                    self.calls += 1
+                except Exception as e:  # noqa: BLE001
+                    _LOGGER.error(f"History import for {addr} {metric} failed: {e}")
+            self.hours += len(ordered)
+            self._prune(addr)
+
+    def _prune(self, addr: str) -> None:
+        buckets = self._hours[addr]
+        horizon = max(buckets) - HISTORY_IMPORT_KEEP_HOURS * 3600
+        for hour in [h for h in buckets if h < horizon]:
+            del buckets[hour]
+        self._horizon[addr] = max(self._horizon.get(addr, 0), horizon)
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "records":    self.records,
+            "duplicates": self.duplicates,
+            "too_old":    self.too_old,
+            "hours":      self.hours,
+            "calls":      self.calls,
+            "pending":    sum(len(h) for h in self._dirty.values()),
+        }
@@ -0,0 +1,315 @@
+"On-disk history: per-device append-only logs of history upload records, read through mmap."
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+
+from homeassistant.core import callback
+
+from .const import (
+    HISTORY_LOG_FLUSH_INTERVAL,
+    HISTORY_LOG_MAX_PENDING,
+    HISTORY_LOG_MAX_QUERY,
+    HISTORY_LOG_SWEEP_INTERVAL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# file header, then fixed-width records in timestamp order: u32 timestamp and
+# the 6 byte record of a 0x03 block (24 bit packed temperature/humidity,
+# u16 co2, u8 battery), as parse_real_sensor_data reads it
+MAGIC  = b"QPHLOG\x01\x00"
+RECORD = struct.Struct("<IHBHB")
+_BLOCK_HEADER = struct.Struct("<IH")
+_TIMESTAMP = struct.Struct("<I")
+_ADDR = re.compile(r"[0-9A-F]{1,32}")
+
+
+def decode_record(ts: int, th_lo: int, th_hi: int, co2_ppm: int, battery: int) -> dict:
+    "A RECORD as a sample, like parse_real_sensor_data."
+    combined = th_lo | (th_hi << 16)
+    return {
+        "timestamp":   ts,
+        "temperature": ((combined >> 12) - 500.0) / 10.0,
+        "humidity":    (combined & 0x000fff) / 10,
+        "co2_ppm":     co2_ppm,
+        "battery":     battery,
+    }
+
+
+def encode_block(block) -> bytes:
+    "Log records of a raw 0x03 block, record n at timestamp + n * update_interval."
+    timestamp, interval = _BLOCK_HEADER.unpack_from(block)
+    count = (len(block) - _BLOCK_HEADER.size) // 6
+    out = bytearray(count * RECORD.size)
+    for n in range(count):
+        _TIMESTAMP.pack_into(out, n * RECORD.size, timestamp + n * interval)
+        out[n * RECORD.size + 4:(n + 1) * RECORD.size] = block[6 + n * 6:12 + n * 6]
+    return bytes(out)
+
+
+class _Timestamps:
+    "Timestamps of the records in a mapped log, a sequence for bisect."
+
+    __slots__ = ("_buf", "_count")
+
+    def __init__(self, buf, count: int) -> None:
+        self._buf = buf
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> int:
+        return _TIMESTAMP.unpack_from(self._buf, len(MAGIC) + i * RECORD.size)[0]
+
+
+class HistoryLog:
+    """History upload records of each device in directory/<address>.bin.
+
+    add() only copies the 0x03 block on the event loop. Every
+    HISTORY_LOG_FLUSH_INTERVAL the buffered blocks go to a single writer
+    thread as one batch. Records are appended in timestamp order: those
+    not newer than the last one of the file (overlapping uploads) or
+    already older than retention are skipped. A file that grows past
+    max_bytes is compacted to half of it, oldest records first, and every
+    HISTORY_LOG_SWEEP_INTERVAL records older than retention seconds are
+    dropped. Compaction writes a new file and replaces the old one.
+
+    Queries run on the writer thread too, after everything added before
+    them: the file is mapped and the range found by binary search over the
+    timestamps, only the records in it are read.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, directory: str, retention: float, max_bytes: int) -> None:
+        "Init."
+        self._loop      = loop
+        self.directory  = directory
+        self.retention  = retention
+        self.max_bytes  = max(max_bytes, len(MAGIC) + 2 * RECORD.size)
+        self._buffer: list[tuple[str, bytes]] = []
+        self._buffered  = 0
+        self._writing   = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._sweep_timer: asyncio.TimerHandle | None = None
+        self._executor  = ThreadPoolExecutor(1, thread_name_prefix="qingping_history")
+        self._last: dict[str, int] = {}   # writer thread: address -> last timestamp in its file
+
+        self.blocks      = 0
+        self.records     = 0
+        self.skipped     = 0
+        self.dropped     = 0
+        self.batches     = 0
+        self.compactions = 0
+        self.removed     = 0
+        self.queries     = 0
+
+    def start(self) -> None:
+        "Start the retention sweeps, the first one right away."
+        self._sweep_timer = self._loop.call_soon(self._sweep)
+
+    def path(self, addr: str) -> str | None:
+        "Log file of addr, None if addr is not a device address."
+        addr = addr.upper()
+        return os.path.join(self.directory, f"{addr}.bin") if _ADDR.fullmatch(addr) else None
+
+    @callback
+    def add(self, addr: str, block) -> None:
+        "Buffer the records of a 0x03 block of addr."
+        if block is None or len(block) < _BLOCK_HEADER.size + 6 or self.path(addr) is None:
+            return
+        if self._buffered + self._writing > HISTORY_LOG_MAX_PENDING:
+            self.dropped += 1
+            return
+        data = bytes(block)
+        self._buffer.append((addr.upper(), data))
+        self._buffered += len(data)
+        self.blocks += 1
+        if self._timer is None:
+            self._timer = self._loop.call_later(HISTORY_LOG_FLUSH_INTERVAL, self._flush)
+
+    @callback
+    def _flush(self) -> None:
+        self._timer = None
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        size, self._buffered = self._buffered, 0
+        self._writing += size
+        self.batches += 1
+        fut = self._loop.run_in_executor(self._executor, self._write, batch)
+        fut.add_done_callback(lambda f, size=size: self._written(f, size))
+
+    def _written(self, fut: asyncio.Future, size: int) -> None:
+        self._writing -= size
+        if not fut.cancelled() and fut.exception() is not None:
+            _LOGGER.error(f"History log write to {self.directory} failed: {fut.exception()!r}")
+
+    def _write(self, batch: list[tuple[str, bytes]]) -> None:
+        "Writer thread."
+        os.makedirs(self.directory, exist_ok=True)
+        blocks: dict[str, list[bytes]] = {}
+        for addr, block in batch:
+            blocks.setdefault(addr, []).append(block)
+        for addr, device_blocks in blocks.items():
+            self._append(addr, device_blocks)
+
+    def _append(self, addr: str, blocks: list[bytes]) -> None:
+        "Writer thread."
+        path = self.path(addr)
+        with open(path, "ab+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size < len(MAGIC):
+                f.truncate(0)
+                f.write(MAGIC)
+                size = len(MAGIC)
+                self._last[addr] = -1
+            elif (size - len(MAGIC)) % RECORD.size:
+                # a record cut short by a crash
+                size -= (size - len(MAGIC)) % RECORD.size
+                f.truncate(size)
+                self._last.pop(addr, None)
+            last = self._last.get(addr)
+            if last is None:
+                last = -1
+                if size > len(MAGIC):
+                    f.seek(size - RECORD.size)
+                    last = _TIMESTAMP.unpack(f.read(4))[0]
+
+            # nothing the next sweep would remove
+            last = max(last, int(time.time() - self.retention) - 1)
+            out = bytearray()
+            for block in blocks:
+                records = encode_block(block)
+                for offset in range(0, len(records), RECORD.size):
+                    ts = _TIMESTAMP.unpack_from(records, offset)[0]
+                    if ts <= last:
+                        self.skipped += 1
+                        continue
+                    out += records[offset:offset + RECORD.size]
+                    last = ts
+            if out:
+                f.seek(0, os.SEEK_END)
+                f.write(out)
+                size += len(out)
+                self.records += len(out) // RECORD.size
+            self._last[addr] = last
+
+        if size > self.max_bytes:
+            self._compact(path, keep=(self.max_bytes // 2 - len(MAGIC)) // RECORD.size)
+
+    def _compact(self, path: str, keep: int | None = None, before: float | None = None) -> None:
+        """Writer thread. Rewrite path without the records older than before
+        and, with keep, all but the newest keep records."""
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            count = (size - len(MAGIC)) // RECORD.size
+            if count <= 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                first = 0 if before is None else bisect_left(_Timestamps(mm, count), before)
+                if keep is not None:
+                    first = max(first, count - keep)
+                if first == 0:
+                    return
+                tmp = f"{path}.tmp"
+                with open(tmp, "wb") as out:
+                    out.write(MAGIC)
+                    out.write(mm[len(MAGIC) + first * RECORD.size:len(MAGIC) + count * RECORD.size])
+        os.replace(tmp, path)
+        self.compactions += 1
+        self.removed += first
+
+    def _expire(self, before: float) -> None:
+        "Writer thread. Drop records older than before from every log."
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                f.seek(len(MAGIC))
+                head = f.read(4)
+            if len(head) == 4 and _TIMESTAMP.unpack(head)[0] < before:
+                self._compact(path, before=before)
+
+    @callback
+    def _sweep(self) -> None:
+        self._sweep_timer = self._loop.call_later(HISTORY_LOG_SWEEP_INTERVAL, self._sweep)
+        fut = self._loop.run_in_executor(self._executor, self._expire, time.time() - self.retention)
+        fut.add_done_callback(self._swept)
+
+    def _swept(self, fut: asyncio.Future) -> None:
+        if not fut.cancelled() and fut.exception() is not None:
+            _LOGGER.error(f"History log retention in {self.directory} failed: {fut.exception()!r}")
+
+    def _query(self, addr: str, start: int, end: int) -> tuple[list[dict], bool]:
+        "Writer thread."
+        path = self.path(addr)
+        if path is None:
+            return [], False
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return [], False
+        with f:
+            count = (os.fstat(f.fileno()).st_size - len(MAGIC)) // RECORD.size
+            if count <= 0:
+                return [], False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                timestamps = _Timestamps(mm, count)
+                lo = bisect_left(timestamps, start)
+                hi = bisect_right(timestamps, end, lo)
+                truncated = hi - lo > HISTORY_LOG_MAX_QUERY
+                hi = min(hi, lo + HISTORY_LOG_MAX_QUERY)
+                return [
+                    decode_record(*RECORD.unpack_from(mm, len(MAGIC) + i * RECORD.size))
+                    for i in range(lo, hi)
+                ], truncated
+
+    async def async_query(self, addr: str, start: int, end: int) -> tuple[list[dict], bool]:
+        """Samples of addr with start <= timestamp <= end, oldest first, and
+        whether there were more than HISTORY_LOG_MAX_QUERY."""
+        self.queries += 1
+        if self._timer is not None:
+            self._timer.cancel()
+        self._flush()
+        return await self._loop.run_in_executor(self._executor, self._query, addr, start, end)
+
+    async def async_stop(self) -> None:
+        "Write what is buffered and stop."
+        for timer in (self._timer, self._sweep_timer):
+            if timer is not None:
+                timer.cancel()
+        self._sweep_timer = None
+        self._flush()
+        # the writer thread runs jobs in order, the flush above is done first
+        await self._loop.run_in_executor(self._executor, lambda: None)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "directory":   self.directory,
+            "retention":   self.retention,
+            "max_bytes":   self.max_bytes,
+            "blocks":      self.blocks,
+            "records":     self.records,
+            "skipped":     self.skipped,
+            "pending":     self._buffered + self._writing,
+            "dropped":     self.dropped,
+            "batches":     self.batches,
+            "compactions": self.compactions,
+            "removed":     self.removed,
+            "queries":     self.queries,
+        }
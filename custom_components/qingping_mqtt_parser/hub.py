@@ -2,18 +2,81 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
+import time
 from typing import Callable
 
 import aiomqtt
 
-from homeassistant.components.sensor import SensorDeviceClass
 from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_PORT, CONF_USERNAME
 from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.helpers import device_registry as dr
-
-from . import decode_mqqt_message
-from .const import DOMAIN, PLATFORMS
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from . import (
+    availability,
+    capture,
+    configure,
+    connection,
+    deadband,
+    decode_mqqt_message,
+    dedup,
+    history_import,
+    history_log,
+    pipeline,
+    profiles,
+    state,
+)
+from .const import (
+    CAPTURE_MAX_SIZE,
+    CONF_DECODE_OFFLOAD,
+    CONF_DECODE_OFFLOAD_THRESHOLD,
+    CONF_DEDUP,
+    CONF_DEVICE_FILTER,
+    CONF_HISTORY_LOG,
+    CONF_HISTORY_LOG_MAX_SIZE,
+    CONF_HISTORY_LOG_RETENTION,
+    CONF_HISTORY_STATISTICS,
+    CONF_METRICS,
+    CONF_QUEUE_OVERFLOW,
+    CONF_QUEUE_SIZE,
+    CONF_QUEUE_WORKERS,
+    CONF_STATUS_ATTRIBUTES,
+    CONF_TRANSPORT,
+    CONF_UNAVAILABLE_AFTER,
+    CONF_WRITE_BUDGET,
+    CONF_WRITE_WINDOW,
+    DEFAULT_DECODE_OFFLOAD,
+    DEFAULT_DECODE_OFFLOAD_THRESHOLD,
+    DEFAULT_DEDUP,
+    DEFAULT_HISTORY_LOG,
+    DEFAULT_HISTORY_LOG_MAX_SIZE,
+    DEFAULT_HISTORY_LOG_RETENTION,
+    DEFAULT_HISTORY_STATISTICS,
+    DEFAULT_METRICS,
+    DEFAULT_QUEUE_OVERFLOW,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_QUEUE_WORKERS,
+    DEFAULT_STATUS_ATTRIBUTES,
+    DEFAULT_TRANSPORT,
+    DEFAULT_UNAVAILABLE_AFTER,
+    DEFAULT_WRITE_BUDGET,
+    DEFAULT_WRITE_WINDOW,
+    DOMAIN,
+    METRICS_UPDATE_INTERVAL,
+    PLATFORMS,
+    RECENT_SAMPLES,
+    STATUS_ATTRIBUTES_MAX_SIZE,
+    STATUS_HISTORY_UPLOADS,
+    STORAGE_SAVE_DELAY,
+    STORAGE_VERSION,
+    TRANSPORT_HOMEASSISTANT,
+)
+from .metrics import HubMetrics, frame_type
+from .transport import HomeAssistantMqttTransport
+from .utils import encoder
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -32,94 +95,338 @@ async def TestConnection(host, port:int, user, pwd):
     except:
         return False
 
+def device_store(hass: HomeAssistant, entry_id: str) -> Store:
+    "Cache of the known devices of an entry."
+    return Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}")
+
+
+def parse_device_filter(text: str) -> frozenset:
+    "'582D34000001, 582d34000002' -> {'582D34000001', '582D34000002'}"
+    return frozenset(a.strip().upper() for a in text.replace(';', ',').split(',') if a.strip())
+
+
+class WriteScheduler:
+    """Coalesces entity state writes.
+
+    Changed sensors are collected per device and written together once per
+    window, so a device that reports several times within the window gets
+    one write per sensor with the newest value. With a budget, writes are
+    limited to budget writes/sec for all devices together: a flush writes
+    at most one window (at least 0.1 s) worth of budget and leaves the rest
+    pending for the next flush, oldest devices first. With metrics, the
+    time from the first schedule of a device to its write is recorded.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, window: float, budget: float = 0,
+                 metrics: HubMetrics | None = None) -> None:
+        "Init."
+        self._loop    = loop
+        self.window   = max(0.0, window)
+        self.budget   = max(0.0, budget)
+        self.metrics  = metrics
+        self._burst   = self.budget * max(self.window, 0.1)
+        self._pending: dict[Qingping, set] = {}
+        self._since: dict[Qingping, float] = {}   # only with metrics
+        self._timer: asyncio.TimerHandle | None = None
+        self._tokens  = self._burst
+        self._refill  = loop.time()
+
+        self.scheduled = 0
+        self.coalesced = 0
+        self.written   = 0
+        self.deferred  = 0
+        self.flushes   = 0
+
+    @callback
+    def schedule(self, qp: Qingping, changed: set) -> None:
+        "Write changed sensors of qp at the next flush."
+        self.scheduled += 1
+        pending = self._pending.get(qp)
+        if pending is None:
+            self._pending[qp] = set(changed)
+            if self.metrics is not None:
+                self._since[qp] = self.metrics.clock()
+        else:
+            self.coalesced += 1
+            pending |= changed
+
+        if self._timer is None:
+            self._timer = self._loop.call_later(self.window, self._flush)
+
+    @callback
+    def _flush(self) -> None:
+        self._timer = None
+        self.flushes += 1
+
+        if self.budget:
+            now = self._loop.time()
+            self._tokens = min(self._burst, self._tokens + (now - self._refill) * self.budget)
+            self._refill = now
+
+        pending = self._pending
+        delay = self.window
+        while pending:
+            qp = next(iter(pending))
+            changed = pending[qp]
+            if self.budget:
+                cost = qp.callback_count(changed)
+                # wait for tokens, unless the bucket is full: a device that
+                # costs more than a full bucket still has to go through
+                if cost > self._tokens and self._tokens < self._burst:
+                    delay = max(delay, (min(cost, self._burst) - self._tokens) / self.budget)
+                    break
+                self._tokens -= cost
+            del pending[qp]
+            self.written += qp.async_publish(changed)
+            if self.metrics is not None:
+                self.metrics.update_write.observe((self.metrics.clock() - self._since.pop(qp)) * 1000)
+
+        if pending:
+            self.deferred += len(pending)
+            self._timer = self._loop.call_later(delay, self._flush)
+
+    @callback
+    def cancel(self) -> None:
+        "Drop pending writes."
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending.clear()
+        self._since.clear()
+
+    @property
+    def pending(self) -> int:
+        "Devices waiting for a write."
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "window":    self.window,
+            "budget":    self.budget,
+            "pending":   self.pending,
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "written":   self.written,
+            "deferred":  self.deferred,
+            "flushes":   self.flushes,
+        }
+
+
 class Hub:
     """Dummy hub for Hello World example."""
 
     def __init__(self, hass: HomeAssistant, entry_data, config_entry) -> None:
         """Init hub."""
-        self._host = entry_data[CONF_HOST]
-        self._port = int(entry_data[CONF_PORT])
-        self._user = entry_data[CONF_USERNAME]
-        self._pass = entry_data[CONF_PASSWORD]
+        self._host = entry_data.get(CONF_HOST, "")
+        self._port = int(entry_data.get(CONF_PORT) or 1883)
+        self._user = entry_data.get(CONF_USERNAME, "")
+        self._pass = entry_data.get(CONF_PASSWORD, "")
         self._hass = hass
         self._name = self._host
         self._id = self._host.lower()
         self.devices = {}
         self.config_entry = config_entry
         self.online = True
-        self.unloading = False
+        self._platforms_forwarded = False
 
         self._listeners: dict[int, tuple[CALLBACK_TYPE, object | None]] = {}
         self._last_listener_id: int = 0
+        self._new_devices: list[Qingping] = []   # waiting for their entities
+
+        options = config_entry.options
+
+        # stage latencies and counters, None keeps the hot path free of them
+        self.metrics = HubMetrics() if options.get(CONF_METRICS, DEFAULT_METRICS) else None
+        self._metrics_callbacks: set[Callable[[], None]] = set()
+        self._metrics_timer: asyncio.TimerHandle | None = None
+
+        # receiver only queues, workers run parse_message
+        self.queue = pipeline.DeviceWorkQueue(
+            self.parse_message,
+            maxsize  = int(options.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE)),
+            overflow = options.get(CONF_QUEUE_OVERFLOW, DEFAULT_QUEUE_OVERFLOW),
+            workers  = int(options.get(CONF_QUEUE_WORKERS, DEFAULT_QUEUE_WORKERS)),
+            clock    = None if self.metrics is None else self.metrics.clock,
+        )
+        self.queue.start(
+            lambda coro, name: config_entry.async_create_background_task(hass, coro, name)
+        )
 
-        self.looptask = hass.async_create_task(
-            self.task_on_mqtt_message()
+        # large frames can be decoded off the event loop
+        self.decoder = decode_mqqt_message.DecodeOffloader(
+            mode      = options.get(CONF_DECODE_OFFLOAD, DEFAULT_DECODE_OFFLOAD),
+            threshold = int(options.get(CONF_DECODE_OFFLOAD_THRESHOLD, DEFAULT_DECODE_OFFLOAD_THRESHOLD)),
         )
 
-    async def task_stop(self):
-        _LOGGER.debug("Start task stopping ...")
+        # addresses this entry handles, empty for all the other entries don't
+        self.device_filter = parse_device_filter(options.get(CONF_DEVICE_FILTER, ""))
 
-        self.unloading = True
-        await self.client.__aexit__(None, None, None)
-        await asyncio.sleep(5)
-        self.looptask.cancel()
+        self.status_attributes = options.get(CONF_STATUS_ATTRIBUTES, DEFAULT_STATUS_ATTRIBUTES)
 
-        try:
-            _LOGGER.debug("Waiting for task_stop")
-            await self.looptask
-            _LOGGER.debug("Stopped")
-        except asyncio.CancelledError:
-            _LOGGER.error("Task Stop Error ...")
-
-    async def task_on_mqtt_message(self):
-        "Parse device sensors."
-        interval = 15  # Seconds
-        topic    = "qingping/+/up"
-        client   = aiomqtt.Client(
-                hostname = self._host,
-                port     = self._port,
-                username = self._user,
-                password = self._pass)
-
-        self.client = client
-
-        while not self.unloading:
-            #_LOGGER.debug("Start new Loop ...")
-            try:
-                async with client:
-                    _LOGGER.info(f"Connected to MQTT Server")
+        # redelivered and overlapping frames are dropped before they are decoded, None keeps them
+        self.dedup = dedup.DedupIndex() if options.get(CONF_DEDUP, DEFAULT_DEDUP) else None
 
-                    await client.subscribe(topic)
+        # sensors and decoders per kind of device, shared by its devices
+        self.profiles = profiles.ProfileRegistry()
 
-                    _LOGGER.debug(f"Subscribed to {topic}")
+        # jitter is not written, None when no sensor has a deadband
+        self.deadband = deadband.DeadbandFilter.from_options(options)
 
-                    async for message in client.messages:
-                        await self.parse_message(message)
-            except aiomqtt.MqttError:
-                if not self.unloading:
-                    _LOGGER.error(f"Connection lost; Reconnecting in {interval} seconds ...")
-                    await asyncio.sleep(interval)
+        # history uploads go to long-term statistics, needs the recorder
+        self.history_import = None
+        if options.get(CONF_HISTORY_STATISTICS, DEFAULT_HISTORY_STATISTICS):
+            if "recorder" in hass.config.components:
+                self.history_import = history_import.HistoryImporter(hass)
+            else:
+                _LOGGER.info("Recorder not loaded, history uploads are not imported as statistics")
+
+        # history upload records kept on disk for the get_history service
+        self.history_log = None
+        if options.get(CONF_HISTORY_LOG, DEFAULT_HISTORY_LOG):
+            self.history_log = history_log.HistoryLog(
+                hass.loop,
+                hass.config.path(DOMAIN, "history"),
+                retention = int(options.get(CONF_HISTORY_LOG_RETENTION, DEFAULT_HISTORY_LOG_RETENTION)) * 86400,
+                max_bytes = int(options.get(CONF_HISTORY_LOG_MAX_SIZE, DEFAULT_HISTORY_LOG_MAX_SIZE)) * 1024 * 1024,
+            )
+
+        # state writes are merged per device and paced for the whole fleet
+        self.writer = WriteScheduler(
+            hass.loop,
+            window = float(options.get(CONF_WRITE_WINDOW, DEFAULT_WRITE_WINDOW)),
+            budget = float(options.get(CONF_WRITE_BUDGET, DEFAULT_WRITE_BUDGET)),
+            metrics = self.metrics,
+        )
 
-        _LOGGER.debug("Loop stopped")
+        # devices that stopped reporting go unavailable, None keeps them available
+        self.availability = None
+        missed = int(options.get(CONF_UNAVAILABLE_AFTER, DEFAULT_UNAVAILABLE_AFTER))
+        if missed:
+            self.availability = availability.AvailabilityTracker(hass.loop, self._availability_changed, missed)
 
-        return True
+        # known devices survive restarts
+        self._store = device_store(hass, config_entry.entry_id)
 
-    async def parse_message(self, message):
-        "Parse MQTT Message."
+        self.transport  = entry_data.get(CONF_TRANSPORT, DEFAULT_TRANSPORT)
+        self.connection = None
+
+        # configuration frames to devices, paced
+        self.configurer = configure.ConfigPublisher(
+            self._publish,
+            lambda coro, name: config_entry.async_create_background_task(hass, coro, name),
+        )
+
+        # raw frames recorded for replay, started by the start_capture service
+        self.capture: capture.CaptureRecorder | None = None
+        self.capture_path = hass.config.path(DOMAIN, f"capture_{config_entry.entry_id}.bin")
+
+    async def async_setup(self) -> None:
+        """Restore cached devices, then start receiving.
+
+        Raises ConfigEntryNotReady while the MQTT integration a homeassistant
+        transport needs is not set up, before any platform is.
+        """
+        if self.transport == TRANSPORT_HOMEASSISTANT:
+            await HomeAssistantMqttTransport.async_wait_ready(self._hass)
+
+        cached = await self._store.async_load() or {}
+        for addr, device in cached.get("devices", {}).items():
+            try:
+                qp = self.devices[addr] = Qingping.from_cache(self, addr, device)
+                if self.availability is not None:
+                    age = time.time() - qp.last_seen if qp.last_seen else 0.0
+                    self.availability.restore(qp, age)
+            except Exception as e:  # noqa: BLE001
+                _LOGGER.warning(f"Ignoring cached device {addr}: {e!r}")
+
+        if self.metrics is not None:
+            # the hub device carries the metrics sensors
+            dr.async_get(self._hass).async_get_or_create(
+                config_entry_id = self.config_entry.entry_id,
+                identifiers     = {(self.config_entry.entry_id, DOMAIN)},
+                manufacturer    = "Qingping",
+                name            = f"Qingping hub {self.config_entry.title}",
+                model           = "MQTT hub",
+            )
+            self._metrics_timer = self._hass.loop.call_later(METRICS_UPDATE_INTERVAL, self._metrics_update)
+
+        if self.history_log is not None:
+            self.history_log.start()
+
+        if self.devices or self.metrics is not None:
+            # entities are there before the devices report again
+            _LOGGER.debug(f"Restored {len(self.devices)} devices")
+            self._platforms_forwarded = True
+            await self._hass.config_entries.async_forward_entry_setups(self.config_entry, PLATFORMS)
+
+        # one client per broker, shared with other entries
+        self.connection = connection.acquire(self._hass, self, self.transport, self._host, self._port, self._user, self._pass)
+
+    @callback
+    def _cache_data(self) -> dict:
+        return {"devices": {addr: qp.as_cache() for addr, qp in self.devices.items()}}
+
+    @callback
+    def schedule_save(self) -> None:
+        "Save the device cache in a while, calls in between are merged."
+        self._store.async_delay_save(self._cache_data, STORAGE_SAVE_DELAY)
+
+    async def task_stop(self):
+        "Leave the shared connection and stop processing."
+        await self.configurer.async_stop()
+        if self.connection is not None:
+            await connection.release(self._hass, self, self.connection)
+
+        await self.queue.stop()
+        self.decoder.shutdown()
+        self.writer.cancel()
+        if self.availability is not None:
+            self.availability.cancel()
+        if self._metrics_timer is not None:
+            self._metrics_timer.cancel()
+            self._metrics_timer = None
+        await self.async_stop_capture()
+        if self.history_import is not None:
+            self.history_import.flush()
+        if self.history_log is not None:
+            await self.history_log.async_stop()
+        await self._store.async_save(self._cache_data())
+
+    async def parse_message(self, message, received=None):
+        "Parse MQTT Message. received is the metrics clock when it was queued."
+        metrics = self.metrics
+        r = False
         try:
             _LOGGER.debug(f"Received MQTT message on topic: {message.topic}")
-            r = decode_mqqt_message.decode(message.topic, message.payload)
+            r = await self.decoder.decode(message.topic, message.payload)
+            if metrics is not None:
+                decoded = metrics.clock()
+                if received is not None:
+                    metrics.receive_decode.observe((decoded - received) * 1000)
+                if r:
+                    metrics.frame(r['data'])
+                else:
+                    metrics.error(frame_type(message.payload))
             if r:
-                _LOGGER.debug(f"Decoded MQTT message: {r}")
+                _LOGGER.debug("Decoded MQTT message: %s", r)
                 a = r['addr']
-                if a not in self.devices:
-                    # skip no data messages
-                    if 'firmware_version' not in r['data']:
+                # skip no data messages
+                if a not in self.devices and 'firmware_version' not in r['data']:
+                    return True
+
+                new_records = None
+                if self.dedup is not None:
+                    duplicate, new_records = self.dedup.check(a, r['data'])
+                    if duplicate:
+                        _LOGGER.debug(f"Duplicate frame from {a} dropped")
                         return True
 
+                if a not in self.devices:
                     _LOGGER.debug(f"Creating new Qingping device for address: {a}")
                     qp =Qingping(self, r['addr'], r['data'])
                     self.devices[a] = qp
+                    self.schedule_save()
 
                     _LOGGER.debug(f"Creating device {qp.id} in Home Assistant.")
                     device_registry = dr.async_get(self._hass)
@@ -136,23 +443,154 @@ class Hub:
                     )
 
                     # HA Do not support runtime reconfig. So Uplaod everything and start again
-                    if len(self.devices)>1:
-                        _LOGGER.debug("async_update_listeners")
-                        self.async_update_listeners()
+                    # Workers run in parallel, so the next device can show up
+                    # while platforms are still being set up. Those are picked
+                    # up by the platform setup itself.
+                    if self._platforms_forwarded:
+                        self._queue_new_device(qp)
                     else:
                         _LOGGER.debug("async_forward_entry_setups")
+                        self._platforms_forwarded = True
                         await self._hass.config_entries.async_forward_entry_setups(self.config_entry, PLATFORMS)
                 else:
                     qp = self.devices[a]
-                    qp.update_from_mqtt(r['data'])
-                    if qp.ready:
-                        await qp.publish_updates()
+                    changed = qp.update_from_mqtt(r['data'], new_records)
+                    if qp.ready and changed:
+                        self.writer.schedule(qp, changed)
+                        self.schedule_save()
+                    if metrics is not None:
+                        metrics.decode_update.observe((metrics.clock() - decoded) * 1000)
 
         except Exception as e:  # noqa: BLE001
             _LOGGER.error(f"Parse_message Error: {str(e)}")
+            if metrics is not None:
+                metrics.error(r['data']['cmd'] if r else frame_type(message.payload))
 
         return True
 
+    @callback
+    def _availability_changed(self, qp: Qingping) -> None:
+        "Write the entities of qp, and only those, with their new availability."
+        _LOGGER.info(f"Device {qp.addr} is {'available' if qp.available else 'unavailable'}")
+        if qp.ready:
+            self.writer.schedule(qp, qp.entity_sensors())
+
+    async def _publish(self, topic: str, payload: bytes) -> None:
+        await self.connection.async_publish(topic, payload)
+
+    @callback
+    def async_configure(self, addrs, values: dict) -> bytes:
+        """Send a 0x32 configuration frame with values (see encoder.encode_config) to each of addrs.
+
+        Frames go out at CONFIGURE_RATE per second. Returns the frame.
+        """
+        payload = encoder.encode_config(values)
+        for addr in addrs:
+            self.configurer.configure(addr, payload)
+        return payload
+
+    async def async_start_capture(self, devices=(), max_size: int = CAPTURE_MAX_SIZE) -> None:
+        "Record received frames of devices (all when empty) to capture_path, max_size MB per file."
+        await self.async_stop_capture()
+        self.capture = capture.CaptureRecorder(
+            self._hass.loop,
+            self.capture_path,
+            max_bytes = max_size * 1024 * 1024,
+            devices   = parse_device_filter(",".join(devices)),
+        )
+        _LOGGER.info(f"Capturing {', '.join(sorted(self.capture.devices)) or 'all devices'} to {self.capture_path}")
+
+    async def async_get_history(self, addr: str, start: int, end: int) -> tuple[list[dict], bool]:
+        "Logged samples of addr between the unix times start and end, and whether more were left out."
+        return await self.history_log.async_query(addr, start, end)
+
+    async def async_stop_capture(self) -> None:
+        "Write what is left and stop recording."
+        recorder, self.capture = self.capture, None
+        if recorder is not None:
+            await recorder.async_stop()
+            _LOGGER.info(f"Capture stopped, {recorder.records} frames recorded to {recorder.path}")
+
+    @property
+    def queue_stats(self) -> dict:
+        "Receive queue depth and drop counters."
+        return self.queue.stats()
+
+    @property
+    def decode_stats(self) -> dict:
+        "Inline and offloaded decode counters."
+        return self.decoder.stats()
+
+    @property
+    def write_stats(self) -> dict:
+        "Coalesced and deferred state write counters."
+        return self.writer.stats()
+
+    @property
+    def connection_stats(self) -> dict:
+        "Shared MQTT connection counters, empty before the hub is connected."
+        return {} if self.connection is None else self.connection.stats()
+
+    @property
+    def history_import_stats(self) -> dict | None:
+        "Imported history records and statistics calls, None when disabled."
+        return None if self.history_import is None else self.history_import.stats()
+
+    @property
+    def deadband_stats(self) -> dict | None:
+        "Changes passed and filtered per sensor, None when off."
+        return None if self.deadband is None else self.deadband.stats()
+
+    @property
+    def history_log_stats(self) -> dict | None:
+        "Logged history records and compactions, None when disabled."
+        return None if self.history_log is None else self.history_log.stats()
+
+    @property
+    def availability_stats(self) -> dict | None:
+        "Tracked and unavailable devices, None when off."
+        return None if self.availability is None else self.availability.stats()
+
+    @property
+    def profile_stats(self) -> dict:
+        "Product profiles and the devices using them."
+        return self.profiles.stats()
+
+    @property
+    def dedup_stats(self) -> dict | None:
+        "Duplicate frames dropped and hit rate, None when off."
+        return None if self.dedup is None else self.dedup.stats()
+
+    @property
+    def configure_stats(self) -> dict:
+        "Configuration frames queued and sent."
+        return self.configurer.stats()
+
+    @property
+    def capture_stats(self) -> dict | None:
+        "Capture counters, None when not capturing."
+        return None if self.capture is None else self.capture.stats()
+
+    @property
+    def metrics_stats(self) -> dict | None:
+        "Stage latencies, throughput and error counters, None when disabled."
+        return None if self.metrics is None else self.metrics.stats()
+
+    @callback
+    def _metrics_update(self) -> None:
+        self.metrics.sample()
+        for write in list(self._metrics_callbacks):
+            write()
+        self._metrics_timer = self._hass.loop.call_later(METRICS_UPDATE_INTERVAL, self._metrics_update)
+
+    def register_metrics_callback(self, callback: Callable[[], None]) -> None:
+        "Register callback, called every METRICS_UPDATE_INTERVAL."
+        self._metrics_callbacks.add(callback)
+
+    def remove_metrics_callback(self, callback: Callable[[], None]) -> None:
+        "Remove previously registered callback."
+        self._metrics_callbacks.discard(callback)
+
     @callback
     def async_add_listener(self, update_callback, context=None):
         "Callback to register callback to add new devices."
@@ -162,64 +600,131 @@ class Hub:
         self._listeners[self._last_listener_id] = (update_callback, context)
 
     @callback
-    def async_update_listeners(self) -> None:
-        """Update all registered listeners."""
-        _LOGGER.debug('async_update_listeners')
+    def _queue_new_device(self, qp: Qingping) -> None:
+        "Entities of qp are added with the other devices found in this loop iteration."
+        self._new_devices.append(qp)
+        if len(self._new_devices) == 1:
+            self._hass.loop.call_soon(self._add_new_devices)
+
+    @callback
+    def _add_new_devices(self) -> None:
+        devices, self._new_devices = self._new_devices, []
+        self.async_update_listeners(devices)
+
+    @callback
+    def async_update_listeners(self, devices) -> None:
+        """Pass new devices to all registered listeners."""
+        _LOGGER.debug('async_update_listeners: %s new devices', len(devices))
 
         for update_callback, _ in list(self._listeners.values()):
-            update_callback()
+            update_callback(devices)
 
     @property
     def hub_id(self) -> str:
         """ID for dummy hub."""
-        print(f"hub_id {self._id}")
         return self._id
 
     async def test_connection(self) -> bool:
         """Test connectivity to the Dummy hub is OK."""
         await asyncio.sleep(1)
-        print("test_connection")
+        _LOGGER.debug("test_connection")
 
         return True
 
 
 class Qingping:
-    """CGP22C."""
-
-    def __init__(self, hub: Hub, addr: str, data) -> None:
-        "Init."
+    """CGP22C.
+
+    Bounded memory per device: the latest values in a DeviceState, recent
+    samples in a SampleRing, the config report as a plain dict, and the
+    sensor table shared with the devices of its profile. Frames are not
+    kept.
+    """
+
+    __slots__ = (
+        "addr", "hub", "name", "_callbacks", "_published", "_written_at", "available",
+        "last_seen", "frame_counts", "history_uploads", "_status_attributes",
+        "info", "state", "samples", "sensors_created", "profile", "sensors",
+    )
+
+    def __init__(self, hub: Hub, addr: str, data=None) -> None:
+        "Init. Without data the device comes from the cache, see from_cache."
         self.addr  = addr
         self.hub   = hub
         self.name  = addr
-        self._callbacks = set()
-
-        self.info = False #General Info
-        self.data = False #Sensors Data
-        self.history_data   = {}
-        self.history_index  = 0
-        self.history_last_index = 0
-        self.history_max        = 10
+        self._callbacks: dict[str, tuple] = {}   # sensor name -> write callbacks
+        self._published = state.DeviceState()    # last values written
+        self._written_at = None if hub.deadband is None else {}  # sensor name -> deadband clock of the last change
+        self.available = True                    # cleared by the availability tracker
+
+        # summaries for the compact status attributes
+        self.last_seen    = None                 # time.time() of the last frame
+        self.frame_counts = {}                   # cmd -> frames received
+        self.history_uploads = state.SampleRing(STATUS_HISTORY_UPLOADS, 2, "I")  # (timestamp, records)
+        self._status_attributes = None
+
+        self.info = False                        # last config report, plain dict
+        self.state = state.DeviceState()         # values of the last data frame, or of the cache
+        self.samples = state.SampleRing(RECENT_SAMPLES, len(state.SAMPLE_FIELDS))  # data frames and history records
         self.sensors_created    = False
-        self.sensors = {
-            'battery'             : {'dc': SensorDeviceClass.BATTERY},
-            'temperature'         : {'dc': SensorDeviceClass.TEMPERATURE},
-            'humidity'            : {'dc': SensorDeviceClass.HUMIDITY},
-            'co2_ppm'             : {'dc': SensorDeviceClass.CO2},
-            'co2IsBeingCalibrated': {'diagnostic': True},
-            'isPluggedInToPower'  : {'diagnostic': True},
-            'status'              : {'diagnostic': True}
-        }
+        self.profile  = hub.profiles.status_only
+        self.sensors  = self.profile.sensors   # shared with the devices of the profile, read only
 
+        if data is None:
+            return
+
+        # the sensors come from the profile of the device, not from probing data
+        self.profile = hub.profiles.lookup(data)
+        self.sensors = self.profile.sensors
         self.update_from_mqtt(data)
 
-        for s in self.sensors:
-            self.sensors[s]['supported'] = self.getValue(s) is not None
+    @classmethod
+    def from_cache(cls, hub: Hub, addr: str, cached: dict) -> Qingping:
+        "Device restored from as_cache()."
+        qp = cls(hub, addr)
+        qp.profile = hub.profiles.restored(cached['supported'])
+        qp.sensors = qp.profile.sensors
+
+        qp.info = cached.get('info') or False
+        if qp.info and qp.info.get('productId'):
+            hub.profiles.learn(qp.info['productId'], qp.profile)
+        values = cached.get('values', {})
+        qp.state.restore(values)
+        qp._published.restore(values)
+        qp.last_seen = cached.get('last_seen')
+        return qp
+
+    def as_cache(self) -> dict:
+        "What from_cache needs, JSON serializable."
+        values = {
+            s: self.getValue(s)
+            for s, cfg in self.sensors.items() if cfg.get('supported') and s != 'status'
+        }
+        info = self.info
+        # only the first data frame has the versions, keep them
+        for k in state.VERSIONS:
+            values[k] = (info.get(k) if info else None) or self.getValue(k)
+
+        return {
+            'supported': {s: cfg.get('supported', False) for s, cfg in self.sensors.items()},
+            'info':      info or None,
+            'values':    values,
+            'last_seen': self.last_seen,
+        }
+
+    def update_from_mqtt(self, data, new_records=None) -> set:
+        """Assing data to sensors. Returns the names of the sensors that changed.
 
-        self.sensors['status']['supported'] = True
+        new_records flags the history records dedup has not seen before,
+        only those go to the recent samples. None adds them all.
+        """
+        _LOGGER.debug("Processing : %s", data)
+        changed = set()
 
-    def update_from_mqtt(self, data) -> None:
-        "Assing data to sensors."
-        _LOGGER.debug(f"Processing : {data}")
+        self.last_seen = time.time()
+        cmd = data['cmd']
+        self.frame_counts[cmd] = self.frame_counts.get(cmd, 0) + 1
+        data.use_decoders(self.profile.decoders)
 
         if data['magic'] == 'CG':
             # 0x32 Configuration sending. Server -> Device
@@ -229,31 +734,113 @@ class Qingping:
 
             if data['cmd'] in ['0x35']:
                 # {'header_old': 'CG5', 'magic': 'CG', 'cmd': '0x35', 'productId': '5d 00', 'timestamp': 1640995213}
-                pass
+                self._learn_product(data)
             elif data['cmd'] in ['0x39']: #CG9
                 # 0x39 Configuration reporting. Device -> Server
-                self.info = data
+                unit = self.temperature_unit
+                self.info = {k: v for k, v in data.as_dict().items() if k != 'timestamp_human'}
+                self._learn_product(data)
+                changed.add('status')
+                if self.sensors_created and (self.temperature_unit == 'fahrenheit') != (unit == 'fahrenheit'):
+                    # the suggested unit only applies when the entity is registered
+                    _LOGGER.info(
+                        f"{self.addr} displays temperatures in {self.temperature_unit}, "
+                        "set the unit of its temperature entity in the entity settings to match"
+                    )
             elif data['cmd'] in ['0x34', '0x41']: #CG4, CGA
                 # 0x34 Event reporting. Device -> Server
                 # 0x41 ???
-                self.data = data
+                self.state.update(data)
+                state.add_sample(self.samples, self.state)
+                changed = self._diff_values()
             elif data['cmd'] in ['0x31', '0x42']: #CG1, CGB
                 # 0x31 Data uploading.  Device -> Server
                 # 0x42 ???
-                self.history_data[self.history_index] = data
-                self.history_last_index = self.history_index
-
-                if self.history_index >= self.history_max:
-                    self.history_index = 0
-                else:
-                    self.history_index = self.history_index + 1
+                columns = data.history_columns()
+                if columns is not None:
+                    self.history_uploads.append(columns.timestamp, len(columns.timestamps))
+                    state.add_history(self.samples, columns, new_records)
+                    if self.hub.history_import is not None:
+                        self.hub.history_import.add(self.addr, columns)
+                    if self.hub.history_log is not None:
+                        self.hub.history_log.add(self.addr, data.history_block())
+                changed.add('status')
             else:
                 _LOGGER.debug(f"Unknown cmd: {data}")
 
+        # after a config report is in self.info, so its upload interval is used
+        if self.hub.availability is not None:
+            self.hub.availability.seen(self)
+        if 'status' in changed:
+            self._status_attributes = None
+        return changed
+
+    def _learn_product(self, data) -> None:
+        "Devices of this product found later get the profile of this one."
+        product = data.get('productId')
+        if product is not None:
+            self.hub.profiles.learn(product, self.profile)
+
+    def _diff_values(self) -> set:
+        "Sensors whose value differs from the last data frame, by more than the deadband if there is one."
+        changed = set()
+        published = self._published
+        deadband = self.hub.deadband
+        now = None if deadband is None else deadband.clock()
+        for s, cfg in self.sensors.items():
+            if s == 'status' or not cfg.get('supported', True):
+                continue
+            v = self.getValue(s)
+            old = published.get(s)
+            if old != v:
+                if deadband is not None:
+                    if not deadband.significant(s, old, v, self._written_at.get(s), now):
+                        continue
+                    self._written_at[s] = now
+                setattr(published, s, v)
+                changed.add(s)
+
+        # status shows the latest data in its attributes
+        if changed:
+            changed.add('status')
+        return changed
+
+    def status_summary(self) -> dict:
+        "Compact status attributes, rebuilt only after the status changed."
+        if self._status_attributes is None:
+            self._status_attributes = self._build_status_summary()
+        return self._status_attributes
+
+    def _build_status_summary(self) -> dict:
+        def dt(ts):
+            return None if ts is None else dt_util.utc_from_timestamp(ts)
+
+        attr = {
+            'last_seen':        dt(self.last_seen),
+            'last_data':        dt(self.state.timestamp),
+            'last_config':      dt(self.info.get('timestamp')) if self.info else None,
+            'firmware_version': (self.info.get('firmware_version') if self.info else None) or self.firmware_version,
+            'frames':           dict(self.frame_counts),
+            'history_uploads':  [
+                {'timestamp': dt(ts), 'records': records}
+                for ts, records in self.history_uploads
+            ],
+        }
+
+        # stay under the size cap, oldest uploads go first
+        while len(json.dumps(attr, default=str)) > STATUS_ATTRIBUTES_MAX_SIZE:
+            if attr['history_uploads']:
+                attr['history_uploads'].pop(0)
+            elif attr['frames']:
+                attr['frames'] = {}
+            else:
+                break
+        return attr
+
     @property
     def ready(self) -> bool:
         "Init is done."
-        return self.data != False
+        return self.state.valid
 
     @property
     def id(self) -> str:
@@ -262,19 +849,26 @@ class Qingping:
 
     @property
     def online(self) -> bool:
-        "Online."
-        return self.hub.online
+        "Online, and reported within the availability timeout."
+        return self.hub.online and self.available
 
-    def getValue(self, s):
-        "Check if sensor present in json."
-        if self.data:
-            if s in self.data:
-                return self.data[s] # type: ignore
+    @property
+    def upload_interval(self) -> int | None:
+        "Seconds between uploads from the last config report, None before one came."
+        return self.info.get('uploadDataInterval') if self.info else None
 
-            if s in self.data['sensor']: # type: ignore
-                return self.data['sensor'][s] # type: ignore
+    @property
+    def temperature_unit(self) -> str | None:
+        "Unit the device displays temperatures in, from the last config report."
+        return self.info.get('temperatureUnit') if self.info else None
+
+    def getValue(self, s):
+        "Latest value of sensor s."
+        return self.state.get(s)
 
-        return None
+    def recent_samples(self) -> list[dict]:
+        "Recent samples from data frames and history uploads, oldest first."
+        return state.samples(self.samples)
 
     @property
     def model(self) -> str:
@@ -284,22 +878,43 @@ class Qingping:
     @property
     def firmware_version(self):
         "Firmware ver."
-        return self.getValue('firmware_version')
+        return self.state.firmware_version or (self.info.get('firmware_version') if self.info else None)
 
     @property
     def hardwareVersion(self):
         "HardwareVersion."
         return self.getValue('hardwareVersion')
 
-    def register_callback(self, callback: Callable[[], None]) -> None:
-        """Register callback, called when Roller changes state."""
-        self._callbacks.add(callback)
+    def register_callback(self, sensor_name: str, callback: Callable[[], None]) -> None:
+        """Register callback, called when sensor_name changes state."""
+        callbacks = self._callbacks.get(sensor_name, ())
+        if callback not in callbacks:
+            self._callbacks[sensor_name] = (*callbacks, callback)
 
-    def remove_callback(self, callback: Callable[[], None]) -> None:
+    def remove_callback(self, sensor_name: str, callback: Callable[[], None]) -> None:
         """Remove previously registered callback."""
-        self._callbacks.discard(callback)
+        callbacks = tuple(c for c in self._callbacks.get(sensor_name, ()) if c != callback)
+        if callbacks:
+            self._callbacks[sensor_name] = callbacks
+        else:
+            self._callbacks.pop(sensor_name, None)
 
-    async def publish_updates(self) -> None:
-        """Schedule call all registered callbacks."""
-        for callback in self._callbacks:
-            callback()
\ No newline at end of file
+    def entity_sensors(self) -> set:
+        "Sensor names with entities."
+        return set(self._callbacks)
+
+    def callback_count(self, changed) -> int:
+        "Writes async_publish(changed) would do."
+        return sum(len(self._callbacks.get(sensor_name, ())) for sensor_name in changed)
+
+    @callback
+    def async_publish(self, changed=None) -> int:
+        "Call the callbacks of the changed sensors, all when changed is None. Returns the number called."
+        if changed is None:
+            changed = list(self._callbacks)
+        n = 0
+        for sensor_name in changed:
+            for write in self._callbacks.get(sensor_name, ()):
+                write()
+                n += 1
+        return n
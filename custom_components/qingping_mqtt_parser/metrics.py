@@ -0,0 +1,147 @@
+"Hub performance metrics: stage latency histograms, throughput and error counters."
+from __future__ import annotations
+
+from bisect import bisect_left
+import time
+
+from .const import METRICS_BUCKETS_MS
+
+# stage -> what it measures
+STAGES = {
+    "receive_decode": "message received until decoded, includes the receive queue",
+    "decode_update":  "decoded until the device state is updated",
+    "update_write":   "device state updated until the entity states are written",
+}
+
+
+def frame_type(payload) -> str:
+    "cmd of a raw frame, like data['cmd'], for frames that could not be decoded."
+    try:
+        return f"0x{payload[2]:02x}"
+    except (IndexError, TypeError):
+        return "short"
+
+
+class Histogram:
+    """Latencies in milliseconds, counted in fixed buckets.
+
+    Percentiles are the upper bound of the bucket they fall in, capped at
+    the largest value seen, which the last bucket (no bound) reports.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds=METRICS_BUCKETS_MS) -> None:
+        "Init."
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count  = 0
+        self.total  = 0.0
+        self.max    = 0.0
+
+    def observe(self, ms: float) -> None:
+        "Count one latency."
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float | None:
+        "Approximate p-th percentile, None before the first value."
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return round(min(self.bounds[i], self.max) if i < len(self.bounds) else self.max, 3)
+        return round(self.max, 3)
+
+    def as_dict(self) -> dict:
+        "Summary and bucket counts."
+        buckets = {f"<={b}": n for b, n in zip(self.bounds, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count":   self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms":  self.percentile(50),
+            "p99_ms":  self.percentile(99),
+            "max_ms":  round(self.max, 3),
+            "buckets": buckets,
+        }
+
+
+class HubMetrics:
+    """Counters of one Hub.
+
+    Times come from the monotonic clock (time.perf_counter). The Hub only
+    creates this when the metrics option is on, so nothing is measured or
+    counted otherwise. messages/sec is computed by sample(), called every
+    METRICS_UPDATE_INTERVAL, so counting a message is an increment.
+    """
+
+    def __init__(self, clock=time.perf_counter) -> None:
+        "Init."
+        self.clock  = clock
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.receive_decode = self.stages["receive_decode"]
+        self.decode_update  = self.stages["decode_update"]
+        self.update_write   = self.stages["update_write"]
+
+        self.messages = 0
+        self.frames: dict[str, int] = {}                   # cmd -> frames handled
+        self.errors: dict[str, int] = {}                   # cmd -> decode or processing errors
+        self.unknown_keys: dict[str, dict[str, int]] = {}  # cmd -> TLV key -> frames carrying it
+
+        self.rate = 0.0
+        self._sampled_at = clock()
+        self._sampled_messages = 0
+
+    def frame(self, data) -> None:
+        "Count a decoded frame and the TLV keys it has no decoder for."
+        self.messages += 1
+        cmd = data['cmd']
+        self.frames[cmd] = self.frames.get(cmd, 0) + 1
+        unknown = data.unknown_keys()
+        if unknown:
+            keys = self.unknown_keys.setdefault(cmd, {})
+            for key in unknown:
+                name = f"0x{key:02x}"
+                keys[name] = keys.get(name, 0) + 1
+
+    def error(self, cmd: str) -> None:
+        "Count a frame that failed to decode or to process."
+        self.errors[cmd] = self.errors.get(cmd, 0) + 1
+
+    def sample(self) -> float:
+        "Update and return messages/sec since the previous sample."
+        now = self.clock()
+        elapsed = now - self._sampled_at
+        if elapsed > 0:
+            self.rate = (self.messages - self._sampled_messages) / elapsed
+        self._sampled_at = now
+        self._sampled_messages = self.messages
+        return self.rate
+
+    @property
+    def error_count(self) -> int:
+        "Errors of all frame types."
+        return sum(self.errors.values())
+
+    @property
+    def unknown_key_count(self) -> int:
+        "Unknown keys seen, all frame types."
+        return sum(n for keys in self.unknown_keys.values() for n in keys.values())
+
+    def stats(self) -> dict:
+        "Everything, for diagnostics."
+        return {
+            "messages":            self.messages,
+            "messages_per_second": round(self.rate, 2),
+            "frames":              dict(self.frames),
+            "errors":              dict(self.errors),
+            "unknown_keys":        {cmd: dict(keys) for cmd, keys in self.unknown_keys.items()},
+            "stages":              {stage: h.as_dict() for stage, h in self.stages.items()},
+        }
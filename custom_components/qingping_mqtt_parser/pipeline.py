@@ -0,0 +1,156 @@
+"Bounded receive -> process queue, ordered per device and parallel across devices."
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from .const import OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeviceWorkQueue:
+    """Messages are sharded by device address over one queue per worker.
+
+    A device always lands on the same shard and every shard has a single
+    worker, so messages of one device are handled in arrival order while
+    devices on other shards are handled in parallel. With a clock, items
+    are queued with clock() and the handler gets it as second argument.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[object], Awaitable],
+        maxsize: int,
+        overflow: str = OVERFLOW_DROP_OLDEST,
+        workers: int = 4,
+        clock: Callable[[], float] | None = None,
+    ) -> None:
+        "Init."
+        self._handler  = handler
+        self._clock    = clock
+        self._overflow = overflow
+        self._workers  = max(1, workers)
+        shard_size     = max(1, -(-maxsize // self._workers))
+        self._shards: list[asyncio.Queue] = [asyncio.Queue(shard_size) for _ in range(self._workers)]
+        self._tasks: list[asyncio.Task] = []
+
+        self.maxsize        = shard_size * self._workers
+        self.max_depth      = 0
+        self.received       = 0
+        self.processed      = 0
+        self.failed         = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+
+    def start(self, create_task: Callable[[Awaitable, str], asyncio.Task]) -> None:
+        "Start one worker per shard."
+        for n, shard in enumerate(self._shards):
+            self._tasks.append(create_task(self._worker(shard), f"qingping worker {n}"))
+
+    async def stop(self) -> None:
+        "Cancel workers, queued messages are dropped."
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+
+    def _shard(self, addr) -> asyncio.Queue:
+        return self._shards[hash(addr) % self._workers]
+
+    async def put(self, addr, item) -> bool:
+        "Queue item for device addr. Returns False if it was dropped."
+        shard = self._shard(addr)
+        if self._overflow == OVERFLOW_BLOCK and shard.full():
+            self.received += 1
+            await shard.put(item if self._clock is None else (item, self._clock()))
+            self._track_depth()
+            queued = True
+        else:
+            queued = self.put_nowait(addr, item)
+
+        # buffered messages are read without suspending, give workers a turn
+        await asyncio.sleep(0)
+        return queued
+
+    def put_nowait(self, addr, item) -> bool:
+        """put() for callers that can't wait.
+
+        The block policy can't be honored here, a full queue drops the newest.
+        """
+        self.received += 1
+        shard = self._shard(addr)
+
+        if shard.full():
+            if self._overflow in (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST):
+                self._dropped("newest")
+                return False
+            shard.get_nowait()
+            shard.task_done()
+            self._dropped("oldest")
+
+        shard.put_nowait(item if self._clock is None else (item, self._clock()))
+        self._track_depth()
+        return True
+
+    def _track_depth(self) -> None:
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def _dropped(self, which: str) -> None:
+        if which == "newest":
+            self.dropped_newest += 1
+            n = self.dropped_newest
+        else:
+            self.dropped_oldest += 1
+            n = self.dropped_oldest
+
+        # one line per burst instead of one per message
+        if n == 1 or n % 1000 == 0:
+            _LOGGER.warning(f"Message queue full ({self.maxsize}), dropped {n} {which} messages so far")
+
+    async def _worker(self, shard: asyncio.Queue) -> None:
+        while True:
+            item = await shard.get()
+            try:
+                if self._clock is None:
+                    await self._handler(item)
+                else:
+                    await self._handler(*item)
+                self.processed += 1
+            except Exception as e:  # noqa: BLE001
+                self.failed += 1
+                _LOGGER.error(f"Message handler error: {str(e)}")
+            finally:
+                shard.task_done()
+
+    async def join(self) -> None:
+        "Wait until everything queued so far is handled."
+        for shard in self._shards:
+            await shard.join()
+
+    @property
+    def depth(self) -> int:
+        "Messages waiting."
+        return sum(shard.qsize() for shard in self._shards)
+
+    def stats(self) -> dict:
+        "Counters for diagnostics."
+        return {
+            "depth":          self.depth,
+            "max_depth":      self.max_depth,
+            "maxsize":        self.maxsize,
+            "overflow":       self._overflow,
+            "workers":        self._workers,
+            "received":       self.received,
+            "processed":      self.processed,
+            "failed":         self.failed,
+            "dropped_oldest": self.dropped_oldest,
+            "dropped_newest": self.dropped_newest,
+        }
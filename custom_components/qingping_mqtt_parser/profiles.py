@@ -0,0 +1,168 @@
+"Product profiles: the sensors of a kind of device and the decoders for its frames, worked out once."
+from __future__ import annotations
+
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntityDescription, SensorStateClass
+from homeassistant.const import (
+    CONCENTRATION_PARTS_PER_MILLION,
+    PERCENTAGE,
+    EntityCategory,
+    UnitOfTemperature,
+)
+
+from .utils import parser
+
+
+def _measurement(key, device_class, unit, precision) -> SensorEntityDescription:
+    "Numeric sensor, the recorder keeps 5 minute and hourly statistics of it."
+    return SensorEntityDescription(
+        key                         = key,
+        device_class                = device_class,
+        state_class                 = SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement  = unit,
+        suggested_display_precision = precision,
+    )
+
+
+def _diagnostic(key) -> SensorEntityDescription:
+    return SensorEntityDescription(key=key, entity_category=EntityCategory.DIAGNOSTIC)
+
+
+# sensor name -> entity description. Devices decode temperatures in Celsius
+# whatever their display unit (temperatureUnit) is.
+SENSORS = {
+    'battery'             : _measurement('battery', SensorDeviceClass.BATTERY, PERCENTAGE, 0),
+    'temperature'         : _measurement('temperature', SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, 1),
+    'humidity'            : _measurement('humidity', SensorDeviceClass.HUMIDITY, PERCENTAGE, 1),
+    'co2_ppm'             : _measurement('co2_ppm', SensorDeviceClass.CO2, CONCENTRATION_PARTS_PER_MILLION, 0),
+    'co2IsBeingCalibrated': _diagnostic('co2IsBeingCalibrated'),
+    'isPluggedInToPower'  : _diagnostic('isPluggedInToPower'),
+    'status'              : _diagnostic('status'),
+}
+
+# sensor name -> TLV keys of a data frame that carry it, the same lookup as
+# Qingping.getValue: the field itself, then the realtime record of 0x14
+SENSOR_KEYS = {
+    'battery'             : (0x64, 0x14),
+    'temperature'         : (0x14,),
+    'humidity'            : (0x14,),
+    'co2_ppm'             : (0x14,),
+    'co2IsBeingCalibrated': (0x4a,),
+    'isPluggedInToPower'  : (0x2c,),
+}
+
+# frames Qingping takes sensor values from, CG4 and CGA
+DATA_CMDS = frozenset({'0x34', '0x41'})
+
+
+def supported_sensors(keys: frozenset, v2_format=None) -> frozenset:
+    "Sensors with a value in a data frame with TLV keys, 0x85 carrying v2_format."
+    supported = {s for s, sources in SENSOR_KEYS.items() if not keys.isdisjoint(sources)}
+    if 0x85 in keys and v2_format in parser.V2_FORMATS:
+        supported.update(name for name, _ in parser.V2_FORMATS[v2_format][1])
+    return frozenset(supported)
+
+
+class ProductProfile:
+    """Sensors and decoders of one kind of device, shared by its devices.
+
+    sensors is the sensor table of Qingping, {name: {'supported': bool}}
+    for every sensor in SENSORS.
+    decoders is parser.KEY_DECODERS with the TLV keys the product sends
+    without a decoder (ignored) mapped to parser.skip_key, so its frames
+    skip the unk_key_XX hex dump for them. Both are read only.
+    """
+
+    __slots__ = ("keys", "v2_format", "ignored", "sensors", "decoders", "products", "devices")
+
+    def __init__(self, supported: frozenset, keys: frozenset = frozenset(), v2_format=None) -> None:
+        "Init."
+        self.keys      = keys
+        self.v2_format = v2_format
+        self.ignored   = frozenset(key for key in keys if key not in parser.KEY_DECODERS)
+        self.sensors   = {s: {'supported': s == 'status' or s in supported} for s in SENSORS}
+        if self.ignored:
+            self.decoders = {**parser.KEY_DECODERS, **dict.fromkeys(self.ignored, parser.skip_key)}
+        else:
+            self.decoders = parser.KEY_DECODERS
+        self.products: set[str] = set()
+        self.devices = 0
+
+    @property
+    def has_data(self) -> bool:
+        "Some sensor besides status is supported."
+        return any(cfg['supported'] for s, cfg in self.sensors.items() if s != 'status')
+
+    def as_dict(self) -> dict:
+        "For diagnostics."
+        return {
+            'products':  sorted(self.products),
+            'v2_format': self.v2_format,
+            'keys':      [f"0x{key:02x}" for key in sorted(self.keys)],
+            'ignored':   [f"0x{key:02x}" for key in sorted(self.ignored)],
+            'sensors':   [s for s, cfg in self.sensors.items() if cfg['supported']],
+            'devices':   self.devices,
+        }
+
+
+class ProfileRegistry:
+    """Product profiles of a hub, each compiled once and reused by new devices.
+
+    A device gets the profile of its productId (key 0x38) if a device of
+    that product has reported one before, the profile of the layout of its
+    first data frame (v2 format byte and TLV keys) otherwise. Devices are
+    created from their first frame with a firmware version: a config
+    report of a known product now gets the sensors of that product, an
+    unknown one the status sensor only, as before.
+    """
+
+    def __init__(self) -> None:
+        "Init."
+        self._products: dict[str, ProductProfile] = {}   # productId -> profile
+        self._layouts: dict[tuple, ProductProfile] = {}  # (v2 format, TLV keys) -> profile
+        self._restored: dict[frozenset, ProductProfile] = {}  # supported sensors -> profile, cached devices
+        self.status_only = ProductProfile(frozenset())
+
+        self.lookups  = 0
+        self.compiled = 0
+
+    def lookup(self, frame) -> ProductProfile:
+        "Profile of a new device whose first frame is frame."
+        self.lookups += 1
+        profile = self._products.get(frame.get('productId'))
+        if profile is None:
+            if frame['cmd'] in DATA_CMDS:
+                layout = (frame.v2_format(), frame.tlv_keys())
+                profile = self._layouts.get(layout)
+                if profile is None:
+                    self.compiled += 1
+                    profile = self._layouts[layout] = ProductProfile(supported_sensors(layout[1], layout[0]), layout[1], layout[0])
+            else:
+                profile = self.status_only
+        profile.devices += 1
+        return profile
+
+    def restored(self, supported: dict) -> ProductProfile:
+        "Profile of a device restored from the cache, by its {sensor: supported}."
+        names = frozenset(s for s, on in supported.items() if on and s in SENSORS)
+        profile = self._restored.get(names)
+        if profile is None:
+            self.compiled += 1
+            profile = self._restored[names] = ProductProfile(names)
+        profile.devices += 1
+        return profile
+
+    def learn(self, product: str, profile: ProductProfile) -> None:
+        "New devices of product get profile, unless the product has one already."
+        if product in self._products or not profile.has_data:
+            return
+        self._products[product] = profile
+        profile.products.add(product)
+
+    def stats(self) -> dict:
+        "Counters and profiles for diagnostics."
+        profiles = {id(p): p for p in (*self._layouts.values(), *self._restored.values(), self.status_only)}
+        return {
+            'lookups':  self.lookups,
+            'compiled': self.compiled,
+            'profiles': [p.as_dict() for p in profiles.values() if p.devices or p.products],
+        }
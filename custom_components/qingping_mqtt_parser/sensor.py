@@ -2,48 +2,71 @@
 
 from typing import Any
 
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
 from homeassistant.const import EntityCategory, UnitOfTemperature
-from homeassistant.helpers.entity import Entity
 
-from .const import DOMAIN
-from .hub import Qingping
+from .const import DOMAIN, STATUS_ATTRIBUTES_FULL
+from .hub import Hub, Qingping
+from .metrics import STAGES
+from .profiles import SENSORS
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up My integration from a config entry."""
     hub = config_entry.runtime_data
 
-    def _check_device() -> None:
+    def _add_devices(devices) -> None:
         new_devices = []
-        for qp in hub.devices.values():
+        for qp in devices:
             if not qp.sensors_created:
                 for s in qp.sensors:
                     if qp.sensors[s]['supported']:
                         new_devices.append(SensorBase(qp, s))
                 qp.sensors_created = True
 
-            if new_devices:
-                async_add_entities(new_devices)
-
-    _check_device()
-
-    # Add Lisener only once
-    if len(hub.devices)==1:
-        hub.async_add_listener(_check_device)
-
-class SensorBase(Entity):
+        # one call per batch of devices
+        if new_devices:
+            async_add_entities(new_devices)
+
+    _add_devices(list(hub.devices.values()))
+
+    if hub.metrics is not None:
+        async_add_entities([HubMetricSensor(hub, key) for key in HUB_METRICS])
+
+    # Called once per entry setup, devices found later come through the
+    # listener, only the new ones
+    hub.async_add_listener(_add_devices)
+
+# key -> (name, unit, state class, state(metrics), attributes(metrics))
+HUB_METRICS = {
+    'messages_per_second': ('messages/s', 'msg/s', SensorStateClass.MEASUREMENT, lambda m: round(m.rate, 2),
+                            lambda m: {'messages': m.messages, 'frames': dict(m.frames)}),
+    'errors':              ('errors', None, SensorStateClass.TOTAL_INCREASING, lambda m: m.error_count,
+                            lambda m: dict(m.errors)),
+    'unknown_keys':        ('unknown keys', None, SensorStateClass.TOTAL_INCREASING, lambda m: m.unknown_key_count,
+                            lambda m: {cmd: dict(keys) for cmd, keys in m.unknown_keys.items()}),
+    **{
+        f'{stage}_p99': (f'{stage.replace("_", " to ")} p99', 'ms', SensorStateClass.MEASUREMENT,
+                         lambda m, stage=stage: m.stages[stage].percentile(99),
+                         lambda m, stage=stage: {k: v for k, v in m.stages[stage].as_dict().items() if k != 'buckets'})
+        for stage in STAGES
+    },
+}
+
+class SensorBase(SensorEntity):
     'Descr.'
     should_poll  = False
 
+    # full attributes (status_attributes: full) are too big for the recorder
+    _unrecorded_attributes = frozenset({'info', 'data', 'history'})
+
     def __init__(self, qp_device: Qingping, sensor_name):
         """Initialize the sensor."""
-        device_class            = qp_device.sensors[sensor_name].get('dc', None)
-        self.sensor_diagnostic  = qp_device.sensors[sensor_name].get('diagnostic', False)
+        self.entity_description = SENSORS[sensor_name]
         self._qp_device         = qp_device
         self.sensor_name        = sensor_name
 
-        self._attr_device_class = device_class
-
+        device_class = self.entity_description.device_class
         name_postfix = sensor_name if device_class is None else device_class
 
         self._attr_unique_id    = f"{qp_device.id}_{name_postfix}"
@@ -54,16 +77,16 @@ class SensorBase(Entity):
         if sensor_name=='status':
             self._attr_name = f"{qp_device.name} Status"
 
-    # never called
-    # @property
-    # def native_unit_of_measurement(self):
-    #    if self.device_class==SensorDeviceClass.TEMPERATURE:
-    #        if self._qp_device.info:
-    #            if 'temperatureUnit' in self._qp_device.info:
-    #                if self._qp_device.info['temperatureUnit']=='celsius':
-    #                    return UnitOfTemperature.CELSIUS
-    #                else:
-    #                    return UnitOfTemperature.FAHRENHEIT
+    @property
+    def suggested_unit_of_measurement(self) -> str | None:
+        """Values are Celsius, a device set to show Fahrenheit gets its entity shown in Fahrenheit.
+
+        HA reads this once, when the entity is registered. A config report
+        that comes later does not change the unit, see Qingping.update_from_mqtt.
+        """
+        if self.sensor_name == 'temperature' and self._qp_device.temperature_unit == 'fahrenheit':
+            return UnitOfTemperature.FAHRENHEIT
+        return None
 
     @property
     def device_info(self):
@@ -80,23 +103,15 @@ class SensorBase(Entity):
     async def async_added_to_hass(self):
         """Run when this Entity has been added to HA."""
         # Sensors should also register callbacks to HA when their state changes
-        self._qp_device.register_callback(self.async_write_ha_state)
+        self._qp_device.register_callback(self.sensor_name, self.async_write_ha_state)
 
     async def async_will_remove_from_hass(self):
         """Entity being removed from hass."""
         # The opposite of async_added_to_hass. Remove any registered call backs here.
-        self._qp_device.remove_callback(self.async_write_ha_state)
+        self._qp_device.remove_callback(self.sensor_name, self.async_write_ha_state)
 
     @property
-    def entity_category(self):
-        '''Category.'''
-        if self.sensor_diagnostic:
-            return EntityCategory.DIAGNOSTIC
-        else:
-            return None
-
-    @property
-    def state(self):
+    def native_value(self):
         'State.'
         if self.sensor_name=='status':
              return 'data in attributes'
@@ -109,14 +124,53 @@ class SensorBase(Entity):
         if self.sensor_name != 'status':
             return None
 
-        Attr = {
-            'info': self._qp_device.info,
-            'data': self._qp_device.data,
-            'history': {}
+        if self._qp_device.hub.status_attributes != STATUS_ATTRIBUTES_FULL:
+            # config report and samples are in the diagnostics download
+            return self._qp_device.status_summary()
+
+        return {
+            'info':    self._qp_device.info,
+            'data':    self._qp_device.state.as_dict(),
+            'history': self._qp_device.recent_samples(),
         }
 
-        Attr['history']['last_index'] = self._qp_device.history_last_index
-        for k, v in self._qp_device.history_data.items():
-            Attr['history'][k]=v
+class HubMetricSensor(SensorEntity):
+    "Hub performance metric, updated every METRICS_UPDATE_INTERVAL."
+    should_poll     = False
+    entity_category = EntityCategory.DIAGNOSTIC
+
+    _unrecorded_attributes = frozenset({'frames', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms'})
+
+    def __init__(self, hub: Hub, key):
+        """Initialize the sensor."""
+        name, unit, state_class, self._state, self._attributes = HUB_METRICS[key]
+        self._hub = hub
+
+        entry = hub.config_entry
+        self._attr_unique_id = f"{entry.entry_id}_{key}"
+        self._attr_name      = f"Qingping hub {entry.title} {name}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
 
-        return Attr
\ No newline at end of file
+    @property
+    def device_info(self):
+        """Return information to link this entity with the hub device."""
+        return {"identifiers": {(self._hub.config_entry.entry_id, DOMAIN)}}
+
+    async def async_added_to_hass(self):
+        """Run when this Entity has been added to HA."""
+        self._hub.register_metrics_callback(self.async_write_ha_state)
+
+    async def async_will_remove_from_hass(self):
+        """Entity being removed from hass."""
+        self._hub.remove_metrics_callback(self.async_write_ha_state)
+
+    @property
+    def native_value(self):
+        'State.'
+        return self._state(self._hub.metrics)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        "Breakdown of the state."
+        return self._attributes(self._hub.metrics)
@@ -0,0 +1,114 @@
+"Services: raw payload capture, device configuration, history log queries."
+from __future__ import annotations
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    CAPTURE_MAX_SIZE,
+    DOMAIN,
+    SERVICE_CONFIGURE,
+    SERVICE_GET_HISTORY,
+    SERVICE_START_CAPTURE,
+    SERVICE_STOP_CAPTURE,
+)
+from .hub import parse_device_filter
+
+START_CAPTURE_SCHEMA = vol.Schema({
+    vol.Optional("devices", default=[]): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional("max_size", default=CAPTURE_MAX_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+})
+
+# service field -> encoder field name
+CONFIGURE_FIELDS = {
+    "upload_interval":    "uploadDataInterval",
+    "record_interval":    "recordDataInterval",
+    "co2_interval":       "co2MeasurementInterval",
+    "temperature_offset": "temperatureOffset",
+    "humidity_offset":    "humidityOffset",
+    "co2_offset":         "co2Offset",
+}
+
+CONFIGURE_SCHEMA = vol.Schema({
+    vol.Optional("devices", default=[]): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional("upload_interval"):    vol.All(vol.Coerce(int), vol.Range(min=60, max=86400)),
+    vol.Optional("record_interval"):    vol.All(vol.Coerce(int), vol.Range(min=10, max=65535)),
+    vol.Optional("co2_interval"):       vol.All(vol.Coerce(int), vol.Range(min=60, max=86400)),
+    vol.Optional("temperature_offset"): vol.All(vol.Coerce(float), vol.Range(min=-10, max=10)),
+    vol.Optional("humidity_offset"):    vol.All(vol.Coerce(float), vol.Range(min=-20, max=20)),
+    vol.Optional("co2_offset"):         vol.All(vol.Coerce(int), vol.Range(min=-1000, max=1000)),
+})
+
+GET_HISTORY_SCHEMA = vol.Schema({
+    vol.Required("device"): cv.string,
+    vol.Required("start"):  cv.datetime,
+    vol.Optional("end"):    cv.datetime,
+})
+
+
+def _hubs(hass: HomeAssistant):
+    return [entry.runtime_data for entry in hass.config_entries.async_loaded_entries(DOMAIN)]
+
+
+async def async_start_capture(call: ServiceCall) -> None:
+    "Every entry records the frames of its devices, or of the listed ones."
+    for hub in _hubs(call.hass):
+        await hub.async_start_capture(call.data["devices"], call.data["max_size"])
+
+
+async def async_stop_capture(call: ServiceCall) -> None:
+    "Stop recording on every entry."
+    for hub in _hubs(call.hass):
+        await hub.async_stop_capture()
+
+
+async def async_configure(call: ServiceCall) -> None:
+    "Send the given settings to the listed devices, all known devices when none are listed."
+    values = {name: call.data[field] for field, name in CONFIGURE_FIELDS.items() if field in call.data}
+    if not values:
+        raise ServiceValidationError("Nothing to configure")
+
+    wanted = parse_device_filter(",".join(call.data["devices"]))
+    hubs = _hubs(call.hass)
+    known = {addr.upper() for hub in hubs for addr in hub.devices}
+    if unknown := wanted - known:
+        raise ServiceValidationError(f"Unknown devices: {', '.join(sorted(unknown))}")
+
+    for hub in hubs:
+        addrs = [addr for addr in hub.devices if not wanted or addr.upper() in wanted]
+        if addrs:
+            hub.async_configure(addrs, values)
+
+
+async def async_get_history(call: ServiceCall) -> ServiceResponse:
+    "Logged samples of one device between start and end."
+    addr = call.data["device"].strip().upper()
+    hub = next((hub for hub in _hubs(call.hass) if any(a.upper() == addr for a in hub.devices)), None)
+    if hub is None:
+        raise ServiceValidationError(f"Unknown device: {addr}")
+    if hub.history_log is None:
+        raise ServiceValidationError(f"History log is off for the entry of {addr}")
+
+    start = dt_util.as_timestamp(dt_util.as_utc(call.data["start"]))
+    end = dt_util.as_timestamp(dt_util.as_utc(call.data["end"])) if "end" in call.data else dt_util.utcnow().timestamp()
+    if end < start:
+        raise ServiceValidationError("end is before start")
+
+    samples, truncated = await hub.async_get_history(addr, int(start), int(end))
+    for sample in samples:
+        sample["timestamp"] = dt_util.utc_from_timestamp(sample["timestamp"]).isoformat()
+    return {"device": addr, "samples": samples, "truncated": truncated}
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    "Register the services, once for all entries."
+    hass.services.async_register(DOMAIN, SERVICE_START_CAPTURE, async_start_capture, schema=START_CAPTURE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_CAPTURE, async_stop_capture)
+    hass.services.async_register(DOMAIN, SERVICE_CONFIGURE, async_configure, schema=CONFIGURE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_GET_HISTORY, async_get_history, schema=GET_HISTORY_SCHEMA, supports_response=SupportsResponse.ONLY,
+    )
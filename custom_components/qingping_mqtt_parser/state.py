@@ -0,0 +1,170 @@
+"Compact per-device state: latest values in slots, recent samples in a fixed array ring."
+from __future__ import annotations
+
+from array import array
+from itertools import chain, compress
+import math
+
+from .utils import history
+
+# sensor values of a data frame, Qingping.getValue names
+SENSOR_VALUES = ("battery", "temperature", "humidity", "co2_ppm", "co2IsBeingCalibrated", "isPluggedInToPower")
+# only the first data frame after a restart has them, they are kept
+VERSIONS = ("firmware_version", "hardwareVersion")
+_VALUES = frozenset((*SENSOR_VALUES, *VERSIONS))
+
+# columns of a recent sample, missing values are NaN
+SAMPLE_FIELDS = ("timestamp", "temperature", "humidity", "co2_ppm", "battery")
+_WHOLE = frozenset(("co2_ppm", "battery"))
+
+_NAN = math.nan
+
+
+class DeviceState:
+    """Latest scalar values of a device.
+
+    A data frame replaces every sensor value, with None for those it does
+    not carry, like reading them from the last frame did. Versions are only
+    replaced by a frame that has them.
+    """
+
+    __slots__ = (*SENSOR_VALUES, *VERSIONS, "timestamp", "valid")
+
+    def __init__(self) -> None:
+        "Init."
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.valid = False   # values came from a data frame or the cache
+
+    def update(self, frame) -> None:
+        "Values of a data frame. timestamp is the frame's."
+        sensor = frame.get('sensor') or {}
+        for name in SENSOR_VALUES:
+            v = frame.get(name)
+            setattr(self, name, sensor.get(name) if v is None else v)
+        for name in VERSIONS:
+            v = frame.get(name)
+            if v is not None:
+                setattr(self, name, v)
+        self.timestamp = frame.get('timestamp')
+        self.valid = True
+
+    def restore(self, values: dict) -> None:
+        "Values cached by Qingping.as_cache."
+        for name in (*SENSOR_VALUES, *VERSIONS):
+            if name in values:
+                setattr(self, name, values[name])
+        self.valid = True
+
+    def get(self, name):
+        "Value of name, None for a name without slot."
+        return getattr(self, name, None) if name in _VALUES else None
+
+    def as_dict(self) -> dict:
+        "For diagnostics."
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SampleRing:
+    """Rows of width numbers in one preallocated array, the oldest overwritten.
+
+    The array is allocated on the first append, capacity * width items of
+    typecode.
+    """
+
+    __slots__ = ("_data", "_typecode", "_width", "capacity", "_next", "count")
+
+    def __init__(self, capacity: int, width: int, typecode: str = "d") -> None:
+        "Init."
+        self._data     = None
+        self._typecode = typecode
+        self._width    = width
+        self.capacity  = max(1, capacity)
+        self._next     = 0
+        self.count     = 0
+
+    def _allocated(self) -> array:
+        if self._data is None:
+            self._data = array(self._typecode, bytes(array(self._typecode).itemsize * self.capacity * self._width))
+        return self._data
+
+    def append(self, *row) -> None:
+        "Add a row of width numbers."
+        data = self._allocated()
+        i = self._next * self._width
+        for v in row:
+            data[i] = v
+            i += 1
+        self._next = (self._next + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, rows) -> None:
+        "Add rows of width numbers, copied in at most two slices."
+        width, capacity = self._width, self.capacity
+        flat = array(self._typecode, chain.from_iterable(rows))
+        n = len(flat) // width
+        if n > capacity:
+            flat = flat[(n - capacity) * width:]
+            n = capacity
+        if not n:
+            return
+        data = self._allocated()
+        start = self._next * width
+        first = min(n, capacity - self._next) * width
+        data[start:start + first] = flat[:first]
+        if first < len(flat):
+            data[:len(flat) - first] = flat[first:]
+        self._next = (self._next + n) % capacity
+        self.count = min(capacity, self.count + n)
+
+    def rows(self) -> list[tuple]:
+        "Rows, oldest first."
+        if not self.count:
+            return []
+        width = self._width
+        first = (self._next - self.count) % self.capacity
+        data = self._data
+        rows = []
+        for n in range(self.count):
+            start = ((first + n) % self.capacity) * width
+            rows.append(tuple(data[start:start + width]))
+        return rows
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def _number(v) -> float:
+    return _NAN if v is None else v
+
+
+def add_sample(ring: SampleRing, state: DeviceState) -> None:
+    "Sample of the values of the last data frame."
+    ring.append(
+        state.timestamp or 0, _number(state.temperature), _number(state.humidity),
+        _number(state.co2_ppm), _number(state.battery),
+    )
+
+
+def add_history(ring: SampleRing, columns, new=None) -> None:
+    """Records of a history.HistoryColumns, the newest ones if more than fit.
+
+    new flags the records to add, one per record, all when None.
+    """
+    records = history.iter_records(columns)
+    ring.extend(records if new is None else compress(records, new))
+
+
+def samples(ring: SampleRing) -> list[dict]:
+    "Recent samples by timestamp, a history record and a realtime frame of the same second merged."
+    merged = {}
+    for row in ring.rows():
+        sample = merged.setdefault(int(row[0]), {})
+        for name, v in zip(SAMPLE_FIELDS[1:], row[1:]):
+            if not math.isnan(v):
+                sample[name] = int(v) if name in _WHOLE else v
+    return [{"timestamp": ts, **merged[ts]} for ts in sorted(merged)]
@@ -0,0 +1,177 @@
+"Where qingping/+/up messages come from: an own aiomqtt client or HA's MQTT integration."
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import aiomqtt
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryNotReady
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+TOPIC = "qingping/+/up"
+
+
+class Transport:
+    """Delivers messages of TOPIC, each with .topic and a bytes .payload.
+
+    Transports that run their own receive loop await on_message, the ones
+    driven by callbacks call on_message_nowait.
+    """
+
+    name = "transport"
+
+    async def async_start(
+        self,
+        on_message: Callable[[object], Awaitable],
+        on_message_nowait: Callable[[object], object],
+    ) -> None:
+        "Subscribe and start delivering."
+        raise NotImplementedError
+
+    async def async_stop(self) -> None:
+        "Unsubscribe, nothing is delivered afterwards."
+        raise NotImplementedError
+
+    async def async_publish(self, topic: str, payload: bytes) -> None:
+        "Publish payload, raises if it can't be sent."
+        raise NotImplementedError
+
+
+class AiomqttTransport(Transport):
+    "Own connection to the broker with a reconnect loop."
+
+    name = "aiomqtt"
+
+    def __init__(self, hass: HomeAssistant, host: str, port: int, user, pwd) -> None:
+        "Init."
+        self._hass = hass
+        self._host = host
+        self._port = port
+        self._user = user
+        self._pass = pwd
+        self._on_message = None
+        self.unloading = False
+        self.client    = None
+        self.looptask  = None
+
+    async def async_start(self, on_message, on_message_nowait) -> None:
+        "Start the receive task."
+        self._on_message = on_message
+        self.looptask = self._hass.async_create_background_task(
+            self.task_on_mqtt_message(), f"{DOMAIN} mqtt {self._host}:{self._port}"
+        )
+
+    async def task_on_mqtt_message(self):
+        "Parse device sensors."
+        interval = 15  # Seconds
+        client   = aiomqtt.Client(
+                hostname = self._host,
+                port     = self._port,
+                username = self._user,
+                password = self._pass)
+
+        self.client = client
+
+        while not self.unloading:
+            #_LOGGER.debug("Start new Loop ...")
+            try:
+                async with client:
+                    _LOGGER.info(f"Connected to MQTT Server")
+
+                    await client.subscribe(TOPIC)
+
+                    _LOGGER.debug(f"Subscribed to {TOPIC}")
+
+                    async for message in client.messages:
+                        await self._on_message(message)
+            except aiomqtt.MqttError:
+                if not self.unloading:
+                    _LOGGER.error(f"Connection lost; Reconnecting in {interval} seconds ...")
+                    await asyncio.sleep(interval)
+
+        _LOGGER.debug("Loop stopped")
+
+        return True
+
+    async def async_publish(self, topic: str, payload: bytes) -> None:
+        "Publish on the receive connection, raises aiomqtt.MqttError while it is down."
+        if self.client is None:
+            raise aiomqtt.MqttError("not connected")
+        await self.client.publish(topic, payload)
+
+    async def async_stop(self) -> None:
+        "Disconnect and stop the receive task."
+        _LOGGER.debug("Start task stopping ...")
+
+        self.unloading = True
+        if self.client is not None:
+            await self.client.__aexit__(None, None, None)
+            await asyncio.sleep(5)
+        if self.looptask is None:
+            return
+        self.looptask.cancel()
+
+        try:
+            _LOGGER.debug("Waiting for task_stop")
+            await self.looptask
+            _LOGGER.debug("Stopped")
+        except asyncio.CancelledError:
+            _LOGGER.error("Task Stop Error ...")
+
+
+class HomeAssistantMqttTransport(Transport):
+    "Subscription on the connection of Home Assistant's MQTT integration."
+
+    name = "homeassistant"
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        "Init."
+        self._hass  = hass
+        self._unsub: CALLBACK_TYPE | None = None
+        self._on_message_nowait = None
+
+    @staticmethod
+    async def async_wait_ready(hass: HomeAssistant) -> None:
+        "Wait for the MQTT integration, ConfigEntryNotReady if it is not set up."
+        # imported here, the mqtt integration is only needed by this transport
+        from homeassistant.components import mqtt
+
+        if not await mqtt.async_wait_for_mqtt_client(hass):
+            raise ConfigEntryNotReady("MQTT integration is not available")
+
+    async def async_start(self, on_message, on_message_nowait) -> None:
+        "Subscribe with binary payloads."
+        from homeassistant.components import mqtt
+
+        # entries checked async_wait_ready in their setup, it can only have gone since
+        try:
+            await self.async_wait_ready(self._hass)
+        except ConfigEntryNotReady:
+            _LOGGER.error("MQTT integration is not available")
+            return
+
+        self._on_message_nowait = on_message_nowait
+        self._unsub = await mqtt.async_subscribe(self._hass, TOPIC, self._message_received, qos=0, encoding=None)
+        _LOGGER.debug(f"Subscribed to {TOPIC} through Home Assistant MQTT")
+
+    @callback
+    def _message_received(self, message) -> None:
+        self._on_message_nowait(message)
+
+    async def async_publish(self, topic: str, payload: bytes) -> None:
+        "Publish through the MQTT integration."
+        from homeassistant.components import mqtt
+
+        await mqtt.async_publish(self._hass, topic, payload, qos=0)
+
+    async def async_stop(self) -> None:
+        "Unsubscribe."
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
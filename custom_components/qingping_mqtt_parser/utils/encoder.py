@@ -0,0 +1,96 @@
+"""Server -> device frames, the reverse of parsekeys and parser.
+
+Same layout as device frames: 'CG' + cmd byte + u16 payload length + TLV
+fields (key, u16 length, value) + u16 checksum (sum of all previous bytes).
+"""
+import struct
+
+CMD_CONFIG = 0x32   # configuration sending, server -> device
+
+_U16 = struct.Struct("<H")
+_I16 = struct.Struct("<h")
+
+
+def _minutes(seconds):
+    "Seconds as whole minutes in two bytes, parser reads them back * 60."
+    minutes = round(seconds / 60)
+    if not 1 <= minutes <= 0xffff:
+        raise ValueError(f"{seconds} s is out of range (at least 60 s)")
+    return _U16.pack(minutes)
+
+
+def _seconds(seconds):
+    "Seconds in two bytes, as devices report the record interval."
+    seconds = round(seconds)
+    if not 1 <= seconds <= 0xffff:
+        raise ValueError(f"{seconds} s is out of range (1 to 65535 s)")
+    return _U16.pack(seconds)
+
+
+def _tenths(value):
+    "Signed tenths in two bytes, as parser's _i16_tenths reads them."
+    tenths = round(value * 10)
+    if not -0x8000 <= tenths <= 0x7fff:
+        raise ValueError(f"{value} is out of range (-3276.8 to 3276.7)")
+    return _I16.pack(tenths)
+
+
+def _signed(value):
+    "Signed int16, as parser's _i16 reads it."
+    value = round(value)
+    if not -0x8000 <= value <= 0x7fff:
+        raise ValueError(f"{value} is out of range (-32768 to 32767)")
+    return _I16.pack(value)
+
+
+# field name (as parser decodes it) -> (TLV key, value encoder)
+FIELD_ENCODERS = {
+    "uploadDataInterval":          (0x04, _minutes),
+    "recordDataInterval":          (0x05, _seconds),
+    "co2MeasurementInterval":      (0x3b, _minutes),
+    "co2OffsetPercentage":         (0x3f, _tenths),
+    "co2Offset":                   (0x45, _signed),
+    "temperatureOffset":           (0x46, _tenths),
+    "temperatureOffsetPercentage": (0x47, _tenths),
+    "humidityOffset":              (0x48, _tenths),
+    "humidityOffsetPercentage":    (0x49, _tenths),
+}
+
+
+def encode_field(key: int, value: bytes) -> bytes:
+    "One key/length/value field."
+    return bytes((key,)) + _U16.pack(len(value)) + value
+
+
+def checksum(data: bytes) -> bytes:
+    "u16 sum of data, appended to every frame."
+    return _U16.pack(sum(data) & 0xffff)
+
+
+def encode_frame(cmd: int, fields) -> bytes:
+    "Frame from [(key, value bytes), ...]."
+    body = b"".join(encode_field(key, value) for key, value in fields)
+    data = b"CG" + bytes((cmd,)) + _U16.pack(len(body)) + body
+    return data + checksum(data)
+
+
+def encode_config(values: dict) -> bytes:
+    """0x32 configuration frame from {field name: value}.
+
+    Names are the ones parser decodes from a 0x39 configuration report,
+    intervals in seconds, offsets in their units. Raises ValueError for
+    unknown names and values out of range.
+    """
+    fields = []
+    for name, value in values.items():
+        try:
+            key, encode = FIELD_ENCODERS[name]
+        except KeyError:
+            raise ValueError(f"{name} can not be configured") from None
+        try:
+            fields.append((key, encode(value)))
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+    if not fields:
+        raise ValueError("nothing to configure")
+    return encode_frame(CMD_CONFIG, fields)
@@ -0,0 +1,214 @@
+"Lazy, dict compatible view over a raw Qingping frame."
+from collections.abc import Mapping
+
+from . import history, parsekeys, parser
+
+_MISSING = parser.MISSING
+
+# field name -> (key, value decoder) for fields only one TLV key can write,
+# field name -> {key: value decoder} for the others.
+_SINGLE = {name: d[0] for name, d in parser.FIELD_DECODERS.items() if len(d) == 1}
+_MULTI  = {name: dict(d) for name, d in parser.FIELD_DECODERS.items() if len(d) > 1}
+_DECODABLE = frozenset(parser.FIELD_DECODERS) | {f"unk_key_{key:02x}" for key in range(256)}
+_KNOWN_KEYS = frozenset(parser.KEY_DECODERS)
+
+# fields of the 0x03 history block, the hub reads history_columns() instead
+HISTORY_FIELDS = tuple(name for name, d in parser.FIELD_DECODERS.items() if d[0][0] == 0x03)
+
+
+def _skip(value, exportable_data) -> None:
+    "KEY_DECODERS entry that leaves the field to be decoded on first access."
+
+
+class QingpingFrame(Mapping):
+    """Read-only mapping with the same keys and values as parser.parse_data.
+
+    TLV offsets are indexed once on creation, each field is decoded on first
+    access and cached. Iterating, len() or as_dict() decode everything, with
+    parser.KEY_DECODERS or the decoders set by use_decoders. history_columns()
+    is decoded once as well.
+    """
+
+    __slots__ = ("payload", "_offsets", "_values", "_full", "_omitted", "_decoders", "_columns")
+
+    def __init__(self, payload: bytes) -> None:
+        "Index frame."
+        self.payload   = payload
+        self._offsets  = parsekeys.index_keys(payload)
+        self._values   = parser.parse_header(payload)
+        self._full     = None
+        self._omitted  = None
+        self._decoders = parser.KEY_DECODERS
+        self._columns  = _MISSING
+
+    @classmethod
+    def from_decoded(cls, payload: bytes, decoded: dict, omitted=(), columns=_MISSING) -> "QingpingFrame":
+        """Frame for payload whose parse_data result was computed elsewhere.
+
+        Fields in omitted were left out of decoded, they are decoded from
+        payload on first access. columns is the history_columns() result if
+        that was computed too.
+        """
+        frame = cls.__new__(cls)
+        frame.payload   = payload
+        frame._offsets  = parsekeys.index_keys(payload)
+        frame._values   = decoded
+        frame._decoders = parser.KEY_DECODERS
+        frame._columns  = columns
+        if omitted:
+            frame._full    = None
+            frame._omitted = tuple(omitted)
+        else:
+            frame._full    = decoded
+            frame._omitted = None
+        return frame
+
+    def _value(self, key):
+        "Raw value of TLV key."
+        payload = self.payload
+        start = self._offsets[key] + 3
+        return memoryview(payload)[start:start + (payload[start - 2] | (payload[start - 1] << 8))]
+
+    def _resolve(self, name):
+        "Decode and cache one field. Returns MISSING if the frame has no such field."
+        value = _MISSING
+        single = _SINGLE.get(name)
+        if single is not None:
+            key, fn = single
+            if key in self._offsets:
+                value = fn(self._value(key))
+        elif name in _MULTI:
+            # several keys write this field, like in parse_data the last one
+            # in frame order wins
+            decoders = _MULTI[name]
+            for key in reversed(self._offsets):
+                fn = decoders.get(key)
+                if fn is not None:
+                    value = fn(self._value(key))
+                    if value is not _MISSING:
+                        break
+        elif name[:8] == "unk_key_":
+            # raw hex of a key without decoder
+            try:
+                key = int(name[8:], 16)
+            except ValueError:
+                key = None
+            if key in self._offsets and key not in self._decoders and name == f"unk_key_{key:02x}":
+                value = self._value(key).hex()
+
+        if value is not _MISSING:
+            self._values[name] = value
+        return value
+
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            if self._full is None:
+                value = self._resolve(name)
+                if value is not _MISSING:
+                    return value
+            raise
+
+    def __contains__(self, name) -> bool:
+        if name in self._values:
+            return True
+        return self._full is None and name in _DECODABLE and self._resolve(name) is not _MISSING
+
+    def get(self, name, default=None):
+        "Like dict.get."
+        value = self._values.get(name, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self._full is None and name in _DECODABLE:
+            value = self._resolve(name)
+            if value is not _MISSING:
+                return value
+        return default
+
+    def history_block(self):
+        "Raw 0x03 block (header and 6 byte records), None if the frame has none."
+        if 0x03 not in self._offsets:
+            return None
+        return self._value(0x03)
+
+    def history_columns(self):
+        "0x03 block as history.HistoryColumns, None if the frame has none."
+        columns = self._columns
+        if columns is _MISSING:
+            columns = None if 0x03 not in self._offsets else history.decode_history_columns(self._value(0x03))
+            self._columns = columns
+        return columns
+
+    def decode_for_hub(self) -> dict:
+        """Decode what the hub reads: every field but HISTORY_FIELDS, and history_columns().
+
+        For decoding in a pool. The HISTORY_FIELDS of a large upload are most
+        of a full decode, they are decoded on first access. Returns the fields.
+        """
+        if self._full is None and self._omitted is None:
+            if 0x03 in self._offsets:
+                self._values  = parser.parse_data(self.payload, {**self._decoders, 0x03: _skip})
+                self._omitted = HISTORY_FIELDS
+            else:
+                self._values = self._full = parser.parse_data(self.payload, self._decoders)
+        self.history_columns()
+        return self._values
+
+    def use_decoders(self, decoders) -> None:
+        "Decode fields not decoded yet with decoders, a parser.KEY_DECODERS variant."
+        self._decoders = decoders
+
+    def tlv_keys(self) -> frozenset:
+        "TLV keys in the frame."
+        return frozenset(self._offsets)
+
+    def v2_format(self):
+        "Format byte of the 0x85 v2 data, None if the frame has none."
+        offset = self._offsets.get(0x85)
+        if offset is None or (self.payload[offset + 1] | (self.payload[offset + 2] << 8)) < 5:
+            return None
+        return self.payload[offset + 7]
+
+    def sample_span(self):
+        """(timestamp, interval, count) of the samples in the frame, None if it has none.
+
+        Read from the 0x03 header or the first 4 bytes of 0x14/0x85, nothing
+        else is decoded. Realtime frames have one sample.
+        """
+        offsets = self._offsets
+        if 0x03 in offsets:
+            return history.decode_history_header(self._value(0x03))
+        for key in (0x14, 0x85):
+            if key in offsets:
+                return parser.parse_sensor_timestamp(self._value(key)), 0, 1
+        return None
+
+    def unknown_keys(self) -> list:
+        "TLV keys without decoder, their values end up as unk_key_XX."
+        return [key for key in self._offsets if key not in _KNOWN_KEYS]
+
+    def as_dict(self) -> dict:
+        "Fully decoded frame, same as parser.parse_data."
+        if self._full is None:
+            if self._omitted is None:
+                self._values = parser.parse_data(self.payload, self._decoders)
+            else:
+                for name in self._omitted:
+                    if name not in self._values:
+                        self._resolve(name)
+            self._full = self._values
+        return self._full
+
+    def __iter__(self):
+        return iter(self.as_dict())
+
+    def __len__(self) -> int:
+        return len(self.as_dict())
+
+    def __bool__(self) -> bool:
+        # a frame always has its header fields, don't decode it to find out
+        return True
+
+    def __repr__(self) -> str:
+        return f"QingpingFrame({self.as_dict()!r})"
@@ -0,0 +1,112 @@
+"Columnar decoding of 0x03 historical data blocks."
+import struct
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # parser stays usable without numpy, just slower
+    np = None
+
+_HEADER = struct.Struct("<IH")
+_RECORD = struct.Struct("<HBHB")
+
+# 6 byte record: 24 bit packed temperature/humidity, u16 co2, u8 battery
+_RECORD_DTYPE = None if np is None else np.dtype([
+    ("th_lo", "<u2"),
+    ("th_hi", "u1"),
+    ("co2_ppm", "<u2"),
+    ("battery", "u1"),
+])
+
+
+class HistoryColumns(NamedTuple):
+    """Decoded history block, one array per value.
+
+    Arrays are numpy arrays when numpy is installed, lists otherwise.
+    """
+
+    timestamp: int
+    update_interval: int
+    timestamps: object
+    temperature: object
+    humidity: object
+    co2_ppm: object
+    battery: object
+
+
+def decode_history_header(sensor_data) -> tuple:
+    "(timestamp, update_interval, record count) of a 0x03 block, records are not decoded."
+    timestamp, update_interval = _HEADER.unpack_from(sensor_data)
+    return timestamp, update_interval, (len(sensor_data) - 6) // 6
+
+
+def decode_history_columns(sensor_data) -> HistoryColumns:
+    """Decode a whole 0x03 block at once.
+
+    6 bytes header (u32 timestamp, u16 interval) and 6 bytes each record.
+    Record n was taken at timestamp + n * update_interval.
+    """
+    timestamp, update_interval = _HEADER.unpack_from(sensor_data)
+    count = (len(sensor_data) - 6) // 6
+
+    if np is not None:
+        rec = np.frombuffer(sensor_data, dtype=_RECORD_DTYPE, count=count, offset=6)
+        combined = rec["th_lo"].astype(np.uint32) | (rec["th_hi"].astype(np.uint32) << 16)
+        return HistoryColumns(
+            timestamp,
+            update_interval,
+            timestamp + np.arange(count, dtype=np.int64) * update_interval,
+            ((combined >> 12) - 500.0) / 10.0,
+            (combined & 0x000fff) / 10,
+            rec["co2_ppm"].astype(np.int64),
+            rec["battery"].astype(np.int64),
+        )
+
+    temperature = []
+    humidity = []
+    co2_ppm = []
+    battery = []
+    for lo, hi, co2, bat in _RECORD.iter_unpack(sensor_data[6:6 + count * 6]):
+        combined = lo | (hi << 16)
+        temperature.append(((combined >> 12) - 500.0) / 10.0)
+        humidity.append((combined & 0x000fff) / 10)
+        co2_ppm.append(co2)
+        battery.append(bat)
+
+    return HistoryColumns(
+        timestamp,
+        update_interval,
+        [timestamp + x * update_interval for x in range(count)],
+        temperature,
+        humidity,
+        co2_ppm,
+        battery,
+    )
+
+
+def _tolist(column):
+    return column if isinstance(column, list) else column.tolist()
+
+
+def history_records(columns: HistoryColumns) -> dict:
+    "{index: {temperature, humidity, co2_ppm, battery}} as parse_real_sensor_data returns."
+    return {
+        x: {"temperature": t, "humidity": h, "co2_ppm": c, "battery": b}
+        for x, (t, h, c, b) in enumerate(zip(
+            _tolist(columns.temperature),
+            _tolist(columns.humidity),
+            _tolist(columns.co2_ppm),
+            _tolist(columns.battery),
+        ))
+    }
+
+
+def iter_records(columns: HistoryColumns):
+    "(timestamp, temperature, humidity, co2_ppm, battery) per record, as plain Python numbers."
+    return zip(
+        _tolist(columns.timestamps),
+        _tolist(columns.temperature),
+        _tolist(columns.humidity),
+        _tolist(columns.co2_ppm),
+        _tolist(columns.battery),
+    )
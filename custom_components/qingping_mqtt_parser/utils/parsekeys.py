@@ -1,12 +1,44 @@
-def parse_keys(bytes):
-    payload_length = bytes[3] | (bytes[4] << 8)
+def payload_end(buf):
+    """Offset after the last TLV field.
+
+    The u16 at offset 3 is the length of the fields, they start after the 5
+    byte header. A frame cut short ends where the buffer ends.
+    """
+    return min(5 + (buf[3] | (buf[4] << 8)), len(buf))
+
+
+def scan_keys(buf):
+    """Index TLV fields without copying.
+
+    Keys stay ints and values are memoryview slices into the original frame.
+    """
+    mv = memoryview(buf)
+    end = payload_end(mv)
     data = {}
-    # Start at 5 because the first 5 bytes are the protocol header and payload length
     i = 5
-    while i < payload_length - 1:
-        key = bytes[i]
-        length = bytes[i + 1] | (bytes[i + 2] << 8)
-        value = bytes[i + 3:i + 3 + length]
-        data[f"0x{key:02x}"] = value
+    while i + 3 <= end:
+        key = mv[i]
+        length = mv[i + 1] | (mv[i + 2] << 8)
+        data[key] = mv[i + 3:i + 3 + length]
         i += 3 + length
-    return data
\ No newline at end of file
+    return data
+
+
+def index_keys(buf):
+    """Offsets of each TLV field, without slicing anything.
+
+    Returns {key: offset of the key byte}, see field_value.
+    """
+    end = payload_end(buf)
+    offsets = {}
+    i = 5
+    while i + 3 <= end:
+        offsets[buf[i]] = i
+        i += 3 + (buf[i + 1] | (buf[i + 2] << 8))
+    return offsets
+
+
+def field_value(mv, offset):
+    "Value of the TLV field at offset, as a slice of memoryview mv."
+    start = offset + 3
+    return mv[start:start + (mv[offset + 1] | (mv[offset + 2] << 8))]
@@ -1,5 +1,5 @@
 import struct
-from . import parsekeys
+from . import history, parsekeys
 from datetime import datetime
 # https://qingping.feishu.cn/docx/BlYOdJVRQobV0ox6SNZcV8V6nZT
 
@@ -68,177 +68,226 @@ def parse_sensor_data(sensor_data):
 
 
 def parse_history_sensor_data(sensor_data):
+    "Dict shape of history.decode_history_columns."
+    columns = history.decode_history_columns(sensor_data)
     result = {}
-    result["timestamp"]       = parse_sensor_timestamp(sensor_data)
-    result["timestamp_human"] = datetime_human(result["timestamp"])
-    result["update_interval"] = sensor_data[4] | (sensor_data[5] << 8)
-    # 6 bytes header and 6 bytes each record
-    c = (len(sensor_data)-6) // 6
-    for x in range(c):
-        result[x] = parse_real_sensor_data(sensor_data[6 + x*6:])
+    result["timestamp"]       = columns.timestamp
+    result["timestamp_human"] = datetime_human(columns.timestamp)
+    result["update_interval"] = columns.update_interval
+    result.update(history.history_records(columns))
 
     return result
 
+# v2 (0x85) format byte -> (record layout, ((field, divisor), ...)), the
+# bytes after the u32 timestamp and the format byte
+V2_FORMATS = {
+    0x04: (struct.Struct("<hHH"), (("temperature", 10.0), ("humidity", 10.0), ("co2_ppm", None))),  # QING_SENSOR_DATA_FORMAT_TEMP_RH_CO2
+}
+
+
+def parse_v2_sensor(value):
+    "sensor dict of a v2 value, None for formats not in V2_FORMATS."
+    layout = V2_FORMATS.get(value[4])
+    if layout is None:
+        return None
+    record, fields = layout
+    return {
+        name: raw if divisor is None else raw / divisor
+        for (name, divisor), raw in zip(fields, record.unpack_from(value, 5))
+    }
+
 def parse_v2_data(value, exportable_data):
-    device = value[4]
     ts = parse_sensor_timestamp(value[0:4])
     exportable_data["timestamp"] = ts
     exportable_data["timestamp_human"] = datetime_human(ts)
-    if device == 0x04: # QING_SENSOR_DATA_FORMAT_TEMP_RH_CO2
-        temp, humidity, co2_ppm = struct.unpack("<hHH", value[5:11])
-        exportable_data["sensor"] = {
-            "temperature": temp / 10.0,
-            "humidity": humidity / 10.0,
-            "co2_ppm": co2_ppm
-        }
+    sensor = parse_v2_sensor(value)
+    if sensor is not None:
+        exportable_data["sensor"] = sensor
     else:
         exportable_data["unk_key_85"] = value.hex()
-        #print(f"Unknown v2 data format: {device}, data: {value.hex()}")
+        #print(f"Unknown v2 data format: {value[4]}, data: {value.hex()}")
     return exportable_data
 
-def parse_data(input_bytes: bytearray):
-    data = parsekeys.parse_keys(input_bytes)
-    exportable_data = {}
-    exportable_data["header_old"] = str(input_bytes)[2:5]
-    exportable_data["magic"] = str(input_bytes)[2:4]
-    exportable_data["cmd"  ] = hex(ord(str(input_bytes)[4]))
+# Fixed-layout decoders, compiled once and shared by every frame.
+_U8  = struct.Struct("<B")
+_I16 = struct.Struct("<h")
+_U32 = struct.Struct("<I")
+
+# Header bytes that repr() renders as themselves, so the old str(input_bytes)
+# slicing can be done on the bytes directly.
+_PLAIN_HEADER_BYTES = frozenset(range(0x20, 0x7f)) - {0x27, 0x5c}
+
+
+# 3 byte header -> (header_old, magic, cmd). Devices only send a handful of
+# different headers.
+_HEADERS = {}
+
+
+def parse_header(input_bytes, exportable_data=None):
+    "Fill header_old, magic and cmd."
+    head = input_bytes[:3]
+    if type(input_bytes) is bytes:
+        parsed = _HEADERS.get(head)
+        if parsed is None and len(head) == 3 and _PLAIN_HEADER_BYTES.issuperset(head):
+            header = head.decode("ascii")
+            parsed = (header, header[:2], hex(head[2]))
+            if len(_HEADERS) < 256:
+                _HEADERS[head] = parsed
+    else:
+        parsed = None
+
+    if parsed is None:
+        # escaped or bytearray input: keep the historical repr() based result
+        s = str(input_bytes)
+        parsed = (s[2:5], s[2:4], hex(ord(s[4])))
+
+    if exportable_data is None:
+        return {"header_old": parsed[0], "magic": parsed[1], "cmd": parsed[2]}
+
+    exportable_data["header_old"] = parsed[0]
+    exportable_data["magic"] = parsed[1]
+    exportable_data["cmd"  ] = parsed[2]
+    return exportable_data
+
+
+# Marker for a per-field decoder whose field is absent in this value.
+MISSING = object()
+
+
+def _u8(value):
+    return _U8.unpack_from(value)[0]
+
+
+def _uint(value):
+    "Little endian unsigned of any width, devices send 1 or 2 byte intervals."
+    return int.from_bytes(value, "little")
+
+
+def _i16(value):
+    "Offsets are signed, see encoder."
+    return _I16.unpack_from(value)[0]
 
-    for key, value in data.items():
-        # Historical Data
-        if key == "0x03":
-            hex_string = " ".join(format(byte, '02x') for byte in value)
-            exportable_data["historicalData_hex"] = hex_string
-            exportable_data["historicalData"] = parse_history_sensor_data(value)
-
-        # Interval of Data Upload
-        elif key == "0x04":
-            exportable_data["uploadDataInterval"] = value[0] * 60
-
-        # Interval of Data Recording
-        elif key == "0x05":
-            exportable_data["recordDataInterval"] = value[0]
-
-        # Undocumented Value
-        elif key == "0x06":
-            exportable_data["undocumentedValue"] = str(value)
-
-        # Unit of Temperature
-        elif key == "0x19":
-            exportable_data["temperatureUnit"] = "celsius" if value[0] == 0 else "fahrenheit"
-
-        # Firmware Version
-        elif key == "0x11":
-            exportable_data["firmware_version"] = ''.join(chr(byte) for byte in value)
-
-        # Real-time networking event -> Contains Sensor Data
-        elif key == "0x14":
-            sensor_data = parse_sensor_data(value)
-            for k, v in sensor_data.items():
-                exportable_data[k] = v
-
-        # Real-time networking event -> Contains Sensor Data
-        elif key == "0x15":
-            exportable_data["timestamp"] = parse_sensor_timestamp(value)
-
-        # Disconnect the Device -> When this is true the device will enter into low-power mode
-        elif key == "0x1d":
-            exportable_data["isGoingIntoLowPowerMode"] = bool(data[key][0])
-
-        # Hardware Version
-        elif key == "0x22":
-            exportable_data["hardwareVersion"] = ''.join(chr(b) for b in data[key])
-
-        # USB Plugin Status
-        elif key == "0x2c":
-            exportable_data["isPluggedInToPower"] = bool(data[key][0])
-
-        # Wireless Module Firmware Version
-        elif key == "0x34":
-            exportable_data["wirelessModuleFirmwareVersion"] = ''.join(chr(b) for b in data[key])
-
-        # MCU Firmware Version
-        elif key == "0x35":
-            exportable_data["mcuFirmwareVersion"] = ''.join(chr(b) for b in data[key])
-
-        # ProductID
-        elif key == "0x38":
-            if data[key]:
-                hex_string = " ".join(format(byte, '02x') for byte in value)
-                exportable_data["productId"] = hex_string
-
-        # Interval of CO2 Measurement
-        elif key == "0x3b":
-            exportable_data["co2MeasurementInterval"] = data[key][0] * 60
-
-        # Not Needed value
-        #elif key == "0x3c":
-        #    pass
-
-        # Auto Off Time
-        elif key == "0x3d":
-            exportable_data["autoOffTime"] = data[key][0] * 60
-
-        # Time setting
-        elif key == "0x3e":
-            exportable_data["timeMode"] = "24h" if data[key][0] == 0 else "12h"
-
-        # CO2 ASC Switch
-        elif key == "0x40":
-            exportable_data["co2ASC"] = bool(data[key][0])
-
-        # Offset CO2 by percentage
-        elif key == "0x3f":
-            co2_offset_percentage = data[key][0] | (data[key][1] << 8)
-            exportable_data["co2OffsetPercentage"] = co2_offset_percentage / 10
-
-        # CO2 Calibration Status
-        elif key == "0x4a":
-            exportable_data["co2IsBeingCalibrated"] = bool(data[key][0])
-
-        elif key == "0x44":
-            exportable_data["SNTPcalibrationTime"] = bool(data[key][0])
-
-        # Offset CO2 by value
-        elif key == "0x45":
-            co2_offset = data[key][0] | (data[key][1] << 8)
-            exportable_data["co2Offset"] = co2_offset
-
-        # Offset Temperature by Value
-        elif key == "0x46":
-            temperature_offset = data[key][0] | (data[key][1] << 8)
-            exportable_data["temperatureOffset"] = temperature_offset / 10
-
-        # Offset Temperature by Percentage
-        elif key == "0x47":
-            temperature_offset_percentage = data[key][0] | (data[key][1] << 8)
-            exportable_data["temperatureOffsetPercentage"] = temperature_offset_percentage / 10
-
-        # Offset Humidity by value
-        elif key == "0x48":
-            humidity_offset = data[key][0] | (data[key][1] << 8)
-            exportable_data["humidityOffset"] = humidity_offset / 10
-
-        # Offset Humidity by percent
-        elif key == "0x49":
-            humidity_offset_percentage = data[key][0] | (data[key][1] << 8)
-            exportable_data["humidityOffsetPercentage"] = humidity_offset_percentage / 10
-
-        # Battery percentage
-        elif key == "0x64":
-            x8 = data[key][0]
-            exportable_data["battery"] = x8
-
-        # Signal Strength
-        elif key == "0x65":
-            exportable_data["SignalStrength"] = int.from_bytes(value, byteorder="big", signed=False)
-
-        # V2 data.
-        elif key == "0x85":
-            exportable_data = parse_v2_data(value, exportable_data)
 
+def _i16_tenths(value):
+    return _I16.unpack_from(value)[0] / 10
+
+
+def _text(value):
+    "One char per byte."
+    return bytes(value).decode("latin-1")
+
+
+def _single(name, fn):
+    "Decoder for a key that carries one field."
+    def decode(value, exportable_data):
+        exportable_data[name] = fn(value)
+
+    return decode
+
+
+# TLV key -> (field name, value decoder) for keys that carry one field.
+SINGLE_FIELDS = {
+    0x04: ("uploadDataInterval",            lambda v: _uint(v) * 60),
+    0x05: ("recordDataInterval",            _uint),
+    0x06: ("undocumentedValue",             lambda v: str(bytes(v))),
+    0x11: ("firmware_version",              _text),
+    0x15: ("timestamp",                     lambda v: _U32.unpack_from(v)[0]),
+    0x19: ("temperatureUnit",               lambda v: "celsius" if _u8(v) == 0 else "fahrenheit"),
+    0x1d: ("isGoingIntoLowPowerMode",       lambda v: bool(_u8(v))),
+    0x22: ("hardwareVersion",               _text),
+    0x2c: ("isPluggedInToPower",            lambda v: bool(_u8(v))),
+    0x34: ("wirelessModuleFirmwareVersion", _text),
+    0x35: ("mcuFirmwareVersion",            _text),
+    0x3b: ("co2MeasurementInterval",        lambda v: _uint(v) * 60),
+    0x3d: ("autoOffTime",                   lambda v: _u8(v) * 60),
+    0x3e: ("timeMode",                      lambda v: "24h" if _u8(v) == 0 else "12h"),
+    0x3f: ("co2OffsetPercentage",           _i16_tenths),
+    0x40: ("co2ASC",                        lambda v: bool(_u8(v))),
+    0x44: ("SNTPcalibrationTime",           lambda v: bool(_u8(v))),
+    0x45: ("co2Offset",                     _i16),
+    0x46: ("temperatureOffset",             _i16_tenths),
+    0x47: ("temperatureOffsetPercentage",   _i16_tenths),
+    0x48: ("humidityOffset",                _i16_tenths),
+    0x49: ("humidityOffsetPercentage",      _i16_tenths),
+    0x4a: ("co2IsBeingCalibrated",          lambda v: bool(_u8(v))),
+    0x64: ("battery",                       _u8),
+    0x65: ("SignalStrength",                lambda v: int.from_bytes(v, byteorder="big", signed=False)),
+}
+
+
+def _decode_history(value, exportable_data):
+    exportable_data["historicalData_hex"] = value.hex(" ")
+    exportable_data["historicalData"] = parse_history_sensor_data(value)
+
+
+def _decode_realtime(value, exportable_data):
+    exportable_data.update(parse_sensor_data(value))
+
+
+def _product_id(value):
+    return value.hex(" ") if value else MISSING
+
+
+def _decode_product_id(value, exportable_data):
+    if value:
+        exportable_data["productId"] = value.hex(" ")
+
+
+# TLV key -> decoder(value, exportable_data). Keys missing here end up as unk_key_XX.
+KEY_DECODERS = {key: _single(name, fn) for key, (name, fn) in SINGLE_FIELDS.items()}
+KEY_DECODERS.update({
+    0x03: _decode_history,
+    0x14: _decode_realtime,
+    0x38: _decode_product_id,
+    0x85: parse_v2_data,
+})
+
+
+def _v2_sensor(value):
+    sensor = parse_v2_sensor(value)
+    return MISSING if sensor is None else sensor
+
+
+# field name -> ((TLV key, value decoder), ...), used to decode a single
+# field without running the whole key decoder. A value decoder returns
+# MISSING when the value does not carry that field.
+FIELD_DECODERS = {
+    "historicalData_hex": ((0x03, lambda v: v.hex(" ")),),
+    "historicalData":     ((0x03, parse_history_sensor_data),),
+    "timestamp":          ((0x14, parse_sensor_timestamp), (0x85, parse_sensor_timestamp)),
+    "timestamp_human":    ((0x14, lambda v: datetime_human(parse_sensor_timestamp(v))),
+                           (0x85, lambda v: datetime_human(parse_sensor_timestamp(v)))),
+    "sensor":             ((0x14, lambda v: parse_real_sensor_data(v[4:])), (0x85, _v2_sensor)),
+    "productId":          ((0x38, _product_id),),
+    "unk_key_85":         ((0x85, lambda v: v.hex() if v[4] not in V2_FORMATS else MISSING),),
+}
+for _key, (_name, _fn) in SINGLE_FIELDS.items():
+    FIELD_DECODERS[_name] = FIELD_DECODERS.get(_name, ()) + ((_key, _fn),)
+
+
+def skip_key(value, exportable_data):
+    "Decoder for keys that are known but carry nothing to decode."
+
+
+def parse_data(input_bytes: bytes, decoders=None):
+    """Decode a device frame.
+
+    Fields are scanned as memoryview slices and dispatched by int key through
+    decoders, KEY_DECODERS by default. Output matches the if/elif decoder
+    it replaced, benchmarks/legacy.py, except that the last fields of a frame
+    are no longer dropped, offsets are signed and intervals are read at full
+    width.
+    """
+    data = parsekeys.scan_keys(input_bytes)
+    exportable_data = parse_header(input_bytes)
+
+    if decoders is None:
+        decoders = KEY_DECODERS
+    for key, value in data.items():
+        decoder = decoders.get(key)
+        if decoder is None:
+            exportable_data[f"unk_key_{key:02x}"] = value.hex()
         else:
-            #exportable_data[f"unk_key_{int(key, 16):02x}"] = f"{value.hex()} : {str(value)}"
-            exportable_data[f"unk_key_{int(key, 16):02x}"] = value.hex()
-            #print(f"Unknown data key: {int(key, 16):02x}")
+            decoder(value, exportable_data)
 
-    return exportable_data
\ No newline at end of file
+    return exportable_data
@@ -0,0 +1,87 @@
+"""The availability timeout of a device follows the upload interval of its config report, from the first one on."""
+import asyncio
+import heapq
+from types import SimpleNamespace
+
+from benchmarks import corpus, synthetic
+from benchmarks.fakes import FakeMessage, patched_ha, setup_hub
+
+from custom_components.qingping_mqtt_parser import availability
+
+ADDR = synthetic.device_addr(0)
+TOPIC = synthetic.topic(ADDR)
+
+
+class ManualLoop:
+    "time() and call_at() of a loop whose clock only moves with advance()."
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        handle = SimpleNamespace(cancelled=False)
+        handle.cancel = lambda: setattr(handle, "cancelled", True)
+        heapq.heappush(self._timers, (when, id(handle), handle, callback))
+        return handle
+
+    def advance(self, to):
+        while self._timers and self._timers[0][0] <= to:
+            when, _, handle, callback = heapq.heappop(self._timers)
+            self.now = when
+            if not handle.cancelled:
+                callback()
+        self.now = to
+
+
+def test_shorter_interval_moves_deadline_earlier():
+    loop = ManualLoop()
+    changed = []
+    tracker = availability.AvailabilityTracker(loop, changed.append, missed=3, default_interval=3600)
+    device = SimpleNamespace(addr=ADDR, available=True, upload_interval=None)
+    tracker.seen(device)
+
+    # the first config report: 60 s uploads, unavailable 180 s after this frame
+    loop.advance(1)
+    device.upload_interval = 60
+    tracker.seen(device)
+    loop.advance(180)
+    assert device.available
+    loop.advance(182)
+    assert not device.available and changed == [device]
+
+    # the entry of the default interval is skipped when it comes up
+    loop.advance(3 * 3600 + 1)
+    assert changed == [device] and tracker.unavailable == 1
+    assert tracker.stats()["tracked"] == tracker.stats()["heap"] == 0
+
+    # back, and unavailable again after the 60 s interval
+    tracker.seen(device)
+    assert device.available
+    loop.advance(3 * 3600 + 182)
+    assert not device.available and tracker.unavailable == 2
+
+
+def test_first_config_report_sets_timeout():
+    async def run():
+        with patched_ha():
+            hass, hub = await setup_hub(1)
+            qp = hub.devices[ADDR]
+            # onboarded from a realtime frame, no config report yet
+            qp.info = False
+            tracker = hub.availability
+            # the corpus reports the default interval
+            tracker.default_interval = 60
+            await hub.parse_message(FakeMessage(TOPIC, corpus.config_report()))
+            left = tracker._deadlines[ADDR] - hass.loop.time()
+            expected = tracker.missed * qp.upload_interval
+            await hub.task_stop()
+            await hass.async_stop()
+            return left, expected, tracker.missed * tracker.default_interval
+
+    left, expected, default = asyncio.run(run())
+    assert expected != default
+    assert expected - 1 < left <= expected
@@ -0,0 +1,79 @@
+"""Duplicate frames are dropped after the known-device check, partly new uploads only add their new records."""
+import asyncio
+
+from benchmarks import corpus, synthetic
+from benchmarks.fakes import FakeMessage, patched_ha, setup_hub
+
+from custom_components.qingping_mqtt_parser import dedup, decode_mqqt_message
+
+ADDR = synthetic.device_addr(0)
+TOPIC = synthetic.topic(ADDR)
+
+
+def frame(payload):
+    return decode_mqqt_message.decode(TOPIC, payload)["data"]
+
+
+def test_realtime_keyed_by_payload():
+    index = dedup.DedupIndex()
+    assert index.check(ADDR, frame(corpus.realtime(ts=0))) == (False, None)
+    assert index.check(ADDR, frame(corpus.realtime(ts=0))) == (True, None)
+    # a clock that is not set: same timestamp, other values
+    assert index.check(ADDR, frame(corpus.realtime(ts=0, temperature=22.0))) == (False, None)
+    # same values as another frame type
+    assert index.check(ADDR, frame(corpus.realtime(cmd=0x41, ts=0))) == (False, None)
+
+
+def test_history_flags_new_records():
+    index = dedup.DedupIndex()
+    ts = corpus.TIMESTAMP
+    assert index.check(ADDR, frame(corpus.history(ts=ts, records=4))) == (False, None)
+    assert index.check(ADDR, frame(corpus.history(ts=ts + 1800, records=4))) == (False, [False, False, True, True])
+    assert index.check(ADDR, frame(corpus.history(cmd=0x42, ts=ts, records=6)))[0]
+
+
+def run(options, *payloads):
+    "Device 0 onboarded, then payloads through parse_message. Returns the hub."
+    async def go():
+        with patched_ha():
+            hass, hub = await setup_hub(1, options)
+            for payload in payloads:
+                await hub.parse_message(FakeMessage(TOPIC, payload))
+            await hub.task_stop()
+            await hass.async_stop()
+            return hub
+    return asyncio.run(go())
+
+
+def test_partly_new_upload_adds_new_records_once():
+    ts = corpus.TIMESTAMP
+    hub = run(None, corpus.history(ts=ts, records=4), corpus.history(ts=ts + 1800, records=4))
+    timestamps = [s["timestamp"] for s in hub.devices[ADDR].recent_samples() if "co2_ppm" in s]
+    history = [t for t in timestamps if t >= ts]
+    assert history == sorted(set(history)) == [ts + n * 900 for n in range(6)]
+    samples = hub.devices[ADDR].samples
+    assert len(samples) == 1 + 6
+
+
+def test_unknown_devices_do_not_reach_dedup():
+    hub = run(None, *(corpus.realtime(ts=n) for n in range(3)))
+    other = synthetic.device_addr(1)
+
+    async def go():
+        with patched_ha():
+            hass, hub = await setup_hub(1)
+            # no firmware version: not onboarded, not remembered
+            await hub.parse_message(FakeMessage(synthetic.topic(other), corpus.realtime()))
+            assert other not in hub.devices
+            assert other not in hub.dedup.duplicates and hub.dedup_stats["devices"] == 1
+            await hub.task_stop()
+            await hass.async_stop()
+    asyncio.run(go())
+    assert hub.dedup_stats["checked"] == 4
+
+
+def test_dedup_off():
+    payload = corpus.realtime(ts=corpus.TIMESTAMP + 60)
+    hub = run({"dedup": False}, payload, payload)
+    assert hub.dedup is None and hub.dedup_stats is None
+    assert hub.devices[ADDR].frame_counts["0x34"] == 3
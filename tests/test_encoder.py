@@ -0,0 +1,52 @@
+"""Configuration frames decode back to what was encoded."""
+import pytest
+
+from benchmarks import corpus
+from custom_components.qingping_mqtt_parser.utils import encoder, parser
+from custom_components.qingping_mqtt_parser.utils.frame import QingpingFrame
+
+EVERY_FIELD = {
+    "uploadDataInterval":          3600,
+    "recordDataInterval":          900,
+    "co2MeasurementInterval":      300,
+    "co2OffsetPercentage":         -2.5,
+    "co2Offset":                   -5,
+    "temperatureOffset":           -1.5,
+    "temperatureOffsetPercentage": 1.2,
+    "humidityOffset":              -3.0,
+    "humidityOffsetPercentage":    0.0,
+}
+
+
+@pytest.mark.parametrize("values", [
+    {"uploadDataInterval": 600, "recordDataInterval": 60, "co2Offset": -5, "temperatureOffset": -1.5},
+    EVERY_FIELD,
+    {"uploadDataInterval": 60 * 600, "co2Offset": 1000, "humidityOffset": 20.0},
+    {"temperatureOffset": 10.0},
+    # ends of the int16 range
+    {"temperatureOffset": -3276.8, "humidityOffset": 3276.7, "co2Offset": -32768},
+])
+def test_round_trip(values):
+    payload = encoder.encode_config(values)
+    decoded = parser.parse_data(payload)
+    assert decoded["cmd"] == hex(encoder.CMD_CONFIG)
+    assert {name: decoded[name] for name in values} == values
+    assert not [name for name in decoded if name.startswith("unk_key_")]
+
+    frame = QingpingFrame(payload)
+    assert {name: frame[name] for name in values} == values
+
+
+def test_frame_layout():
+    "Same framing as device frames."
+    fields = [(0x45, b"\xfb\xff"), (0x46, b"\xf1\xff")]
+    assert encoder.encode_frame(0x32, fields) == corpus.frame(0x32, fields)
+
+
+@pytest.mark.parametrize("values", [
+    {}, {"battery": 50}, {"uploadDataInterval": 0}, {"recordDataInterval": 70000},
+    {"temperatureOffset": 4000}, {"humidityOffsetPercentage": -3276.9}, {"co2Offset": 32768}, {"co2Offset": -40000},
+])
+def test_invalid(values):
+    with pytest.raises(ValueError, match=next(iter(values), "nothing")):
+        encoder.encode_config(values)
@@ -0,0 +1,47 @@
+"""Columnar 0x03 decoding, with numpy and without, against the per-record loop of the baseline decoder."""
+import random
+import struct
+
+import pytest
+
+from benchmarks import legacy
+from custom_components.qingping_mqtt_parser.utils import history, parser
+
+
+def random_block(rng: random.Random) -> bytes:
+    "Header, up to 300 random records, sometimes a partial record at the end."
+    header = struct.pack("<IH", rng.getrandbits(32), rng.getrandbits(16))
+    return header + rng.randbytes(6 * rng.randrange(0, 300) + rng.choice((0, 0, 0, rng.randrange(1, 6))))
+
+
+BLOCKS = [random_block(random.Random(seed)) for seed in range(300)]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    "Run with numpy, and with the fallback used when numpy is not installed."
+    if request.param == "python":
+        monkeypatch.setattr(history, "np", None)
+    elif history.np is None:
+        pytest.skip("numpy not installed")
+    return request.param
+
+
+def test_records_match_baseline_loop(backend):
+    for block in BLOCKS:
+        assert parser.parse_history_sensor_data(block) == legacy.parse_history_sensor_data(block), block[:6].hex()
+
+
+def test_columns_match_baseline_loop(backend):
+    for block in BLOCKS:
+        baseline = legacy.parse_history_sensor_data(block)
+        columns = history.decode_history_columns(block)
+        assert history.decode_history_header(block) == (baseline["timestamp"], baseline["update_interval"], len(columns.timestamps))
+        records = [
+            (baseline["timestamp"] + n * baseline["update_interval"], *baseline[n].values())
+            for n in range(len(baseline) - 3)
+        ]
+        decoded = list(history.iter_records(columns))
+        assert decoded == records
+        # plain Python numbers, the sample ring and the statistics rows take them as they are
+        assert all(type(v) in (int, float) for record in decoded for v in record)
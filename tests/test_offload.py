@@ -0,0 +1,44 @@
+"""Pool jobs hand back the fields and the history columns, so the loop decodes neither again."""
+import pickle
+
+import pytest
+
+from benchmarks import corpus
+
+from custom_components.qingping_mqtt_parser import decode_mqqt_message
+from custom_components.qingping_mqtt_parser.utils import history, parser
+from custom_components.qingping_mqtt_parser.utils.frame import QingpingFrame
+
+TOPIC = "qingping/582D34000000/up"
+PAYLOADS = [*corpus.CORPUS.values(), corpus.history(records=500)]
+
+
+def thread_job(payload):
+    return decode_mqqt_message.decode_batch([(TOPIC, payload)])[0]["data"]
+
+
+def process_job(payload):
+    # results cross the process boundary pickled
+    r = pickle.loads(pickle.dumps(decode_mqqt_message.decode_batch_compact([(TOPIC, payload)])[0]))
+    _, fields, omitted, columns = r
+    return QingpingFrame.from_decoded(payload, fields, omitted, columns)
+
+
+@pytest.mark.parametrize("job", [thread_job, process_job])
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_offloaded_frame(job, payload, monkeypatch):
+    frame = job(payload)
+    expected = QingpingFrame(payload).history_columns()
+
+    def decoded_again(data):
+        raise AssertionError("history decoded on the loop")
+
+    monkeypatch.setattr(history, "decode_history_columns", decoded_again)
+    columns = frame.history_columns()
+    if expected is None:
+        assert columns is None
+    else:
+        assert list(history.iter_records(columns)) == list(history.iter_records(expected))
+        assert "historicalData" not in frame._values
+    monkeypatch.undo()
+    assert frame.as_dict() == parser.parse_data(payload)
@@ -0,0 +1,91 @@
+"""New devices get their entities in one async_add_entities call per batch, with work that does not grow with the fleet."""
+import asyncio
+
+from benchmarks import synthetic
+from benchmarks.fakes import FakeMessage, patched_ha, platform_of, setup_hub
+
+CHUNK = 250
+
+
+async def onboard(hass, hub, messages) -> None:
+    "Messages through the shared connection and the receive queue, until their entities are added."
+    for m in messages:
+        hub.connection.dispatch_nowait(m)
+    await hub.queue.join()
+    await hass.async_block_till_done()
+
+
+def recorded_batches(hub) -> list:
+    "Devices of each call to the hub's listeners, recorded from now on."
+    batches = []
+    update = hub.async_update_listeners
+
+    def record(devices):
+        batches.append(list(devices))
+        update(devices)
+
+    hub.async_update_listeners = record
+    return batches
+
+
+def test_one_add_entities_call_per_batch():
+    async def run():
+        with patched_ha():
+            hass, hub = await setup_hub(1)
+            platform = platform_of(hass)
+            per_device = len(platform.entities)
+            calls = platform.add_calls
+            batches = recorded_batches(hub)
+
+            await onboard(hass, hub, [FakeMessage(t, p) for t, p in synthetic.onboarding(200)][1:])
+
+            assert platform.add_calls - calls == len(batches)
+            assert sorted(qp.addr for batch in batches for qp in batch) == sorted(
+                synthetic.device_addr(n) for n in range(1, 200)
+            )
+            assert len(platform.entities) == 200 * per_device
+            assert len({e.unique_id for e in platform.entities}) == len(platform.entities)
+
+            # devices found in the same loop iteration share one call
+            calls = platform.add_calls
+            more = [FakeMessage(t, p) for t, p in synthetic.onboarding(250)][200:]
+            await asyncio.gather(*(hub.parse_message(m) for m in more))
+            await hass.async_block_till_done()
+            assert platform.add_calls - calls == 1
+            assert len(batches[-1]) == 50
+            assert len(platform.entities) == 250 * per_device
+
+            await hub.task_stop()
+            await hass.async_stop()
+
+    asyncio.run(run())
+
+
+def test_onboarding_work_per_device_is_constant():
+    "Each new device is registered, announced and gets its entities once, however many came before it."
+    async def run():
+        with patched_ha():
+            hass, hub = await setup_hub(0)
+            batches = recorded_batches(hub)
+            messages = [FakeMessage(t, p) for t, p in synthetic.onboarding(5000)]
+            for n in range(0, len(messages), CHUNK):
+                await onboard(hass, hub, messages[n:n + CHUNK])
+
+            assert len(hub.devices) == 5000
+            assert hass.device_registry.calls == 5000
+            # listeners only ever get the new devices, each once
+            assert sum(len(batch) for batch in batches) == 4999
+
+            # one call for the platform setup, then one per batch, each with
+            # the entities of its own devices only
+            platform = platform_of(hass)
+            per_device = len(platform.entities) // 5000
+            assert per_device and len(platform.entities) == 5000 * per_device
+            assert len({e.unique_id for e in platform.entities}) == len(platform.entities)
+            assert platform.add_calls == len(batches) + 1
+            assert platform.added[1:] == [len(batch) * per_device for batch in batches]
+
+            await hub.task_stop()
+            await hass.async_stop()
+
+    asyncio.run(run())
@@ -0,0 +1,147 @@
+"""parser.parse_data and QingpingFrame against the if/elif decoder they replaced."""
+import random
+import struct
+from unittest import mock
+
+import pytest
+
+from benchmarks import corpus, legacy
+from benchmarks.legacy import parse_data_legacy
+from custom_components.qingping_mqtt_parser.utils import parsekeys, parser
+from custom_components.qingping_mqtt_parser.utils.frame import QingpingFrame
+
+# commands devices send, all of them printable header bytes
+COMMANDS = (0x31, 0x34, 0x35, 0x39, 0x41, 0x42)
+TEXT = (0x11, 0x22, 0x34, 0x35)
+
+# Intended differences from the baseline decoder, benchmarks/legacy.py:
+# 1. Fields are walked to the end of the TLV region, 5 + length. The
+#    baseline stopped at offset length - 1 and lost the fields after it.
+# 2. The CO2, temperature and humidity offsets are signed int16, the
+#    baseline read them unsigned. key -> (field, divisor)
+SIGNED = {
+    0x3f: ("co2OffsetPercentage", 10),
+    0x45: ("co2Offset", None),
+    0x46: ("temperatureOffset", 10),
+    0x47: ("temperatureOffsetPercentage", 10),
+    0x48: ("humidityOffset", 10),
+    0x49: ("humidityOffsetPercentage", 10),
+}
+# 3. Intervals are read at their full width, the baseline read the first
+#    byte only. key -> (field, factor)
+INTERVALS = {
+    0x04: ("uploadDataInterval", 60),
+    0x05: ("recordDataInterval", 1),
+    0x3b: ("co2MeasurementInterval", 60),
+}
+
+
+def walk_to_end(payload) -> dict:
+    "Difference 1: legacy.parse_keys, bounded by the end of the TLV region."
+    end = 5 + (payload[3] | (payload[4] << 8))
+    data = {}
+    i = 5
+    while i + 3 <= end:
+        length = payload[i + 1] | (payload[i + 2] << 8)
+        data[f"0x{payload[i]:02x}"] = payload[i + 3:i + 3 + length]
+        i += 3 + length
+    return data
+
+
+def expected(payload) -> dict:
+    "parse_data_legacy with the intended differences applied."
+    with mock.patch.object(legacy, "parse_keys", walk_to_end):
+        result = parse_data_legacy(payload)
+    for key, value in walk_to_end(payload).items():
+        key = int(key, 16)
+        if key in SIGNED:
+            name, divisor = SIGNED[key]
+            offset = struct.unpack_from("<h", value)[0]
+            result[name] = offset if divisor is None else offset / divisor
+        elif key in INTERVALS:
+            name, factor = INTERVALS[key]
+            result[name] = int.from_bytes(value, "little") * factor
+    return result
+
+
+def random_value(rng: random.Random, key: int) -> bytes:
+    "A value of the length the decoder of key expects."
+    if key == 0x03:
+        return struct.pack("<IH", rng.getrandbits(32), rng.choice((60, 900))) + rng.randbytes(6 * rng.randrange(0, 20))
+    if key == 0x14:
+        return rng.randbytes(10)
+    if key == 0x85:
+        return rng.randbytes(4) + bytes([rng.choice((0x04, 0x07))]) + rng.randbytes(6)
+    if key == 0x38:
+        return rng.choice((b"", rng.randbytes(2)))
+    if key in TEXT:
+        return bytes(rng.randrange(0x20, 0x7f) for _ in range(rng.randrange(1, 12)))
+    if key in SIGNED:
+        return rng.randbytes(2)
+    if key in INTERVALS:
+        return rng.randbytes(rng.randrange(1, 3))
+    if key == 0x15:
+        return rng.randbytes(4)
+    if key == 0x65:
+        return rng.randbytes(rng.randrange(1, 3))
+    if key in parser.KEY_DECODERS:
+        return rng.randbytes(1)
+    return rng.randbytes(rng.randrange(0, 8))
+
+
+def random_frame(rng: random.Random) -> bytes:
+    "Frame of random fields, known keys and unknown ones, in random order."
+    keys = rng.sample(range(256), rng.randrange(1, 12))
+    keys += rng.sample(sorted(parser.KEY_DECODERS), rng.randrange(0, 8))
+    fields = [(key, random_value(rng, key)) for key in dict.fromkeys(keys)]
+    return corpus.frame(rng.choice(COMMANDS), fields)
+
+
+FUZZED = [random_frame(random.Random(seed)) for seed in range(500)]
+
+
+@pytest.mark.parametrize("payload", corpus.CORPUS.values(), ids=corpus.CORPUS.keys())
+def test_corpus_matches_legacy(payload):
+    assert parser.parse_data(payload) == expected(payload)
+    assert QingpingFrame(payload).as_dict() == expected(payload)
+
+
+def test_fuzzed_frames_match_legacy():
+    for payload in FUZZED:
+        result = expected(payload)
+        assert parser.parse_data(payload) == result, payload.hex()
+        assert QingpingFrame(payload).as_dict() == result, payload.hex()
+
+
+def test_lazy_fields_match_legacy():
+    "Fields read one by one before anything else decodes the frame."
+    for payload in FUZZED:
+        frame = QingpingFrame(payload)
+        for name, value in expected(payload).items():
+            assert frame[name] == value, (payload.hex(), name)
+
+
+def test_differences_are_exercised():
+    "The fuzzed frames hit each intended difference, the rest is the baseline output."
+    dropped = signed = wide = 0
+    for payload in FUZZED:
+        baseline = parse_data_legacy(payload)
+        result = expected(payload)
+        dropped += len(result) > len(baseline)
+        signed += any(name in baseline and baseline[name] != result[name] for name, _ in SIGNED.values())
+        wide += any(name in baseline and baseline[name] != result[name] for name, _ in INTERVALS.values())
+    assert dropped > 50 and signed > 50 and wide > 50
+
+
+def test_last_field_is_decoded():
+    payload = corpus.frame(0x34, [(0x64, b"\x57"), (0x65, b"\x00\x3c")])
+    assert "SignalStrength" not in parse_data_legacy(payload)
+    assert list(parsekeys.scan_keys(payload)) == [0x64, 0x65]
+    assert parser.parse_data(payload)["SignalStrength"] == 0x3c
+    assert QingpingFrame(payload)["SignalStrength"] == 0x3c
+
+
+def test_truncated_frame():
+    "A length header past the end of the frame stops at the last whole field header."
+    payload = corpus.frame(0x34, [(0x64, b"\x57"), (0x2c, b"\x01")])[:-4]
+    assert list(parsekeys.index_keys(payload)) == [0x64]
@@ -0,0 +1,47 @@
+"""The temperature entity takes the display unit of the device when it is registered."""
+import asyncio
+import logging
+import tempfile
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+from homeassistant.helpers.entity_component import EntityComponent
+from homeassistant.util.unit_system import METRIC_SYSTEM
+
+from benchmarks import corpus, synthetic
+from benchmarks.fakes import FakeMessage, flush_writes, patched_ha, setup_hub
+
+from custom_components.qingping_mqtt_parser import sensor
+
+
+def test_unit_suggested_at_registration(caplog):
+    "A Fahrenheit device gets a Fahrenheit entity. A report after registration leaves the unit, and is logged."
+    caplog.set_level(logging.INFO)
+    reported, late = synthetic.device_addr(0), synthetic.device_addr(1)
+
+    async def run():
+        hass = HomeAssistant(tempfile.mkdtemp())
+        hass.config.units = METRIC_SYSTEM
+        await dr.async_load(hass)
+        await er.async_load(hass)
+        with patched_ha():
+            fake, hub = await setup_hub(2)
+            # both onboarded from a realtime frame, the first reports Fahrenheit before its entity is added
+            await hub.parse_message(FakeMessage(synthetic.topic(reported), corpus.config_report(fahrenheit=True)))
+            entities = [sensor.SensorBase(hub.devices[addr], 'temperature') for addr in (reported, late)]
+            for entity in entities:
+                entity._attr_device_info = None
+            await EntityComponent(logging.getLogger(__name__), "sensor", hass).async_add_entities(entities)
+
+            await hub.parse_message(FakeMessage(synthetic.topic(late), corpus.config_report(fahrenheit=True)))
+            flush_writes(hub)
+            await hass.async_block_till_done()
+            units = [hass.states.get(entity.entity_id).attributes["unit_of_measurement"] for entity in entities]
+
+            await hub.task_stop()
+            await fake.async_stop()
+        await hass.async_stop()
+        return units
+
+    assert asyncio.run(run()) == ["°F", "°C"]
+    assert f"{late} displays temperatures in fahrenheit" in caplog.text